@@ -0,0 +1,113 @@
+"""Controle adaptativo de qualidade a partir de um orçamento de latência.
+
+O usuário define um FPS alvo (ou uma latência por frame) e o controlador
+mede a latência de inferência numa janela móvel. Se a média estoura o
+orçamento, ele desce um degrau na escada de pontos de operação (pesos e
+`imgsz`); se a estimativa para o degrau de cima ainda cabe no orçamento com
+folga, ele sobe. A folga e a janela cheia obrigatória entre trocas formam a
+histerese que evita oscilação.
+"""
+import os
+from collections import deque
+from dataclasses import dataclass
+
+MODEL_ORDER = ("nano", "small", "medium", "large")
+# GFLOPs aproximados dos YOLOv10 n/s/m/l em 640px, usados só para ordenar a escada
+MODEL_GFLOPS = {"nano": 6.7, "small": 21.6, "medium": 59.1, "large": 120.3}
+IMGSZ_STEPS = (320, 416, 512)
+WINDOW = 30  # Inferências na janela móvel
+HEADROOM = 0.85  # Só sobe se a latência estimada do próximo degrau ficar abaixo de 85% do orçamento
+
+
+@dataclass(frozen=True)
+class OperatingPoint:
+    """Combinação de pesos e tamanho de entrada."""
+    weights: str
+    imgsz: int
+    cost: float
+
+    def __str__(self):
+        return f"{os.path.basename(self.weights)} @ {self.imgsz}px"
+
+
+def build_ladder(weights_dir, imgsz_steps=IMGSZ_STEPS):
+    """Pontos de operação disponíveis, do mais barato ao mais caro."""
+    ladder = []
+    for name in MODEL_ORDER:
+        path = os.path.join(weights_dir, f"{name}.pt")
+        if os.path.exists(path):
+            for imgsz in imgsz_steps:
+                ladder.append(OperatingPoint(path, imgsz, MODEL_GFLOPS[name] * (imgsz / 640) ** 2))
+    return sorted(ladder, key=lambda point: point.cost)
+
+
+class QualityController:
+    """Escolhe o ponto de operação que mantém a latência dentro do orçamento."""
+
+    def __init__(self, ladder, target_latency, window=WINDOW, headroom=HEADROOM):
+        if not ladder:
+            raise ValueError("Nenhum ponto de operação disponível (weights/*.pt ausentes)")
+        self.ladder = ladder
+        self.target_latency = target_latency
+        self.headroom = headroom
+        self.index = 0  # Começa pelo mais barato para exibir detecções o quanto antes
+        self.pending = True  # Aguardando o primeiro modelo ser carregado
+        self.switches = 0
+        self._applied = None  # Último ponto efetivamente em uso
+        self._latencies = deque(maxlen=window)
+
+    @classmethod
+    def for_fps(cls, ladder, target_fps, **kwargs):
+        return cls(ladder, 1.0 / target_fps, **kwargs)
+
+    @property
+    def current(self):
+        return self.ladder[self.index]
+
+    @property
+    def mean_latency(self):
+        return sum(self._latencies) / len(self._latencies) if self._latencies else 0.0
+
+    def record(self, seconds):
+        """Registra uma inferência; retorna o novo ponto de operação se for hora de trocar."""
+        if self.pending:
+            return None
+        self._latencies.append(seconds)
+        if len(self._latencies) < self._latencies.maxlen:
+            return None
+
+        mean = self.mean_latency
+        if mean > self.target_latency and self.index > 0:
+            self.index -= 1
+        elif self.index < len(self.ladder) - 1:
+            upper = self.ladder[self.index + 1]
+            estimate = mean * upper.cost / self.current.cost
+            if estimate >= self.target_latency * self.headroom:
+                return None
+            self.index += 1
+        else:
+            return None
+
+        self.pending = True
+        self.switches += 1
+        return self.current
+
+    def applied(self):
+        """O ponto atual já está em uso: recomeça a janela de medição."""
+        self._applied = self.current
+        self.pending = False
+        self._latencies.clear()
+
+    def failed(self, point):
+        """Os pesos de `point` não carregaram: saem da escada e o controle volta ao ponto em uso.
+
+        Retorna o ponto a carregar no lugar (se nenhum estava em uso), ou None.
+        """
+        self.ladder = [p for p in self.ladder if p.weights != point.weights]
+        if self._applied in self.ladder:
+            self.index = self.ladder.index(self._applied)
+            self.pending = False
+            self._latencies.clear()
+            return None
+        self.index = 0
+        return self.current if self.ladder else None
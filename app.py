@@ -0,0 +1,399 @@
+"""Servidor Flask-SocketIO para transmitir a detecção para o navegador.
+
+Cada fonte de vídeo tem um único laço de captura e inferência, não importa
+quantos navegadores estejam conectados. Cada frame anotado é codificado em
+JPEG no máximo uma vez por nível de qualidade, e cada cliente recebe o nível
+que consegue acompanhar: quem ainda não confirmou o frame anterior perde o
+frame atual em vez de acumular uma fila.
+
+    python app.py --source videos/exemplo.mp4 --weights weights/medium.pt
+
+Com várias fontes, `--batch` faz todas compartilharem um único modelo por
+meio do agendador em lote, e `/grid` mostra todas as fontes numa grade.
+
+No modo só detecções (`/?mode=boxes`), o cliente recebe a cada frame uma
+mensagem binária compacta com as caixas (10 bytes por detecção) e desenha
+tudo num canvas; o vídeo em si chega só como quadros-chave JPEG sem
+anotação, a poucos quadros por segundo. Enquanto nenhum cliente pede o
+vídeo anotado, o servidor também deixa de desenhar as caixas.
+"""
+import argparse
+import base64
+import os
+import struct
+import threading
+import time
+
+import cv2
+import numpy as np
+from flask import Flask, Response, render_template, request
+from flask_socketio import SocketIO, emit, join_room
+
+from backends import BACKENDS, QUANTIZED_BACKENDS
+from batch_scheduler import MAX_BATCH, MAX_WAIT, BatchScheduler
+from detection_store import open_store
+from frame_source import FrameSource, parse_source
+from metrics import StageMetrics, prometheus_text, startup
+from model_registry import registry
+from pipeline import Pipeline
+from renderer import Renderer, result_arrays
+from result_cache import result_cache
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SOURCE = os.path.join(script_dir, 'videos', 'exemplo.mp4')
+DEFAULT_WEIGHTS = os.path.join(script_dir, 'weights', 'medium.pt')
+
+# Níveis de qualidade: (escala da resolução, qualidade JPEG), do melhor ao pior
+QUALITY_LEVELS = [(1.0, 80), (0.75, 70), (0.5, 60), (0.35, 45)]
+DOWNGRADE_AFTER_DROPS = 3  # Frames perdidos seguidos antes de reduzir a qualidade
+UPGRADE_AFTER_ACKS = 60  # Frames confirmados seguidos antes de aumentar a qualidade
+ACK_TIMEOUT = 2.0  # Segundos sem confirmação antes de considerar o frame perdido
+KEYFRAME_FPS = 2.0  # Quadros-chave por segundo enviados aos clientes no modo só detecções
+MAX_KEYFRAME_FPS = 15.0
+# Cabeçalho da mensagem de detecções: id do frame (uint32), largura, altura e número de caixas (uint16)
+DETECTIONS_HEADER = struct.Struct('<IHHH')
+
+app = Flask(__name__, static_folder=os.path.join(script_dir, 'assets'))
+socketio = SocketIO(app, async_mode='threading')
+
+
+class Client:
+    """Estado de entrega de um navegador conectado."""
+
+    def __init__(self, sid, mode='video', keyframe_fps=KEYFRAME_FPS):
+        self.sid = sid
+        self.mode = mode  # 'video' (JPEG anotado) ou 'boxes' (detecções binárias + quadros-chave)
+        self.keyframe_interval = 1 / keyframe_fps
+        self.keyframe_at = None  # Instante do último quadro-chave enviado
+        self.names_sent = False
+        self.bytes_sent = 0
+        self.level = 0
+        self.in_flight = False
+        self.sent_at = 0.0
+        self.sent = 0
+        self.dropped = 0
+        self.drop_streak = 0
+        self.ack_streak = 0
+
+    def ready(self):
+        """Indica se o cliente já confirmou o último frame (ou se a confirmação expirou)."""
+        if self.in_flight and time.monotonic() - self.sent_at > ACK_TIMEOUT:
+            self.in_flight = False
+        return not self.in_flight
+
+    def on_drop(self):
+        self.dropped += 1
+        self.drop_streak += 1
+        self.ack_streak = 0
+        if self.drop_streak >= DOWNGRADE_AFTER_DROPS and self.level < len(QUALITY_LEVELS) - 1:
+            self.level += 1
+            self.drop_streak = 0
+
+    def on_ack(self):
+        self.in_flight = False
+        self.drop_streak = 0
+        self.ack_streak += 1
+        if self.ack_streak >= UPGRADE_AFTER_ACKS and self.level > 0:
+            self.level -= 1
+            self.ack_streak = 0
+
+
+class Broadcaster:
+    """Um laço de captura e inferência por fonte, com distribuição para N clientes."""
+
+    def __init__(self, source, model_path, backend='pytorch', conf=0.25, scheduler=None):
+        self.source = source
+        self.scheduler = scheduler  # Agendador em lote compartilhado entre as fontes (--batch)
+        self.room = f"source:{source}"
+        self.model_path = model_path
+        self.backend = backend
+        self.conf = conf
+        self.clients = {}
+        self.bytes_sent = {'video': 0, 'boxes': 0}  # Bytes de carga útil enviados, por modo
+        self.metrics = StageMetrics()  # Latência por estágio, exposta em /metrics
+        self.model_error = None  # Mensagem do carregamento do modelo que falhou, enviada aos clientes
+        self._lock = threading.Lock()
+        self.pipeline = None
+        self._thread = None
+        self._run_flag = True
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name=f"broadcast-{self.source}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._run_flag = False
+        if self._thread:
+            self._thread.join()
+
+    def dropped(self):
+        """Frames descartados por estágio do pipeline desta fonte."""
+        return self.pipeline.dropped() if self.pipeline else {}
+
+    def add_client(self, sid, mode='video', keyframe_fps=KEYFRAME_FPS):
+        with self._lock:
+            self.clients[sid] = Client(sid, mode, keyframe_fps)
+
+    def remove_client(self, sid):
+        with self._lock:
+            return self.clients.pop(sid, None)
+
+    def wants_annotated(self):
+        """Indica se algum cliente recebe o vídeo anotado (senão as caixas não são desenhadas)."""
+        with self._lock:
+            return any(client.mode == 'video' for client in self.clients.values())
+
+    def run(self):
+        # Arquivos reiniciam ao chegar ao fim; webcam e streams reconectam se caírem
+        source = FrameSource(self.source, loop=True, metrics=self.metrics)
+        if not source.opened:
+            print(f"Erro ao abrir a fonte de vídeo: {self.source}")
+            source.stop()
+            return
+        fps = source.fps
+
+        model = cache = None
+
+        def set_model(loaded):
+            nonlocal model, cache
+            # Vídeos já processados por este modelo são servidos do cache, sem inferência
+            cache = result_cache.open(self.source, self.model_path, loaded.names, fps, self.conf,
+                                      backend=self.backend)
+            model = loaded
+            startup.mark("modelo pronto")
+
+        def report_error(message):
+            # Sem isso o vídeo segue sem detecções e ninguém fica sabendo por quê
+            self.model_error = message
+            socketio.emit('model_error', {'error': message}, to=self.room)
+
+        # O modelo carrega em segundo plano: os clientes já recebem o vídeo sem detecções
+        registry.preload(self.model_path, callback=set_model, backend=self.backend,
+                         on_error=lambda exc: report_error(
+                             f"Falha ao carregar o modelo {self.model_path} [{self.backend}]: {exc}"))
+
+        def infer(frame):
+            if model is None:
+                return frame
+            hit = cache.lookup(frame.index, frame.image) if cache else None
+            if hit is not None:
+                frame.results = [hit]
+                return frame
+            if self.scheduler:
+                try:
+                    frame.results = self.scheduler.predict(self.room, frame.image)
+                except RuntimeError as exc:
+                    # Agendador parado ou sem modelo: o vídeo segue sem detecções, avisando os clientes uma vez
+                    if self.model_error is None:
+                        report_error(f"Detecção indisponível: {exc}")
+                    return frame
+            else:
+                frame.results = model(frame.image, conf=self.conf, verbose=False)
+            if cache:
+                cache.store(frame.index, frame.timestamp, frame.results[0])
+            return frame
+
+        renderer = Renderer()  # Anel de buffers próprio desta thread de anotação
+        store = None
+
+        def annotate(frame):
+            nonlocal store
+            if frame.results is None:
+                frame.annotated = frame.image
+                return frame
+            # Só clientes no modo só detecções: eles mesmos desenham as caixas
+            annotated = self.wants_annotated()
+            frame.annotated = renderer.render_result(frame.image, frame.results[0]) if annotated else frame.image
+            frame.count = len(frame.results[0].boxes)
+            if store is None:
+                store = open_store(self.source, self.model_path, frame.results[0].names, fps,
+                                   source=str(self.source), conf=self.conf)
+                startup.mark("primeira detecção")
+            store.append_result(frame.index, frame.timestamp, frame.results[0])
+            return frame
+
+        pipeline = self.pipeline = Pipeline(source, infer, annotate, paced=source.kind == "file",
+                                            metrics=self.metrics)
+        pipeline.start()
+        while self._run_flag and not pipeline.finished:
+            frame = pipeline.get(timeout=0.1)
+            if frame is not None:
+                startup.mark("primeiro frame")
+                with self.metrics.time("envio"):
+                    self.broadcast(frame)
+        pipeline.stop()
+        if self.scheduler:
+            self.scheduler.unregister(self.room)
+        if store:
+            store.close()
+        if cache:
+            cache.close()
+
+    def broadcast(self, frame):
+        """Envia o frame (com a contagem) a cada cliente pronto, codificando cada nível uma única vez."""
+        encoded = {}
+        keyframes = {}
+        detections = None
+        with self._lock:
+            clients = list(self.clients.values())
+        for client in clients:
+            if not client.ready():
+                # Cliente ainda não confirmou o frame anterior: descartar
+                client.on_drop()
+                continue
+            if client.mode == 'boxes':
+                if detections is None:
+                    detections = pack_detections(frame)
+                self.send_boxes(client, frame, detections, keyframes)
+                continue
+            if client.level not in encoded:
+                encoded[client.level] = encode_frame(frame.annotated, *QUALITY_LEVELS[client.level])
+            self._mark_sent(client, len(encoded[client.level]))
+            socketio.emit('video_frame', {'frame': encoded[client.level], 'id': frame.index, 'count': frame.count},
+                          to=client.sid, callback=client.on_ack)
+
+    def send_boxes(self, client, frame, detections, keyframes):
+        """Modo só detecções: caixas binárias em todo frame, JPEG cru só quando vence o quadro-chave."""
+        message = {'detections': detections, 'count': frame.count}
+        now = time.monotonic()
+        if client.keyframe_at is None or now - client.keyframe_at >= client.keyframe_interval:
+            # O mesmo quadro-chave é codificado uma única vez por nível para todos os clientes
+            if client.level not in keyframes:
+                keyframes[client.level] = encode_jpeg(frame.image, *QUALITY_LEVELS[client.level])
+            message['keyframe'] = keyframes[client.level]
+            client.keyframe_at = now
+        if not client.names_sent and frame.results is not None:
+            message['names'] = frame.results[0].names
+            client.names_sent = True
+        self._mark_sent(client, len(detections) + len(message.get('keyframe', b'')))
+        socketio.emit('frame_boxes', message, to=client.sid, callback=client.on_ack)
+
+    def _mark_sent(self, client, size):
+        client.in_flight = True
+        client.sent_at = time.monotonic()
+        client.sent += 1
+        client.bytes_sent += size
+        self.bytes_sent[client.mode] += size
+
+
+def pack_detections(frame):
+    """Mensagem binária com as detecções do frame: cabeçalho e, por caixa, xyxy (uint16), confiança e classe (uint8)."""
+    height, width = frame.image.shape[:2]
+    if frame.results is None:
+        return DETECTIONS_HEADER.pack(frame.index & 0xFFFFFFFF, width, height, 0)
+    boxes, confidences, classes = result_arrays(frame.results[0])
+    boxes = np.clip(np.rint(boxes), 0, [width, height, width, height]).astype('<u2')
+    scores = np.rint(np.clip(confidences, 0, 1) * 255).astype(np.uint8)
+    header = DETECTIONS_HEADER.pack(frame.index & 0xFFFFFFFF, width, height, len(boxes))
+    return header + boxes.tobytes() + scores.tobytes() + classes.astype(np.uint8).tobytes()
+
+
+def encode_jpeg(image, scale, quality):
+    """Redimensiona e codifica o frame em JPEG (bytes)."""
+    if scale != 1.0:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes() if ok else b''
+
+
+def encode_frame(image, scale, quality):
+    """Redimensiona e codifica o frame em JPEG base64."""
+    return base64.b64encode(encode_jpeg(image, scale, quality)).decode('ascii')
+
+
+# Fontes configuradas na inicialização, na ordem de --source; os clientes
+# escolhem entre elas pelo índice (?source=1) e nunca abrem fontes novas.
+broadcasters = []
+scheduler = None  # Agendador em lote compartilhado (--batch)
+
+
+def get_broadcaster(index):
+    """Retorna o laço de inferência da fonte pedida (a primeira, se inválida)."""
+    index = int(index) if str(index).isdigit() else 0
+    return broadcasters[index] if index < len(broadcasters) else broadcasters[0]
+
+
+@app.route('/')
+def index():
+    return render_template('index.html')
+
+
+@app.route('/grid')
+def grid():
+    return render_template('grid.html', sources=[str(b.source) for b in broadcasters])
+
+
+@app.route('/metrics')
+def metrics():
+    """Latência por estágio de cada fonte, no formato de texto do Prometheus."""
+    text = prometheus_text([({'source': index}, b.metrics) for index, b in enumerate(broadcasters)])
+    if scheduler:
+        summary = scheduler.summary()
+        text += f"aguaviva_batches_total {summary['batches']}\naguaviva_batch_mean_size {summary['mean_batch']:.3f}\n"
+        for index, b in enumerate(broadcasters):
+            stream = summary['streams'].get(b.room, {"frames": 0})
+            dropped = b.dropped().get('inferência', 0)
+            text += (f'aguaviva_stream_inferred_total{{source="{index}"}} {stream["frames"]}\n'
+                     f'aguaviva_stream_dropped_total{{source="{index}"}} {dropped}\n')
+    for index, b in enumerate(broadcasters):
+        for mode, sent in b.bytes_sent.items():
+            text += f'aguaviva_sent_bytes_total{{source="{index}",mode="{mode}"}} {sent}\n'
+    text += startup.prometheus()
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
+
+@socketio.on('connect')
+def on_connect():
+    broadcaster = get_broadcaster(request.args.get('source', 0))
+    join_room(broadcaster.room)
+    mode = 'boxes' if request.args.get('mode') == 'boxes' else 'video'
+    try:
+        keyframe_fps = min(max(float(request.args.get('keyframes', KEYFRAME_FPS)), 0.1), MAX_KEYFRAME_FPS)
+    except ValueError:
+        keyframe_fps = KEYFRAME_FPS
+    broadcaster.add_client(request.sid, mode, keyframe_fps)
+    if broadcaster.model_error:
+        emit('model_error', {'error': broadcaster.model_error})
+
+
+@socketio.on('disconnect')
+def on_disconnect():
+    for broadcaster in broadcasters:
+        client = broadcaster.remove_client(request.sid)
+        if client:
+            print(f"Cliente {client.sid} ({client.mode}) desconectado: {client.sent} frames enviados, "
+                  f"{client.dropped} descartados, {client.bytes_sent / 1e6:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor de detecção em tempo real (Flask-SocketIO).")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--source', nargs='+', default=[DEFAULT_SOURCE],
+                        help="Vídeos, índices de webcam ou URLs de stream (um laço de inferência por fonte).")
+    parser.add_argument('--weights', default=DEFAULT_WEIGHTS)
+    parser.add_argument('--backend', choices=BACKENDS + QUANTIZED_BACKENDS, default='pytorch')
+    parser.add_argument('--conf', type=float, default=0.25)
+    parser.add_argument('--batch', action='store_true',
+                        help="Todas as fontes num único modelo, com inferência em lotes dinâmicos.")
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH, help="Frames por lote (com --batch).")
+    parser.add_argument('--max-wait', type=float, default=MAX_WAIT * 1000,
+                        help="Espera máxima (ms) para completar um lote (com --batch).")
+    args = parser.parse_args()
+
+    global scheduler
+    if args.batch:
+        scheduler = BatchScheduler(args.weights, args.backend, conf=args.conf,
+                                   max_batch=args.max_batch, max_wait=args.max_wait / 1000)
+        scheduler.start()
+
+    # As fontes começam a rodar já na inicialização, sem esperar o primeiro cliente
+    for source in args.source:
+        broadcaster = Broadcaster(parse_source(source), args.weights, args.backend, args.conf, scheduler)
+        broadcaster.start()
+        broadcasters.append(broadcaster)
+    socketio.run(app, host=args.host, port=args.port, allow_unsafe_werkzeug=True)
+
+
+if __name__ == '__main__':
+    main()
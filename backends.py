@@ -0,0 +1,226 @@
+"""Backends de inferência para CPU (PyTorch, ONNX Runtime e OpenVINO).
+
+Os pesos `.pt` são exportados uma única vez para cada formato e guardados em
+`weights/exports/`, numa pasta identificada pelo hash do arquivo de pesos e
+pelas configurações de exportação. Nas interfaces, cada exportação aparece
+como uma opção a mais ao lado do `.pt`, por exemplo `medium.pt [onnx]`.
+As variantes INT8 (`onnx-int8`, `onnx-int8-dynamic`) são geradas pelo
+`quantize.py` e só aparecem depois de publicadas, isto é, depois de passarem
+pelo limite de perda de acurácia.
+
+Uso pela linha de comando:
+
+    python backends.py export --weights weights/medium.pt --backend onnx
+    python backends.py parity --weights weights/medium.pt --backend openvino
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import cv2
+import numpy as np
+
+BACKENDS = ("pytorch", "onnx", "openvino")
+QUANTIZED_BACKENDS = ("onnx-int8", "onnx-int8-dynamic")  # Publicados pelo quantize.py
+IMGSZ = 512  # imgsz usado no treino (antigo/runs/train/*/args.yaml)
+EXPORT_DIRNAME = "exports"
+QUANTIZATION_REPORT = "quantization.json"  # Relatório gravado junto da variante INT8 publicada
+
+_hash_cache = {}
+
+
+def YOLO(*args, **kwargs):
+    """`ultralytics.YOLO` importado só no primeiro uso: o torch fica fora da inicialização das interfaces."""
+    from ultralytics import YOLO as _YOLO
+    return _YOLO(*args, **kwargs)
+
+
+def file_hash(path):
+    """SHA-256 do arquivo de pesos (memorizado por caminho, tamanho e mtime)."""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    if key not in _hash_cache:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        _hash_cache[key] = digest.hexdigest()
+    return _hash_cache[key]
+
+
+def export_settings(backend, imgsz=IMGSZ):
+    """Configurações passadas ao `YOLO.export` (também fazem parte da chave do cache)."""
+    # Eixo de batch dinâmico para permitir inferência em lote no modo headless
+    return {"format": backend, "imgsz": imgsz, "dynamic": True, "half": False}
+
+
+def export_dir(weights, backend, imgsz=IMGSZ):
+    """Pasta do cache para a exportação de `weights` com estas configurações."""
+    settings = json.dumps(export_settings(backend, imgsz), sort_keys=True)
+    key = hashlib.sha256(f"{file_hash(weights)}:{settings}".encode()).hexdigest()[:16]
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    return os.path.join(os.path.dirname(os.path.abspath(weights)), EXPORT_DIRNAME, f"{stem}-{backend}-{imgsz}-{key}")
+
+
+def cached_export(weights, backend, imgsz=IMGSZ):
+    """Caminho da exportação em cache, ou None se ainda não existir (ou não tiver sido publicada)."""
+    folder = export_dir(weights, backend, imgsz)
+    if backend in QUANTIZED_BACKENDS and not os.path.exists(os.path.join(folder, QUANTIZATION_REPORT)):
+        return None
+    matches = glob.glob(os.path.join(folder, "*_openvino_model" if backend == "openvino" else "*.onnx"))
+    return matches[0] if matches else None
+
+
+def export(weights, backend, imgsz=IMGSZ):
+    """Exporta `weights` para `backend` (se necessário) e retorna o caminho da exportação."""
+    if backend not in BACKENDS[1:]:
+        raise ValueError(f"Backend de exportação desconhecido: {backend}")
+    path = cached_export(weights, backend, imgsz)
+    if path:
+        return path
+
+    folder = export_dir(weights, backend, imgsz)
+    os.makedirs(folder, exist_ok=True)
+    # Exporta uma cópia dos pesos numa pasta temporária e publica com um rename atômico:
+    # processos exportando ao mesmo tempo não disputam os mesmos arquivos
+    with tempfile.TemporaryDirectory(prefix=".export-", dir=os.path.dirname(folder)) as tmp:
+        exported = YOLO(shutil.copy2(weights, tmp)).export(**export_settings(backend, imgsz))
+        target = os.path.join(folder, os.path.basename(exported.rstrip(os.sep)))
+        try:
+            os.replace(exported, target)
+        except OSError:
+            if not os.path.exists(target):
+                raise  # Se já existe, outro processo publicou a mesma exportação antes
+    return target
+
+
+def load(weights, backend="pytorch", imgsz=IMGSZ):
+    """Carrega `weights` no backend escolhido, exportando na primeira vez."""
+    if backend == "pytorch":
+        return YOLO(weights)
+    if backend in QUANTIZED_BACKENDS:
+        path = cached_export(weights, backend, imgsz)
+        if path is None:
+            raise FileNotFoundError(f"Variante {backend} de {weights} não publicada (rode quantize.py)")
+    else:
+        path = export(weights, backend, imgsz)
+    model = YOLO(path, task="detect")
+    # A exportação tem tamanho de entrada fixo: todas as chamadas usam o mesmo imgsz
+    model.overrides["imgsz"] = imgsz
+    return model
+
+
+def model_label(filename, backend="pytorch"):
+    """Texto exibido nos seletores de modelo, ex.: `medium.pt [onnx]`."""
+    return filename if backend == "pytorch" else f"{filename} [{backend}]"
+
+
+def parse_label(label):
+    """Inverso de `model_label`: retorna (arquivo, backend)."""
+    if label.endswith("]") and " [" in label:
+        filename, backend = label[:-1].rsplit(" [", 1)
+        return filename, backend
+    return label, "pytorch"
+
+
+def model_choices(weights_files, weights_dir="weights"):
+    """Opções dos seletores: cada `.pt` seguido das suas variantes exportadas e das INT8 publicadas."""
+    choices = []
+    for filename in weights_files:
+        choices.extend(model_label(filename, backend) for backend in BACKENDS)
+        path = os.path.join(weights_dir, filename)
+        choices.extend(model_label(filename, backend) for backend in QUANTIZED_BACKENDS
+                       if os.path.exists(path) and cached_export(path, backend))
+    return choices
+
+
+def sample_images(limit=8, video="videos/exemplo.mp4", images_dir="images"):
+    """Imagens de referência: as fotos de `images/` e frames espaçados do vídeo de exemplo."""
+    samples = []
+    if os.path.isdir(images_dir):
+        for name in sorted(os.listdir(images_dir)):
+            image = cv2.imread(os.path.join(images_dir, name))
+            if image is not None:
+                samples.append(image)
+    cap = cv2.VideoCapture(video)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    for index in np.linspace(0, max(total - 1, 0), num=max(limit - len(samples), 0), dtype=int):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, int(index))
+        ret, frame = cap.read()
+        if ret:
+            samples.append(frame)
+    cap.release()
+    return samples
+
+
+def box_iou(a, b):
+    """IoU entre todos os pares de caixas xyxy de `a` (N, 4) e `b` (M, 4)."""
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(br - tl, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def parity_check(weights, backend, images=None, conf=0.25, imgsz=IMGSZ, min_iou=0.9):
+    """Compara as caixas do backend exportado com as do PyTorch.
+
+    Retorna um dicionário com a fração de caixas do PyTorch reencontradas
+    (IoU >= `min_iou` e mesma classe) e a maior diferença de confiança.
+    """
+    images = images if images is not None else sample_images()
+    reference = YOLO(weights)
+    candidate = load(weights, backend, imgsz)
+
+    matched = total = extra = 0
+    max_conf_delta = 0.0
+    for image in images:
+        ref = reference(image, conf=conf, imgsz=imgsz, verbose=False)[0].boxes.data.cpu().numpy()
+        out = candidate(image, conf=conf, imgsz=imgsz, verbose=False)[0].boxes.data.cpu().numpy()
+        total += len(ref)
+        extra += max(len(out) - len(ref), 0)
+        if not len(ref) or not len(out):
+            continue
+        iou = box_iou(ref[:, :4], out[:, :4])
+        iou[ref[:, -1][:, None] != out[:, -1][None, :]] = 0
+        best = iou.argmax(axis=1)
+        hits = iou[np.arange(len(ref)), best] >= min_iou
+        matched += int(hits.sum())
+        if hits.any():
+            max_conf_delta = max(max_conf_delta, float(np.abs(ref[hits, -2] - out[best[hits], -2]).max()))
+
+    return {
+        "weights": weights,
+        "backend": backend,
+        "images": len(images),
+        "boxes": total,
+        "matched": matched,
+        "match_rate": matched / total if total else 1.0,
+        "extra_boxes": extra,
+        "max_conf_delta": max_conf_delta,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exportação e verificação dos backends de CPU.")
+    parser.add_argument("command", choices=("export", "parity"))
+    parser.add_argument("--weights", nargs="+", default=sorted(glob.glob("weights/*.pt")))
+    parser.add_argument("--backend", choices=BACKENDS[1:], nargs="+", default=list(BACKENDS[1:]))
+    parser.add_argument("--imgsz", type=int, default=IMGSZ)
+    args = parser.parse_args()
+
+    for weights in args.weights:
+        for backend in args.backend:
+            if args.command == "export":
+                print(f"{weights} [{backend}] -> {export(weights, backend, args.imgsz)}")
+            else:
+                print(json.dumps(parity_check(weights, backend, imgsz=args.imgsz)))
+
+
+if __name__ == "__main__":
+    main()
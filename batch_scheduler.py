@@ -0,0 +1,168 @@
+"""Agendador de inferência em lote para várias câmeras num único modelo.
+
+Cada fonte continua com a sua própria thread de captura (o `Pipeline` de
+sempre), mas em vez de chamar o modelo com um frame por vez o estágio de
+inferência entrega o frame ao agendador e espera o resultado. O agendador
+junta os frames de todas as fontes num lote dinâmico, fechado quando atinge
+`max_batch` frames ou quando o primeiro frame do lote já esperou `max_wait`
+segundos, roda o modelo uma única vez e devolve cada resultado à sua fonte.
+
+Justiça entre as fontes: cada lote leva no máximo um frame por fonte, e
+quando há mais fontes esperando do que cabe no lote a vez começa pela fonte
+seguinte à que abriu o lote anterior. Como cada fonte espera o próprio
+resultado antes de mandar o próximo frame, uma câmera rápida não ocupa o
+lote das outras; os frames que ela produz enquanto espera são descartados
+pela fila de frame mais recente do pipeline e contados em `dropped()`.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from model_registry import registry
+
+MAX_BATCH = 8
+MAX_WAIT = 0.010  # Segundos que o primeiro frame do lote espera por companhia
+
+
+class StreamStats:
+    """Contadores de uma fonte no agendador."""
+
+    def __init__(self):
+        self.frames = 0
+        self.wait = 0.0  # Soma dos tempos de espera na fila do agendador
+
+    def summary(self):
+        return {"frames": self.frames, "mean_wait_ms": self.wait / self.frames * 1000 if self.frames else 0.0}
+
+
+class BatchScheduler(threading.Thread):
+    """Junta frames de várias fontes em lotes e roda um único modelo compartilhado.
+
+    O modelo é carregado (pelo registro) na própria thread do agendador; os
+    frames enviados antes disso esperam na fila.
+    """
+
+    def __init__(self, model_path, backend="pytorch", conf=0.25, imgsz=None, max_batch=MAX_BATCH, max_wait=MAX_WAIT):
+        super().__init__(name="agendador", daemon=True)
+        self.model_path = model_path
+        self.backend = backend
+        self.model = None
+        self.conf = conf
+        self.imgsz = imgsz
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.stats = {}
+        self.batches = 0
+        self.batched_frames = 0
+        self._pending = deque()  # (fonte, imagem, future, instante de chegada)
+        self._active = set()  # Fontes em andamento: o lote fecha cedo quando todas já enviaram
+        self._cond = threading.Condition()
+        self._next_first = 0  # Rodízio de quem abre o lote
+        self._run_flag = True
+
+    def submit(self, stream, image):
+        """Enfileira um frame da fonte `stream`; o Future recebe o `Results` do Ultralytics."""
+        future = Future()
+        with self._cond:
+            if not self._run_flag:
+                future.set_exception(RuntimeError("Agendador parado"))
+                return future
+            self.stats.setdefault(stream, StreamStats())
+            self._active.add(stream)
+            self._pending.append((stream, image, future, time.perf_counter()))
+            self._cond.notify()
+        return future
+
+    def unregister(self, stream):
+        """Avisa que a fonte terminou, para o lote não esperar por ela."""
+        with self._cond:
+            self._active.discard(stream)
+            self._cond.notify()
+
+    def predict(self, stream, image):
+        """Versão bloqueante de `submit`, no formato de `model(image)` (lista com um resultado)."""
+        return [self.submit(stream, image).result()]
+
+    def _take_batch(self):
+        """Espera o lote fechar e retira até `max_batch` frames, no máximo um por fonte."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending or not self._run_flag)
+            if not self._run_flag:
+                return []
+            deadline = self._pending[0][3] + self.max_wait
+            while self._run_flag:
+                waiting = {item[0] for item in self._pending}
+                if len(waiting) >= self.max_batch or waiting >= self._active:
+                    break
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            # Uma vaga por fonte, começando pela fonte seguinte à que abriu o último lote
+            streams = sorted({item[0] for item in self._pending}, key=str)
+            start = self._next_first % len(streams)
+            order = streams[start:] + streams[:start]
+            chosen = set(order[:self.max_batch])
+            self._next_first += 1
+
+            batch, rest, taken = [], deque(), set()
+            for item in self._pending:
+                if item[0] in chosen and item[0] not in taken:
+                    batch.append(item)
+                    taken.add(item[0])
+                else:
+                    rest.append(item)
+            self._pending = rest
+            return batch
+
+    def run(self):
+        try:
+            self.model = registry.get(self.model_path, self.backend)
+        except Exception as e:
+            print(f"Erro ao carregar o modelo do agendador: {e}")
+            self._fail_pending(e)
+            return
+        while self._run_flag:
+            batch = self._take_batch()
+            if not batch:
+                continue
+            now = time.perf_counter()
+            kwargs = {"imgsz": self.imgsz} if self.imgsz else {}
+            try:
+                results = self.model.predict([image for _, image, _, _ in batch], conf=self.conf, verbose=False,
+                                             **kwargs)
+            except Exception as e:
+                for _, _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.batched_frames += len(batch)
+            for (stream, _, future, arrived), result in zip(batch, results):
+                stats = self.stats[stream]
+                stats.frames += 1
+                stats.wait += now - arrived
+                future.set_result(result)
+
+    def _fail_pending(self, error):
+        with self._cond:
+            self._run_flag = False
+            pending, self._pending = self._pending, deque()
+            self._cond.notify_all()
+        for _, _, future, _ in pending:
+            future.set_exception(error)
+
+    def stop(self):
+        """Para o agendador e libera quem estiver esperando um resultado."""
+        self._fail_pending(RuntimeError("Agendador parado"))
+        if self.is_alive():
+            self.join()
+
+    def summary(self):
+        """Tamanho médio do lote e contadores por fonte."""
+        return {
+            "batches": self.batches,
+            "mean_batch": self.batched_frames / self.batches if self.batches else 0.0,
+            "streams": {stream: stats.summary() for stream, stats in list(self.stats.items())},
+        }
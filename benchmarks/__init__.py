@@ -0,0 +1,10 @@
+"""Suíte de benchmarks reproduzível do Água Viva.
+
+Roda `videos/exemplo.mp4` e as imagens de `images/` por cada `weights/*.pt`
+(e backend) com configurações fixas, mede a latência por estágio (decodificação,
+pré-processamento, inferência, pós-processamento e renderização), vazão, pico
+de memória e tempo de inicialização, e compara com uma linha de base salva.
+
+    python -m benchmarks run --output resultados.json
+    python -m benchmarks compare resultados.json benchmarks/baseline.json --timer cpu
+"""
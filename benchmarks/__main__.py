@@ -0,0 +1,64 @@
+import argparse
+import glob
+import json
+import sys
+
+from benchmarks.compare import compare
+from benchmarks.suite import MAX_FRAMES, SCENARIOS, run_suite
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmarks do Água Viva.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run = subparsers.add_parser("run", help="Roda a suíte e grava os resultados em JSON.")
+    run.add_argument("--weights", nargs="+", default=sorted(glob.glob("weights/*.pt")))
+    run.add_argument("--backends", nargs="+", default=["pytorch"],
+                     choices=["pytorch", "onnx", "openvino", "onnx-int8", "onnx-int8-dynamic"])
+    run.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    run.add_argument("--video", default="videos/exemplo.mp4")
+    run.add_argument("--images", default="images")
+    run.add_argument("--max-frames", type=int, default=MAX_FRAMES)
+    run.add_argument("--threads", type=int, help="Threads do torch (fixe em CI para resultados comparáveis).")
+    run.add_argument("--no-isolate", action="store_true", help="Roda todos os casos no mesmo processo.")
+    run.add_argument("--output", default="benchmark_results.json")
+    run.add_argument("--baseline", help="Compara ao final com esta linha de base.")
+    run.add_argument("--threshold", type=float, default=0.10)
+    run.add_argument("--timer", choices=["wall", "cpu"], default="cpu")
+
+    cmp = subparsers.add_parser("compare", help="Compara um resultado com a linha de base.")
+    cmp.add_argument("results")
+    cmp.add_argument("baseline")
+    cmp.add_argument("--threshold", type=float, default=0.10, help="Piora relativa tolerada (0.10 = 10%%).")
+    cmp.add_argument("--timer", choices=["wall", "cpu"], default="cpu")
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        if not args.weights:
+            parser.error("nenhum arquivo em weights/*.pt; use --weights")
+        current = run_suite(args.weights, args.backends, args.scenarios, args.video, args.images,
+                            max_frames=args.max_frames, threads=args.threads, isolate=not args.no_isolate)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2)
+        print(f"Resultados gravados em {args.output}")
+        if not args.baseline:
+            return
+        baseline_path = args.baseline
+    else:
+        with open(args.results, encoding="utf-8") as f:
+            current = json.load(f)
+        baseline_path = args.baseline
+
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(current, baseline, threshold=args.threshold, timer=args.timer)
+    for line in regressions:
+        print(f"REGRESSÃO {line}")
+    if regressions:
+        sys.exit(1)
+    print(f"Sem regressões acima de {args.threshold:.0%} ({args.timer}).")
+
+
+if __name__ == "__main__":
+    main()
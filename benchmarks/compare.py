@@ -0,0 +1,34 @@
+"""Comparação de resultados com a linha de base."""
+
+COMPARED_PERCENTILES = ("p50", "p95")
+
+
+def _key(result):
+    return result["weights"], result["backend"], result["scenario"]
+
+
+def compare(current, baseline, threshold=0.10, timer="cpu"):
+    """Lista as regressões de `current` em relação a `baseline`.
+
+    Uma latência é regressão quando passa de `baseline * (1 + threshold)`; a
+    vazão, quando cai abaixo de `baseline * (1 - threshold)`. `timer` escolhe
+    o relógio comparado ("wall" ou "cpu").
+    """
+    base = {_key(r): r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        reference = base.get(_key(result))
+        if reference is None:
+            continue
+        name = "{} [{}] {}".format(*_key(result))
+        for stage, clocks in result["stages"].items():
+            if stage not in reference["stages"]:
+                continue
+            for q in COMPARED_PERCENTILES:
+                new, old = clocks[timer][q], reference["stages"][stage][timer][q]
+                if old > 0 and new > old * (1 + threshold):
+                    regressions.append(f"{name}: {stage} {timer} {q} {old:.2f}ms -> {new:.2f}ms (+{new / old - 1:.0%})")
+        new, old = result["throughput_fps"], reference["throughput_fps"]
+        if timer == "wall" and old > 0 and new < old * (1 - threshold):
+            regressions.append(f"{name}: vazão {old:.1f} -> {new:.1f} frames/s ({new / old - 1:.0%})")
+    return regressions
@@ -0,0 +1,210 @@
+"""Execução dos cenários de benchmark."""
+import glob
+import multiprocessing
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.timing import StageTimer, instrument_predictor
+
+IMGSZ = 512
+CONF = 0.25
+WARMUP_FRAMES = 5  # Frames descartados antes de medir (alocação de buffers, caches)
+MAX_FRAMES = 300
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+
+def peak_rss_mb():
+    """Pico de memória residente do processo em MB (None se indisponível)."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux informa em KB, macOS em bytes
+        return peak / 1024 / (1024 if sys.platform == "darwin" else 1)
+    except ImportError:
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / 1024 / 1024
+        except (ImportError, AttributeError):
+            return None
+
+
+def load_model(weights, backend, timer):
+    """Carrega e aquece o modelo, cronometrando a inicialização."""
+    import backends
+    import numpy as np
+
+    start = time.perf_counter()
+    model = backends.load(weights, backend, IMGSZ)
+    model(np.zeros((IMGSZ, IMGSZ, 3), dtype=np.uint8), imgsz=IMGSZ, conf=CONF, verbose=False)
+    startup = time.perf_counter() - start
+    instrument_predictor(model, timer)
+    return model, startup
+
+
+def run_video(model, timer, renderer, video, max_frames=MAX_FRAMES):
+    """Laço quadro a quadro, como na interface e no Streamlit."""
+    import cv2
+
+    cap = cv2.VideoCapture(video)
+    frames = 0
+    measured_start = None
+    while frames < max_frames + WARMUP_FRAMES:
+        timer.enabled = frames >= WARMUP_FRAMES
+        if frames == WARMUP_FRAMES:
+            measured_start = time.perf_counter()
+        with timer.stage("decode"):
+            ret, frame = cap.read()
+        if not ret:
+            break
+        results = model(frame, imgsz=IMGSZ, conf=CONF, verbose=False)
+        with timer.stage("render"):
+            renderer.render_result(frame, results[0])
+        frames += 1
+    cap.release()
+    timer.enabled = True
+    measured = max(frames - WARMUP_FRAMES, 0)
+    elapsed = time.perf_counter() - measured_start if measured_start else 0.0
+    return measured, elapsed
+
+
+def run_images(model, timer, renderer, images_dir, repeats=3):
+    """Cada imagem de `images_dir`, `repeats` vezes."""
+    import cv2
+
+    paths = sorted(p for p in glob.glob(os.path.join(images_dir, "*")) if p.lower().endswith(IMAGE_EXTENSIONS))
+    frames = 0
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for path in paths:
+            with timer.stage("decode"):
+                image = cv2.imread(path)
+            if image is None:
+                continue
+            results = model(image, imgsz=IMGSZ, conf=CONF, verbose=False)
+            with timer.stage("render"):
+                renderer.render_result(image, results[0])
+            frames += 1
+    return frames, time.perf_counter() - start
+
+
+def run_video_lean(model, timer, renderer, video, max_frames=MAX_FRAMES):
+    """O laço de vídeo pelo caminho enxuto (buffers reaproveitados, saída em NumPy)."""
+    import cv2
+
+    from lean_predictor import LeanPredictor
+
+    lean = LeanPredictor(model, IMGSZ, CONF)
+    for name in ("preprocess", "inference", "postprocess"):
+        setattr(lean, name, timer.wrap(name, getattr(lean, name)))
+    cap = cv2.VideoCapture(video)
+    frames = 0
+    measured_start = None
+    while frames < max_frames + WARMUP_FRAMES:
+        timer.enabled = frames >= WARMUP_FRAMES
+        if frames == WARMUP_FRAMES:
+            measured_start = time.perf_counter()
+        with timer.stage("decode"):
+            ret, frame = cap.read()
+        if not ret:
+            break
+        boxes, confidences, classes = lean.predict(frame)
+        with timer.stage("render"):
+            renderer.render(frame, boxes, confidences, classes, names=lean.names)
+        frames += 1
+    cap.release()
+    timer.enabled = True
+    measured = max(frames - WARMUP_FRAMES, 0)
+    elapsed = time.perf_counter() - measured_start if measured_start else 0.0
+    return measured, elapsed
+
+
+SCENARIOS = {"video": run_video, "video-lean": run_video_lean, "images": run_images}
+
+
+def run_case(weights, backend, scenario, video, images_dir, max_frames):
+    """Mede um cenário com um modelo/backend e retorna o registro do resultado."""
+    from renderer import Renderer
+
+    timer = StageTimer()
+    model, startup = load_model(weights, backend, timer)
+    timer.reset()
+    renderer = Renderer()
+    if scenario in ("video", "video-lean"):
+        frames, elapsed = SCENARIOS[scenario](model, timer, renderer, video, max_frames)
+    else:
+        frames, elapsed = run_images(model, timer, renderer, images_dir)
+    return {
+        "weights": os.path.basename(weights),
+        "backend": backend,
+        "scenario": scenario,
+        "frames": frames,
+        "throughput_fps": frames / elapsed if elapsed else 0.0,
+        "startup_s": startup,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": timer.summary(),
+    }
+
+
+def environment(threads):
+    """Metadados que tornam os resultados comparáveis entre execuções."""
+    import torch
+    import ultralytics
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "torch": torch.__version__,
+        "ultralytics": ultralytics.__version__,
+        "threads": threads,
+        "imgsz": IMGSZ,
+        "conf": CONF,
+        "warmup_frames": WARMUP_FRAMES,
+    }
+
+
+def _configure_torch(threads):
+    import torch
+
+    if threads:
+        torch.set_num_threads(threads)
+    torch.manual_seed(0)
+    return torch.get_num_threads()
+
+
+def _isolated_case(threads, *args):
+    """Caso rodado num interpretador novo: inicialização a frio e pico de memória só dele."""
+    _configure_torch(threads)
+    return run_case(*args)
+
+
+def run_suite(weights_files, backends, scenarios, video, images_dir, max_frames=MAX_FRAMES, threads=None,
+              isolate=True):
+    """Roda todos os casos em sequência, por padrão cada um no seu próprio processo."""
+    import_start = time.perf_counter()
+    import torch  # noqa: F401
+    import ultralytics  # noqa: F401
+    import_seconds = time.perf_counter() - import_start
+    threads = _configure_torch(threads)
+
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for weights in weights_files:
+        for backend in backends:
+            for scenario in scenarios:
+                print(f"{os.path.basename(weights)} [{backend}] {scenario}...", flush=True)
+                args = (weights, backend, scenario, video, images_dir, max_frames)
+                if isolate:
+                    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                        results.append(pool.submit(_isolated_case, threads, *args).result())
+                else:
+                    results.append(run_case(*args))
+    return {
+        "environment": environment(threads),
+        "import_s": import_seconds,
+        "results": results,
+    }
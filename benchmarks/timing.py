@@ -0,0 +1,79 @@
+"""Cronômetros por estágio com relógio de parede e de CPU."""
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+STAGES = ("decode", "preprocess", "inference", "postprocess", "render")
+
+
+def percentile(values, q):
+    """Percentil `q` (0-100) com interpolação linear, sem depender do NumPy."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(values):
+    """p50/p95/p99/média em milissegundos."""
+    return {
+        "p50": percentile(values, 50) * 1000,
+        "p95": percentile(values, 95) * 1000,
+        "p99": percentile(values, 99) * 1000,
+        "mean": sum(values) / len(values) * 1000 if values else 0.0,
+        "n": len(values),
+    }
+
+
+class StageTimer:
+    """Acumula durações por estágio nos relógios de parede e de CPU do processo.
+
+    O tempo de CPU (`time.process_time`) soma todas as threads do processo, o
+    que o torna mais estável que o de parede em máquinas de CI compartilhadas.
+    """
+
+    def __init__(self):
+        self.wall = defaultdict(list)
+        self.cpu = defaultdict(list)
+        self.enabled = True
+
+    @contextmanager
+    def stage(self, name):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            if self.enabled:
+                self.wall[name].append(time.perf_counter() - wall_start)
+                self.cpu[name].append(time.process_time() - cpu_start)
+
+    def wrap(self, name, fn):
+        """Versão de `fn` cronometrada como o estágio `name`."""
+        def timed(*args, **kwargs):
+            with self.stage(name):
+                return fn(*args, **kwargs)
+        return timed
+
+    def reset(self):
+        self.wall.clear()
+        self.cpu.clear()
+
+    def summary(self):
+        return {
+            name: {"wall": summarize(self.wall[name]), "cpu": summarize(self.cpu[name])}
+            for name in STAGES if name in self.wall
+        }
+
+
+def instrument_predictor(model, timer):
+    """Cronometra os estágios internos do predictor do Ultralytics.
+
+    O predictor só existe depois da primeira chamada, então o modelo precisa
+    ter sido aquecido antes.
+    """
+    predictor = model.predictor
+    for name in ("preprocess", "inference", "postprocess"):
+        setattr(predictor, name, timer.wrap(name, getattr(predictor, name)))
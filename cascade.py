@@ -0,0 +1,195 @@
+"""Cascata de modelos guiada pela confiança: o barato em todo frame, o grande só quando precisa.
+
+Os treinos em `antigo/runs/train` mostram uma diferença grande de custo e de
+precisão entre o nano e o large. Aqui o modelo pequeno roda em todos os
+frames com um limiar baixo, e um frame sobe para o modelo grande quando:
+
+- alguma detecção cai na faixa de incerteza [`low`, `high`): só as regiões
+  em volta dessas caixas (com margem) são recortadas e enviadas ao modelo
+  grande, que decide o que há nelas;
+- a contagem de detecções confiantes muda de repente em relação ao frame
+  anterior (`count_jump`), ou há regiões demais para recortar: o frame
+  inteiro vai ao modelo grande.
+
+Os recortes de todos os frames de um lote vão ao modelo grande numa única
+chamada, assim como os frames inteiros. Nas regiões recortadas as caixas
+incertas do modelo pequeno são trocadas pelas do grande, e as duplicatas nas
+bordas são fundidas com NMS.
+"""
+import time
+
+import numpy as np
+
+LOW_CONFIDENCE = 0.25  # Abaixo disso a detecção do modelo pequeno é descartada
+HIGH_CONFIDENCE = 0.6  # A partir disso a detecção do modelo pequeno é aceita sem escalar
+COUNT_JUMP = 3  # Variação na contagem de detecções confiantes que escala o frame inteiro
+CROP_PADDING = 0.5  # Margem em volta de cada caixa incerta, em fração do maior lado da caixa
+MIN_CROP = 128  # Lado mínimo de um recorte, em pixels
+MAX_CROPS = 4  # Com mais regiões que isso, escalar o frame inteiro sai mais barato
+MAX_CROP_AREA = 0.4  # Idem quando os recortes somam mais que esta fração da área do frame
+
+
+def crop_regions(boxes, shape, padding=CROP_PADDING, min_side=MIN_CROP):
+    """Regiões (x1, y1, x2, y2) inteiras em volta de `boxes`, com margem, fundidas quando se sobrepõem."""
+    height, width = shape[:2]
+    regions = []
+    for x1, y1, x2, y2 in boxes:
+        side = max(x2 - x1, y2 - y1)
+        half = max(side * (1 + 2 * padding), min_side) / 2
+        cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+        regions.append([max(0, int(cx - half)), max(0, int(cy - half)),
+                        min(width, int(np.ceil(cx + half))), min(height, int(np.ceil(cy + half)))])
+
+    # Fundir regiões que se tocam até não sobrar sobreposição
+    merged = True
+    while merged and len(regions) > 1:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                a, b = regions[i], regions[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    regions[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del regions[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return regions
+
+
+def merge_detections(parts, iou=0.5):
+    """Junta arrays (N, 6) de detecções e funde as duplicatas com NMS por classe."""
+    data = np.concatenate(parts) if parts else np.zeros((0, 6), np.float32)
+    if len(data) < 2:
+        return data
+
+    import torch  # Só aqui: importar o módulo não deve carregar o torch
+    from torchvision.ops import batched_nms
+
+    keep = batched_nms(torch.from_numpy(data[:, :4]), torch.from_numpy(data[:, 4]),
+                       torch.from_numpy(data[:, 5]), iou).numpy()
+    return data[keep]
+
+
+class Cascade:
+    """Dois modelos atrás da mesma interface de um modelo (`predict`, chamada direta e `names`).
+
+    `conf` em `predict` continua sendo o limiar final das detecções; a faixa de
+    incerteza sobe junto quando ele passa de `high`. A contagem do frame
+    anterior é guardada entre chamadas: use uma cascata por vídeo (não é
+    thread-safe), ou `count_jump=None` para imagens sem relação entre si.
+    """
+
+    def __init__(self, small, large, low=LOW_CONFIDENCE, high=HIGH_CONFIDENCE, count_jump=COUNT_JUMP,
+                 padding=CROP_PADDING, max_crops=MAX_CROPS, max_crop_area=MAX_CROP_AREA, iou=0.5):
+        self.small = small
+        self.large = large
+        self.names = small.names
+        self.low = low
+        self.high = high
+        self.count_jump = count_jump
+        self.padding = padding
+        self.max_crops = max_crops
+        self.max_crop_area = max_crop_area
+        self.iou = iou
+        self.frames = 0
+        self.full_frames = 0  # Frames inteiros enviados ao modelo grande
+        self.crop_frames = 0  # Frames com ao menos um recorte enviado ao modelo grande
+        self.crops = 0
+        self.small_seconds = 0.0
+        self.large_seconds = 0.0
+        self._last_count = None  # Detecções confiantes do modelo pequeno no frame anterior
+
+    def __call__(self, source, **kwargs):
+        return self.predict(source, **kwargs)
+
+    def predict(self, source, conf=0.25, imgsz=None, verbose=False, **kwargs):
+        """Detecta em uma imagem ou lista de imagens; retorna uma lista de `Results`."""
+        images = source if isinstance(source, (list, tuple)) else [source]
+        if not images:
+            return []
+        options = dict(kwargs, verbose=verbose)
+        if imgsz:
+            options["imgsz"] = imgsz
+        high = max(self.high, conf)
+        low = min(self.low, conf)
+
+        start = time.perf_counter()
+        small_results = self.small.predict(images, conf=low, **options)
+        self.small_seconds += time.perf_counter() - start
+
+        detections = []  # Por frame: arrays a fundir, ou None se o frame inteiro foi escalado
+        full_images, crop_images, crop_origins = [], [], []
+        for index, (image, result) in enumerate(zip(images, small_results)):
+            data = result.boxes.data.cpu().numpy().reshape(-1, 6)
+            scores = data[:, 4]
+            uncertain = (scores >= low) & (scores < high)
+            count = int((scores >= high).sum())
+            jump = (self.count_jump and self._last_count is not None
+                    and abs(count - self._last_count) >= self.count_jump)
+            self._last_count = count
+
+            regions = crop_regions(data[uncertain, :4], image.shape, self.padding) if uncertain.any() else []
+            area = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in regions)
+            if jump or len(regions) > self.max_crops or area > self.max_crop_area * image.shape[0] * image.shape[1]:
+                detections.append(None)
+                full_images.append(image)
+                self.full_frames += 1
+                continue
+            # Fora das regiões recortadas, vale o que o modelo pequeno já decidiu
+            detections.append([data[~uncertain & (scores >= conf)]])
+            for x1, y1, x2, y2 in regions:
+                crop_images.append(image[y1:y2, x1:x2])
+                crop_origins.append((index, x1, y1))
+            self.crop_frames += bool(regions)
+            self.crops += len(regions)
+        self.frames += len(images)
+
+        start = time.perf_counter()
+        full_results = iter(self.large.predict(full_images, conf=conf, **options) if full_images else ())
+        # Recortes em um único lote, no imgsz padrão do modelo grande (o recorte é ampliado)
+        if crop_images:
+            crop_results = self.large.predict(crop_images, conf=conf, verbose=verbose)
+            for (index, x, y), result in zip(crop_origins, crop_results):
+                data = result.boxes.data.cpu().numpy().reshape(-1, 6).copy()
+                data[:, [0, 2]] += x
+                data[:, [1, 3]] += y
+                detections[index].append(data)
+        if full_images or crop_images:
+            self.large_seconds += time.perf_counter() - start
+
+        from ultralytics.engine.results import Results
+
+        results = []
+        for image, parts in zip(images, detections):
+            if parts is None:
+                results.append(next(full_results))
+                continue
+            data = merge_detections(parts, self.iou) if len(parts) > 1 else parts[0]
+            results.append(Results(orig_img=image, path="", names=self.names, boxes=data))
+        return results
+
+    def summary(self):
+        escalated = self.full_frames + self.crop_frames
+        total = self.small_seconds + self.large_seconds
+        return {
+            "frames": self.frames,
+            "escalated": escalated,
+            "escalated_fraction": escalated / self.frames if self.frames else 0.0,
+            "full_frames": self.full_frames,
+            "crop_frames": self.crop_frames,
+            "crops": self.crops,
+            "large_time_fraction": self.large_seconds / total if total else 0.0,
+        }
+
+    def lines(self):
+        """Linha de estatísticas para as sobreposições de vídeo."""
+        stats = self.summary()
+        return [f"Cascata: {stats['escalated_fraction']:.0%} escalados "
+                f"({stats['full_frames']} inteiros, {stats['crops']} recortes)"]
+
+    def log(self, prefix="Cascata"):
+        stats = self.summary()
+        print(f"{prefix}: {stats['escalated']}/{stats['frames']} frames escalados ({stats['escalated_fraction']:.1%}; "
+              f"{stats['full_frames']} inteiros, {stats['crops']} recortes em {stats['crop_frames']} frames), "
+              f"{stats['large_time_fraction']:.0%} do tempo de inferência no modelo grande")
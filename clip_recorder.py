@@ -0,0 +1,188 @@
+"""Gravação de trechos disparada por detecções, com pré e pós-gravação.
+
+Em vez de gravar a sessão inteira, o gravador mantém em memória só os
+últimos `pre_roll` segundos de frames num anel de tamanho fixo. Quando a
+contagem de detecções de um frame chega a `threshold`, o trecho começa com
+o conteúdo do anel e segue até `post_roll` segundos depois da última
+detecção acima do limiar. Cada trecho vira um MP4 em `clips/`, acompanhado
+de um JSON com as detecções de cada frame gravado.
+
+`add()` só guarda referências e enfileira: a codificação roda numa thread
+própria, e se ela ficar para trás os frames novos são descartados (e
+contados) em vez de segurar o laço de inferência.
+"""
+import json
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+
+import cv2
+
+from renderer import Renderer, result_arrays
+
+CLIPS_DIR = "clips"
+THRESHOLD = 3  # Detecções num frame que disparam a gravação
+PRE_ROLL = 3.0  # Segundos mantidos no anel antes do disparo
+POST_ROLL = 5.0  # Segundos gravados depois da última detecção acima do limiar
+WRITER_QUEUE = 120  # Frames esperando codificação antes de começar a descartar
+
+
+def clip_prefix(source):
+    """Prefixo dos arquivos de trecho a partir da fonte (nome do vídeo, câmera N ou host do stream)."""
+    if isinstance(source, int):
+        return f"camera{source}"
+    name = os.path.splitext(os.path.basename(str(source).rstrip("/")))[0] or "trecho"
+    return re.sub(r"\W+", "_", name)
+
+
+class ClipRecorder:
+    """Anel de pré-gravação mais um escritor de MP4 em segundo plano.
+
+    `add()` deve ser chamado sempre da mesma thread (em geral a de anotação);
+    a codificação e o desenho das caixas acontecem na thread do escritor.
+    """
+
+    def __init__(self, fps, threshold=THRESHOLD, pre_roll=PRE_ROLL, post_roll=POST_ROLL, output_dir=CLIPS_DIR,
+                 prefix="trecho", annotate=True, max_queue=WRITER_QUEUE, names=None):
+        self.fps = fps if fps and fps > 0 else 30.0
+        self.threshold = threshold
+        self.post_roll = post_roll
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.annotate = annotate
+        self.names = names
+        self.ring = deque(maxlen=max(1, int(pre_roll * self.fps)))
+        self.clips = []  # Caminhos dos MP4 já abertos
+        self.frames_written = 0
+        self.dropped = 0  # Frames descartados porque o escritor estava atrasado
+        self._recording_until = None  # Instante (relógio da fonte) em que a gravação atual termina
+        self._clip_dropped = 0
+        self._last_timestamp = None
+        # Fila sem limite: aberturas e fechamentos nunca esperam; só os frames contam contra `max_queue`
+        self._queue = queue.Queue()
+        self._frame_slots = threading.Semaphore(max_queue)
+        self._thread = threading.Thread(target=self._write, name="gravador", daemon=True)
+        self._thread.start()
+
+    @property
+    def recording(self):
+        return self._recording_until is not None
+
+    def add(self, frame_index, timestamp, image, result=None):
+        """Registra um frame (e o seu `Results`, se houver); dispara ou estende o trecho."""
+        if result is not None:
+            boxes, confidences, classes = result_arrays(result)
+            if self.names is None:
+                self.names = result.names
+        else:
+            boxes = confidences = classes = None
+        count = 0 if confidences is None else len(confidences)
+        item = (frame_index, timestamp, image, boxes, confidences, classes)
+        if self._last_timestamp is not None and timestamp < self._last_timestamp:
+            # A fonte voltou ao início (vídeo em laço ou seek): o anel e o trecho atual não continuam
+            self.ring.clear()
+            if self.recording:
+                self._finish_clip()
+        self._last_timestamp = timestamp
+
+        if not self.recording:
+            self.ring.append(item)
+            if count < self.threshold:
+                return
+            self._start_clip()
+        else:
+            self._enqueue(("frame", item))
+        if count >= self.threshold:
+            self._recording_until = timestamp + self.post_roll
+        elif timestamp >= self._recording_until:
+            self._finish_clip()
+
+    def _start_clip(self):
+        pre = list(self.ring)
+        self.ring.clear()
+        first, last = pre[0][1], pre[-1][1]
+        # Taxa efetiva dos frames que chegaram até aqui (o pipeline pode ter descartado alguns)
+        fps = (len(pre) - 1) / (last - first) if len(pre) > 1 and last > first else self.fps
+        height, width = pre[0][2].shape[:2]
+        name = f"{self.prefix}-{time.strftime('%Y%m%d-%H%M%S')}-{pre[0][0]:06d}"
+        path = os.path.join(self.output_dir, name + ".mp4")
+        self.clips.append(path)
+        self._clip_dropped = 0
+        self._queue.put(("open", (path, min(fps, self.fps), (width, height))))
+        for item in pre:
+            self._enqueue(("frame", item))
+
+    def _finish_clip(self):
+        self._recording_until = None
+        self._queue.put(("close", self._clip_dropped))
+
+    def _enqueue(self, message):
+        if not self._frame_slots.acquire(blocking=False):
+            self.dropped += 1
+            self._clip_dropped += 1
+            return
+        self._queue.put(message)
+
+    def _write(self):
+        renderer = Renderer(threshold=0.0)
+        writer = path = None
+        frames = []
+        while True:
+            message = self._queue.get()
+            if message is None:
+                break
+            kind, payload = message
+            if kind == "frame":
+                self._frame_slots.release()
+            if kind == "open":
+                path, fps, size = payload
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+                frames = []
+            elif kind == "frame" and writer is not None:
+                index, timestamp, image, boxes, confidences, classes = payload
+                if self.annotate and boxes is not None and len(boxes):
+                    image = renderer.render(image, boxes, confidences, classes, names=self.names)
+                writer.write(image)
+                self.frames_written += 1
+                frames.append({
+                    "frame": int(index),
+                    "timestamp": round(float(timestamp), 4),
+                    "detections": [] if boxes is None else [
+                        {"class": int(c), "name": self.names[int(c)] if self.names else str(int(c)),
+                         "confidence": round(float(conf), 4), "box": [round(float(v), 1) for v in box]}
+                        for box, conf, c in zip(boxes, confidences, classes)
+                    ],
+                })
+            elif kind == "close" and writer is not None:
+                writer.release()
+                writer = None
+                self._write_sidecar(path, frames, dropped=payload)
+                print(f"Trecho gravado: {path} ({len(frames)} frames, {payload} descartados)")
+        if writer is not None:
+            writer.release()
+
+    def _write_sidecar(self, path, frames, dropped):
+        sidecar = {
+            "video": os.path.basename(path),
+            "threshold": self.threshold,
+            "post_roll": self.post_roll,
+            "dropped_frames": dropped,
+            "frames": frames,
+        }
+        with open(os.path.splitext(path)[0] + ".json", "w", encoding="utf-8") as f:
+            json.dump(sidecar, f, ensure_ascii=False)
+
+    def close(self, wait=True):
+        """Fecha o trecho em andamento; com `wait`, espera o escritor terminar a fila."""
+        if self.recording:
+            self._finish_clip()
+        self._queue.put(None)
+        if wait:
+            self._thread.join()
+
+    def summary(self):
+        return {"clips": len(self.clips), "frames_written": self.frames_written, "dropped": self.dropped}
@@ -0,0 +1,332 @@
+"""Armazenamento persistente das detecções, consultável sem rodar o modelo de novo.
+
+Cada gravação é um diretório com dois arrays de registros em disco, lidos por
+`np.memmap` (nada é carregado na memória até ser consultado):
+
+- `detections.bin`: uma linha por caixa (frame, timestamp, classe, confiança, x1, y1, x2, y2);
+- `frames.bin`: uma linha por frame processado (frame, timestamp, posição da
+  primeira caixa em `detections.bin` e quantidade), inclusive frames sem
+  nenhuma detecção. É o índice por frame/tempo: como os frames são gravados em
+  ordem, uma busca binária no timestamp delimita qualquer intervalo;
+- `meta.json`: nomes das classes, FPS, fonte e configuração do modelo.
+
+Os arquivos só recebem acréscimos, então um leitor pode consultar uma gravação
+enquanto ela ainda está sendo escrita.
+"""
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+STORE_DIR = "detections"
+DETECTION_DTYPE = np.dtype([
+    ("frame", "<i8"), ("timestamp", "<f8"), ("cls", "<i2"), ("confidence", "<f4"),
+    ("x1", "<f4"), ("y1", "<f4"), ("x2", "<f4"), ("y2", "<f4"),
+])
+FRAME_DTYPE = np.dtype([("frame", "<i8"), ("timestamp", "<f8"), ("start", "<i8"), ("count", "<i4")])
+FLUSH_FRAMES = 64  # Frames acumulados antes de escrever em disco
+FLUSH_SECONDS = 2.0
+DEFAULT_CONF = 0.25  # Confiança das gravações sem sufixo `-conf<N>` no nome
+
+_open_paths = set()  # Gravações com um StoreWriter aberto neste processo
+_open_lock = threading.Lock()
+
+
+def default_store_path(source, model_path, root=STORE_DIR, conf=None):
+    """Diretório da gravação: um por vídeo, modelo e confiança; câmeras e streams ganham um por sessão."""
+    model = os.path.splitext(os.path.basename(str(model_path)))[0]
+    if conf is not None and float(conf) != DEFAULT_CONF:
+        # Outra confiança é outra gravação: trocar o limiar não apaga o histórico já gravado
+        model += f"-conf{float(conf):g}"
+    if isinstance(source, str) and os.path.isfile(source):
+        name = os.path.splitext(os.path.basename(source))[0]
+    else:
+        name = re.sub(r"[^\w.-]+", "_", f"camera{source}") + time.strftime("-%Y%m%d-%H%M%S")
+    return os.path.join(root, f"{name}-{model}")
+
+
+def list_stores(root=STORE_DIR):
+    """Gravações existentes em `root`, da mais recente para a mais antiga."""
+    if not os.path.isdir(root):
+        return []
+    paths = [os.path.join(root, d) for d in os.listdir(root)
+             if os.path.exists(os.path.join(root, d, "meta.json"))]
+    return sorted(paths, key=os.path.getmtime, reverse=True)
+
+
+class StoreInUseError(ValueError):
+    """A gravação já tem um StoreWriter aberto neste processo."""
+
+
+class StoreWriter:
+    """Acrescenta as detecções de cada frame à gravação em `path`.
+
+    Frames com índice menor ou igual ao último gravado são ignorados: um vídeo
+    em loop não duplica a gravação, e reabrir a mesma gravação continua de onde
+    parou. Se a configuração (`meta`) mudar, a gravação anterior é descartada.
+    """
+
+    def __init__(self, path, names, fps, **meta):
+        self.path = path
+        with _open_lock:
+            if os.path.abspath(path) in _open_paths:
+                raise StoreInUseError(f"Gravação já aberta por outro laço: {path}")
+            _open_paths.add(os.path.abspath(path))
+        os.makedirs(path, exist_ok=True)
+        meta = {"names": {int(k): v for k, v in dict(names).items()}, "fps": fps, **meta}
+        meta_path = os.path.join(path, "meta.json")
+        previous = None
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                previous = json.load(f)
+            previous["names"] = {int(k): v for k, v in previous["names"].items()}
+        reset = previous != meta
+        if reset:
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f, indent=2)
+        detections_path = os.path.join(path, "detections.bin")
+        frames_path = os.path.join(path, "frames.bin")
+        self._stored = 0
+        self.last_frame = -1
+        if not reset and os.path.exists(frames_path):
+            # Continuar a gravação anterior, descartando o que uma interrupção deixou pela metade
+            count = os.path.getsize(frames_path) // FRAME_DTYPE.itemsize
+            if count:
+                last = np.fromfile(frames_path, dtype=FRAME_DTYPE, count=count)[-1]
+                self._stored = int(last["start"] + last["count"])
+                self.last_frame = int(last["frame"])
+            os.truncate(frames_path, count * FRAME_DTYPE.itemsize)
+            if os.path.exists(detections_path):
+                os.truncate(detections_path, self._stored * DETECTION_DTYPE.itemsize)
+        mode = "wb" if reset else "ab"
+        self._detections = open(detections_path, mode)
+        self._frames = open(frames_path, mode)
+        self._pending_detections = []
+        self._pending_frames = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def append(self, frame_index, timestamp, boxes, confidences, classes):
+        """Registra um frame (arrays xyxy, confianças e classes, possivelmente vazios)."""
+        with self._lock:
+            if frame_index <= self.last_frame:
+                return
+            self.last_frame = frame_index
+            n = len(confidences)
+            rows = np.empty(n, dtype=DETECTION_DTYPE)
+            if n:
+                boxes = np.asarray(boxes, dtype=np.float32).reshape(n, 4)
+                rows["frame"] = frame_index
+                rows["timestamp"] = timestamp
+                rows["cls"] = classes
+                rows["confidence"] = confidences
+                rows["x1"], rows["y1"], rows["x2"], rows["y2"] = boxes.T
+            self._pending_detections.append(rows)
+            self._pending_frames.append((frame_index, timestamp, self._stored, n))
+            self._stored += n
+            if (len(self._pending_frames) >= FLUSH_FRAMES
+                    or time.monotonic() - self._last_flush >= FLUSH_SECONDS):
+                self._flush()
+
+    def append_result(self, frame_index, timestamp, result):
+        """Registra um resultado do Ultralytics."""
+        from renderer import result_arrays
+        self.append(frame_index, timestamp, *result_arrays(result))
+
+    def _flush(self):
+        if self._pending_frames:
+            # Caixas antes do índice: um leitor nunca vê um frame apontando para caixas ainda não escritas
+            self._detections.write(np.concatenate(self._pending_detections).tobytes())
+            self._detections.flush()
+            self._frames.write(np.array(self._pending_frames, dtype=FRAME_DTYPE).tobytes())
+            self._frames.flush()
+            self._pending_detections.clear()
+            self._pending_frames.clear()
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._detections.close()
+            self._frames.close()
+        with _open_lock:
+            _open_paths.discard(os.path.abspath(self.path))
+
+
+def open_store(source, model_path, names, fps, root=STORE_DIR, **meta):
+    """StoreWriter na gravação padrão da fonte.
+
+    A mesma fonte aberta duas vezes ao mesmo tempo (por exemplo, na grade de
+    câmeras) grava em `<gravação>-2`, `<gravação>-3`...
+    """
+    base = default_store_path(source, model_path, root, meta.get("conf"))
+    copy = 1
+    while True:
+        try:
+            return StoreWriter(base if copy == 1 else f"{base}-{copy}", names, fps, **meta)
+        except StoreInUseError:
+            copy += 1
+
+
+def _memmap(path, dtype):
+    count = os.path.getsize(path) // dtype.itemsize if os.path.exists(path) else 0
+    if not count:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+
+class DetectionStore:
+    """Consultas sobre uma gravação, lida por memory map."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.names = {int(k): v for k, v in self.meta["names"].items()}
+        self.refresh()
+
+    def refresh(self):
+        """Relê o tamanho dos arquivos (para acompanhar uma gravação em andamento)."""
+        self.frames = _memmap(os.path.join(self.path, "frames.bin"), FRAME_DTYPE)
+        self.detections = _memmap(os.path.join(self.path, "detections.bin"), DETECTION_DTYPE)
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def duration(self):
+        return float(self.frames["timestamp"][-1]) if len(self.frames) else 0.0
+
+    def _frame_slice(self, start=None, end=None):
+        """Fatia de `frames` com timestamp em [start, end)."""
+        timestamps = self.frames["timestamp"]
+        lo = 0 if start is None else int(np.searchsorted(timestamps, start, side="left"))
+        hi = len(timestamps) if end is None else int(np.searchsorted(timestamps, end, side="left"))
+        return slice(lo, hi)
+
+    def frame_counts(self, start=None, end=None, cls=None, min_conf=None):
+        """(timestamps, contagem por frame) no intervalo, opcionalmente filtrando classe e confiança."""
+        frames = self.frames[self._frame_slice(start, end)]
+        if cls is None and min_conf is None:
+            return np.asarray(frames["timestamp"]), np.asarray(frames["count"])
+        detections = self.boxes(start, end, cls=cls, min_conf=min_conf)
+        position = np.searchsorted(frames["frame"], detections["frame"])
+        counts = np.bincount(position, minlength=len(frames))
+        return np.asarray(frames["timestamp"]), counts
+
+    def counts_per_interval(self, interval=60.0, reduce="mean", start=None, end=None, cls=None, min_conf=None):
+        """Objetos por intervalo de `interval` segundos (por padrão, por minuto).
+
+        `reduce` combina os frames de cada intervalo: "mean" (média de objetos
+        visíveis por frame), "max" ou "sum" (total de caixas). Retorna
+        (início de cada intervalo em segundos, valores).
+        """
+        timestamps, counts = self.frame_counts(start, end, cls, min_conf)
+        if not len(timestamps):
+            return np.empty(0), np.empty(0)
+        bins = (timestamps // interval).astype(np.int64)
+        first = bins[0]
+        bins -= first
+        if reduce == "max":
+            values = np.zeros(bins[-1] + 1)
+            np.maximum.at(values, bins, counts)
+        else:
+            values = np.bincount(bins, weights=counts)
+            if reduce == "mean":
+                values = values / np.maximum(np.bincount(bins), 1)
+            elif reduce != "sum":
+                raise ValueError(f"reduce desconhecido: {reduce}")
+        return (np.arange(len(values)) + first) * interval, values
+
+    def frames_above(self, n, start=None, end=None, cls=None, min_conf=None):
+        """Registros de `frames` com mais de `n` objetos."""
+        frames = self.frames[self._frame_slice(start, end)]
+        if cls is None and min_conf is None:
+            return np.asarray(frames[frames["count"] > n])
+        _, counts = self.frame_counts(start, end, cls, min_conf)
+        return np.asarray(frames[counts > n])
+
+    def boxes(self, start=None, end=None, cls=None, min_conf=None):
+        """Todas as caixas no intervalo de tempo [start, end), filtradas por classe e confiança.
+
+        `cls` aceita o índice ou o nome da classe.
+        """
+        frames = self.frames[self._frame_slice(start, end)]
+        if not len(frames):
+            return np.empty(0, dtype=DETECTION_DTYPE)
+        first, last = frames[0], frames[-1]
+        detections = self.detections[first["start"]:last["start"] + last["count"]]
+        mask = np.ones(len(detections), dtype=bool)
+        if cls is not None:
+            if isinstance(cls, str):
+                cls = {name: index for index, name in self.names.items()}[cls]
+            mask &= detections["cls"] == cls
+        if min_conf is not None:
+            mask &= detections["confidence"] >= min_conf
+        return np.asarray(detections[mask])
+
+    def has_frame(self, frame_index):
+        """Indica se o frame foi processado (mesmo que sem nenhuma detecção)."""
+        position = int(np.searchsorted(self.frames["frame"], frame_index))
+        return position < len(self.frames) and self.frames[position]["frame"] == frame_index
+
+    def frame(self, frame_index):
+        """Caixas de um frame pelo índice (vazio se o frame não foi processado)."""
+        position = int(np.searchsorted(self.frames["frame"], frame_index))
+        if position == len(self.frames) or self.frames[position]["frame"] != frame_index:
+            return np.empty(0, dtype=DETECTION_DTYPE)
+        row = self.frames[position]
+        return np.asarray(self.detections[row["start"]:row["start"] + row["count"]])
+
+    def to_parquet(self, path):
+        """Exporta as caixas para Parquet (requer pyarrow)."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        detections = np.asarray(self.detections)
+        columns = {name: detections[name] for name in DETECTION_DTYPE.names}
+        columns["name"] = [self.names.get(int(c), str(c)) for c in detections["cls"]]
+        pq.write_table(pa.table(columns), path)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Consultas sobre uma gravação de detecções.")
+    parser.add_argument("store", help="Diretório da gravação (ex.: detections/exemplo-medium).")
+    parser.add_argument("--per-minute", action="store_true", help="Média de objetos por frame, minuto a minuto.")
+    parser.add_argument("--above", type=int, help="Frames com mais de N objetos.")
+    parser.add_argument("--boxes", metavar="CLASSE", help="Caixas de uma classe (nome ou índice).")
+    parser.add_argument("--start", type=float, help="Início do intervalo (s).")
+    parser.add_argument("--end", type=float, help="Fim do intervalo (s).")
+    parser.add_argument("--parquet", help="Exporta todas as caixas para este arquivo .parquet.")
+    args = parser.parse_args()
+
+    store = DetectionStore(args.store)
+    print(f"{len(store)} frames, {len(store.detections)} caixas, {store.duration:.1f}s")
+    if args.per_minute:
+        starts, values = store.counts_per_interval(60, start=args.start, end=args.end)
+        for start, value in zip(starts, values):
+            print(f"{int(start // 60):4d} min: {value:.2f} objetos/frame")
+    if args.above is not None:
+        for row in store.frames_above(args.above, args.start, args.end):
+            print(f"frame {row['frame']} ({row['timestamp']:.2f}s): {row['count']} objetos")
+    if args.boxes is not None:
+        cls = int(args.boxes) if args.boxes.isdigit() else args.boxes
+        for row in store.boxes(args.start, args.end, cls=cls):
+            print(f"frame {row['frame']} ({row['timestamp']:.2f}s) conf {row['confidence']:.2f} "
+                  f"[{row['x1']:.0f}, {row['y1']:.0f}, {row['x2']:.0f}, {row['y2']:.0f}]")
+    if args.parquet:
+        store.to_parquet(args.parquet)
+        print(f"Exportado para {args.parquet}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""Fontes de frames com leitura antecipada: arquivos, dispositivos e streams.
+
+Uma `FrameSource` decodifica numa thread própria e entrega os frames prontos
+ao consumidor, que não paga mais o `cap.read()` na sua própria thread:
+
+- arquivos: frames fora do passo (`stride`) são pulados com `grab()` sem
+  `retrieve()`, ou seja, sem a conversão de cor; `seek()` posiciona no frame
+  exato (com recuo para `grab()` desde o início quando o contêiner não
+  permite busca precisa); a leitura para quando a fila está cheia, sem perder
+  frames;
+- dispositivos e streams (RTSP, HTTP): a fila guarda só os frames mais
+  recentes, e uma queda reconecta com espera crescente (`backoff`);
+- em todos os casos, `scale` reduz o frame logo após a decodificação (nos
+  dispositivos, pedindo antes a resolução menor ao próprio driver).
+
+Para testar sem câmera, `serve` publica um vídeo como stream MJPEG local, que
+pode ser interrompido e reiniciado para exercitar a reconexão:
+
+    python frame_source.py serve videos/exemplo.mp4 --port 8090
+    python frame_source.py probe http://localhost:8090/stream.mjpg --frames 300
+"""
+import argparse
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+
+READ_AHEAD = 4  # Frames decodificados à frente do consumidor
+BACKOFF_START = 0.5  # Segundos antes da primeira tentativa de reconexão
+BACKOFF_MAX = 30.0
+DEFAULT_FPS = 30.0
+
+
+def parse_source(value):
+    """Índice de dispositivo ("0" vira 0) ou caminho/URL."""
+    return int(value) if isinstance(value, str) and value.isdigit() else value
+
+
+def source_kind(source):
+    """"device", "stream" (URL) ou "file"."""
+    if isinstance(source, int):
+        return "device"
+    return "stream" if "://" in str(source) else "file"
+
+
+def exact_seek(cap, index):
+    """Posiciona `cap` exatamente em `index`; sem busca precisa no contêiner, avança com `grab()`."""
+    cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+    if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) != index:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        for _ in range(index):
+            if not cap.grab():
+                break
+
+
+class FrameSource:
+    """Lê `source` numa thread própria e entrega (índice, imagem) em ordem.
+
+    `start`/`end` limitam o intervalo de frames dos arquivos; `loop` volta ao
+    início no fim do arquivo (o índice recomeça em 0). `drop` escolhe entre
+    descartar os frames mais antigos quando o consumidor atrasa (padrão para
+    dispositivos e streams) ou segurar a decodificação (padrão para arquivos).
+    Com `metrics`, o tempo de cada decodificação é registrado em `stage`.
+    """
+
+    def __init__(self, source, stride=1, start=0, end=None, loop=False, scale=None, read_ahead=READ_AHEAD,
+                 drop=None, reconnect=True, metrics=None, stage="captura", open_capture=cv2.VideoCapture):
+        self.source = source
+        self.kind = source_kind(source)
+        self.stride = max(1, stride)
+        self.start_frame = start
+        self.end = end
+        self.loop = loop
+        self.scale = scale if scale and scale < 1 else None
+        self.drop = self.kind != "file" if drop is None else drop
+        self.reconnect = reconnect and self.kind != "file"
+        self.metrics = metrics
+        self.stage = stage
+        self.read_ahead = read_ahead
+        self._open_capture = open_capture  # Substituível por uma captura falsa em testes
+        self.decoded = 0
+        self.skipped = 0  # Frames pulados com grab() (passo) sem decodificar
+        self.dropped = 0  # Frames decodificados e descartados porque o consumidor atrasou
+        self.reconnects = 0
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._seek_to = None
+        self._generation = 0  # Incrementado a cada seek: frames anteriores na fila são ignorados
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        self.cap = self._open()
+        self.opened = self.cap.isOpened()
+        fps = self.cap.get(cv2.CAP_PROP_FPS) if self.opened else 0
+        self.fps = fps if fps and fps > 0 else DEFAULT_FPS
+        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT)) if self.kind == "file" and self.opened else 0
+        width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)) if self.opened else 0
+        height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) if self.opened else 0
+        if self.scale and self.kind != "device":
+            width, height = max(1, int(width * self.scale)), max(1, int(height * self.scale))
+        self.size = (width, height)  # Tamanho dos frames entregues
+
+    def _open(self):
+        cap = self._open_capture(self.source)
+        if self.scale and self.kind == "device" and cap.isOpened():
+            # Câmeras: pedir a resolução menor ao driver em vez de reduzir cada frame
+            width, height = cap.get(cv2.CAP_PROP_FRAME_WIDTH), cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, int(width * self.scale))
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, int(height * self.scale))
+        return cap
+
+    def start(self):
+        """Inicia a leitura antecipada; retorna a própria fonte."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"fonte-{self.source}", daemon=True)
+            self._thread.start()
+        return self
+
+    def read(self, timeout=None):
+        """Próximo (índice, imagem), ou None no fim da fonte (ou se `timeout` esgotar)."""
+        if self._thread is None:
+            self.start()
+        with self._cond:
+            while True:
+                if not self._cond.wait_for(lambda: self._items or self._closed, timeout):
+                    return None
+                if not self._items:
+                    return None
+                generation, index, image = self._items.popleft()
+                self._cond.notify_all()
+                if generation == self._generation:
+                    return index, image
+
+    def seek(self, index):
+        """Pula para o frame `index` (arquivos): os próximos `read()` começam nele."""
+        with self._cond:
+            self._seek_to = index
+            self._generation += 1
+            self._items.clear()
+            self._cond.notify_all()
+
+    @property
+    def finished(self):
+        with self._cond:
+            return self._closed and not self._items
+
+    def stats(self):
+        return {"decoded": self.decoded, "skipped": self.skipped, "dropped": self.dropped,
+                "reconnects": self.reconnects}
+
+    def _put(self, generation, index, image):
+        with self._cond:
+            if self.drop:
+                if len(self._items) >= self.read_ahead:
+                    self._items.popleft()
+                    self.dropped += 1
+            else:
+                self._cond.wait_for(lambda: len(self._items) < self.read_ahead or self._stop_event.is_set()
+                                    or generation != self._generation)
+            if generation == self._generation and not self._stop_event.is_set():
+                self._items.append((generation, index, image))
+                self._cond.notify_all()
+
+    def _run(self):
+        index = 0
+        if self.start_frame:
+            exact_seek(self.cap, self.start_frame)
+            index = self.start_frame
+        backoff = BACKOFF_START
+        while not self._stop_event.is_set():
+            with self._cond:
+                generation, seek_to, self._seek_to = self._generation, self._seek_to, None
+            if seek_to is not None:
+                exact_seek(self.cap, seek_to)
+                index = seek_to
+
+            if self.end is not None and index >= self.end:
+                break
+            if index % self.stride:
+                # Fora do passo: avançar o decodificador sem converter o frame
+                ok = self.cap.grab()
+                self.skipped += ok
+            else:
+                start = time.perf_counter()
+                ok, image = self.cap.read()
+                if ok:
+                    if self.scale and self.kind != "device":
+                        image = cv2.resize(image, self.size, interpolation=cv2.INTER_AREA)
+                    if self.metrics:
+                        self.metrics.observe(self.stage, time.perf_counter() - start)
+                    self.decoded += 1
+                    self._put(generation, index, image)
+            if ok:
+                index += 1
+                backoff = BACKOFF_START
+                continue
+
+            if self.kind == "file":
+                if not self.loop or index == 0:
+                    break
+                # Fim do arquivo: voltar ao início
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                index = 0
+            elif self.reconnect:
+                # Queda do stream ou da câmera: reabrir com espera crescente
+                print(f"Fonte {self.source} sem frames; reconectando em {backoff:.1f}s")
+                self.cap.release()
+                if self._stop_event.wait(backoff):
+                    break
+                backoff = min(backoff * 2, BACKOFF_MAX)
+                self.cap = self._open()
+                if self.cap.isOpened():
+                    self.reconnects += 1
+            else:
+                break
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def stop(self):
+        """Para a leitura e libera a captura."""
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        self.cap.release()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+def serve_mjpeg(video, port=8090, fps=None, host="127.0.0.1"):
+    """Publica `video` em laço como stream MJPEG em http://host:port/stream.mjpg (substituto local de RTSP)."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/stream.mjpg":
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+            self.end_headers()
+            cap = cv2.VideoCapture(video)
+            delay = 1 / (fps or cap.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS)
+            try:
+                while True:
+                    ok, frame = cap.read()
+                    if not ok:
+                        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                        continue
+                    jpeg = cv2.imencode(".jpg", frame)[1].tobytes()
+                    self.wfile.write(b"--frame\r\nContent-Type: image/jpeg\r\n"
+                                     + f"Content-Length: {len(jpeg)}\r\n\r\n".encode() + jpeg + b"\r\n")
+                    time.sleep(delay)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            finally:
+                cap.release()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f"Stream em http://{host}:{port}/stream.mjpg (Ctrl+C para parar)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+def probe(source, frames=300, stride=1, scale=None):
+    """Lê `frames` frames da fonte e mostra a taxa de entrega e os contadores."""
+    reader = FrameSource(parse_source(source), stride=stride, scale=scale)
+    if not reader.opened:
+        raise SystemExit(f"Erro ao abrir a fonte de vídeo: {source}")
+    start = time.perf_counter()
+    received = 0
+    while received < frames:
+        item = reader.read(timeout=BACKOFF_MAX + 5)
+        if item is None:
+            break
+        received += 1
+    elapsed = time.perf_counter() - start
+    reader.stop()
+    print(f"{received} frames em {elapsed:.1f}s ({received / elapsed if elapsed else 0:.1f} frames/s), "
+          f"{reader.size[0]}x{reader.size[1]} · {reader.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fontes de frames: stream local de teste e medição de leitura.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve = subparsers.add_parser("serve", help="Publica um vídeo como stream MJPEG local.")
+    serve.add_argument("video")
+    serve.add_argument("--port", type=int, default=8090)
+    serve.add_argument("--fps", type=float)
+    check = subparsers.add_parser("probe", help="Lê frames de uma fonte e mostra os contadores.")
+    check.add_argument("source", help="Arquivo, índice de dispositivo ou URL.")
+    check.add_argument("--frames", type=int, default=300)
+    check.add_argument("--stride", type=int, default=1)
+    check.add_argument("--scale", type=float)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve_mjpeg(args.video, args.port, args.fps)
+    else:
+        probe(args.source, args.frames, args.stride, args.scale)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""Workers de inferência de longa duração para o app Streamlit.
+
+O script do Streamlit é reexecutado a cada interação, então ele não pode ser
+dono do laço de vídeo. Cada combinação (fonte, modelo, backend, confiança e
+filtro de movimento, FPS alvo ou rastreamento) tem um único worker em segundo plano, compartilhado por
+todas as sessões; a página apenas consulta o último frame anotado e as
+estatísticas. Um worker
+sem consultas por `IDLE_TIMEOUT` segundos se encerra sozinho.
+"""
+import os
+import threading
+import time
+
+import cv2
+
+from adaptive import QualityController, build_ladder
+from detection_store import open_store
+from frame_source import FrameSource
+from metrics import StageMetrics, profiler_from_env
+from model_registry import registry
+from motion_gate import MotionGate, reuse_results
+from pipeline import Pipeline
+from renderer import Renderer
+from result_cache import result_cache
+from tracking import KeyframeTracker
+
+IDLE_TIMEOUT = 30.0  # Segundos sem nenhuma sessão consultando antes de parar
+
+
+class InferenceWorker(threading.Thread):
+    """Captura e inferência contínuas de uma fonte, publicando só o último frame."""
+
+    def __init__(self, source, model_path, backend='pytorch', conf=0.25, gate_threshold=None, target_fps=None,
+                 keyframe_interval=None):
+        super().__init__(name=f"inferencia-{source}", daemon=True)
+        self.source = source
+        self.model_path = model_path
+        self.backend = backend
+        self.conf = conf
+        self.gate = MotionGate(threshold=gate_threshold) if gate_threshold is not None else None
+        self.tracker = KeyframeTracker(keyframe_interval) if keyframe_interval else None
+        self.controller = None
+        if target_fps:
+            ladder = build_ladder(os.path.dirname(model_path) or 'weights')
+            self.controller = QualityController.for_fps(ladder, target_fps)
+        self.model = None
+        self.model_key = None
+        self.imgsz = None
+        self.error = None
+        self.metrics = StageMetrics()  # Latência por estágio, consultada pela página
+        self.profiler = profiler_from_env()
+        self._lock = threading.Lock()
+        self._latest = None
+        self._stats = {'fps': 0.0, 'frames': 0, 'count': 0}
+        self._last_polled = time.monotonic()
+        self._run_flag = True
+
+    def run(self):
+        try:
+            if self.controller:
+                # Começar já no ponto de operação inicial do controle adaptativo
+                point = self.controller.current
+                self.model, self.imgsz = registry.get(point.weights), point.imgsz
+                self.model_key = (point.weights, 'pytorch')
+                self.controller.applied()
+            else:
+                self.model = registry.get(self.model_path, self.backend)
+                self.model_key = (self.model_path, self.backend)
+        except Exception as exc:
+            # Sem isso a thread morre calada e a página fica em "Carregando o modelo..."
+            self.error = f"Erro ao carregar o modelo: {exc}"
+            return
+
+        # O vídeo reinicia ao chegar ao fim: as sessões podem entrar a qualquer momento
+        source = FrameSource(self.source, loop=True, metrics=self.metrics)
+        if not source.opened:
+            self.error = f"Erro ao abrir a fonte de vídeo: {self.source}"
+            source.stop()
+            return
+        fps = source.fps
+
+        last_results = None
+        cache, cache_config = None, None
+
+        def infer(frame):
+            if self.profiler:
+                self.profiler.step()
+            if self.tracker is None:
+                return detect(frame)
+            # Rastreamento: detector só nos quadros-chave, caixas propagadas nos demais frames
+            names = self.model.names
+            if self.tracker.needs_keyframe():
+                detect(frame)
+                self.tracker.update(frame.results[0].boxes.data.cpu().numpy(), frame.image.shape)
+            else:
+                self.tracker.propagate(frame.image.shape)
+            frame.results = [self.tracker.result(frame.image, names)]
+            return frame
+
+        def detect(frame):
+            nonlocal last_results, cache, cache_config
+            model, imgsz, model_key = self.model, self.imgsz, self.model_key
+            frame.extra["model"] = model_key[0]  # A anotação grava cada modelo na sua gravação
+            if (model_key, imgsz) != cache_config:
+                # Entrada do cache do modelo atual; reaberta quando o controle adaptativo troca o modelo
+                if cache:
+                    cache.close()
+                cache = result_cache.open(self.source, model_key[0], model.names, fps, self.conf, imgsz, model_key[1])
+                cache_config = (model_key, imgsz)
+            hit = cache.lookup(frame.index, frame.image) if cache else None
+            if hit is not None:
+                # Frame já processado por este modelo: só desenhar
+                frame.results = last_results = [hit]
+                return frame
+            if self.gate and not self.gate.should_infer(frame.image) and last_results is not None:
+                # Cena parada: reaproveitar as detecções anteriores
+                frame.results = reuse_results(last_results, frame.image)
+                return frame
+            start = time.perf_counter()
+            if imgsz:
+                frame.results = model.predict(frame.image, conf=self.conf, imgsz=imgsz, verbose=False)
+            else:
+                frame.results = model.predict(frame.image, conf=self.conf, verbose=False)
+            last_results = frame.results
+            elapsed = time.perf_counter() - start
+            if cache:
+                cache.store(frame.index, frame.timestamp, frame.results[0])
+            if self.gate:
+                self.gate.record_inference(elapsed)
+            if self.controller:
+                point = self.controller.record(elapsed)
+                if point:
+                    self._apply_operating_point(point)
+            return frame
+
+        renderer = Renderer()  # Anel de buffers próprio desta thread de anotação
+        store = store_model = None
+
+        def annotate(frame):
+            nonlocal store, store_model
+            # Converter para RGB uma única vez aqui, não em cada sessão
+            frame.annotated = cv2.cvtColor(renderer.render_result(frame.image, frame.results[0]), cv2.COLOR_BGR2RGB)
+            frame.count = len(frame.results[0].boxes)
+            # Frames só do rastreador continuam na gravação do último modelo
+            model_path = frame.extra.get("model", store_model or self.model_key[0])
+            if model_path != store_model:
+                # Reaberta quando o controle adaptativo troca o modelo, como a entrada do cache
+                if store:
+                    store.close()
+                store = open_store(self.source, model_path, self.model.names, fps,
+                                   source=str(self.source), conf=self.conf)
+                store_model = model_path
+            store.append_result(frame.index, frame.timestamp, frame.results[0])
+            return frame
+
+        pipeline = Pipeline(source, infer, annotate, paced=source.kind == "file", metrics=self.metrics)
+        pipeline.start()
+        prev_time = time.monotonic()
+        while self._run_flag and not pipeline.finished:
+            if time.monotonic() - self._last_polled > IDLE_TIMEOUT:
+                break
+            frame = pipeline.get(timeout=0.1)
+            if frame is None:
+                continue
+            curr_time = time.monotonic()
+            with self._lock:
+                self._latest = frame
+                instant_fps = 1 / (curr_time - prev_time + 1e-6)
+                self._stats['fps'] = 0.9 * self._stats['fps'] + 0.1 * instant_fps
+                self._stats['frames'] += 1
+                self._stats['count'] = frame.count
+                self._stats['dropped'] = pipeline.dropped()
+                if self.gate:
+                    self._stats['skipped_fraction'] = self.gate.summary()['skipped_fraction']
+                if self.controller:
+                    self._stats['operating_point'] = str(self.controller.current)
+                if cache:
+                    self._stats['cache_hit_rate'] = cache.summary()['hit_rate']
+                if self.tracker:
+                    self._stats['unique'] = self.tracker.unique_count
+                    self._stats['keyframe_fraction'] = self.tracker.keyframes / max(self.tracker.frames, 1)
+            prev_time = curr_time
+        pipeline.stop()
+        if store:
+            store.close()
+        if cache:
+            cache.close()
+        if self.profiler:
+            self.profiler.close()
+        if self.gate:
+            self.gate.log()
+
+    def _apply_operating_point(self, point):
+        # Carregar em segundo plano: a captura segue com o modelo atual até a troca
+        def set_model(model):
+            if self.controller.current == point:
+                self.model, self.imgsz, self.model_key = model, point.imgsz, (point.weights, 'pytorch')
+                self.controller.applied()
+
+        def report_error(exc):
+            # Sem isso o controle fica esperando a troca para sempre e para de se adaptar
+            with self._lock:
+                self._stats['load_error'] = f"Falha ao carregar {os.path.basename(point.weights)}: {exc}"
+            retry = self.controller.failed(point)
+            if retry:
+                self._apply_operating_point(retry)
+
+        registry.preload(point.weights, callback=set_model, on_error=report_error)
+
+    def latest(self):
+        """Último frame processado (ou None) e uma cópia das estatísticas."""
+        self._last_polled = time.monotonic()
+        with self._lock:
+            return self._latest, dict(self._stats)
+
+    def stop(self):
+        self._run_flag = False
+
+
+_workers = {}
+_workers_lock = threading.Lock()
+
+
+def get_worker(source, model_path, backend='pytorch', conf=0.25, gate_threshold=None, target_fps=None,
+               keyframe_interval=None):
+    """Retorna o worker da combinação, iniciando um novo se não houver um ativo."""
+    if gate_threshold is not None:
+        gate_threshold = round(gate_threshold, 3)
+    key = (source, model_path, backend, round(conf, 2), gate_threshold, target_fps, keyframe_interval)
+    with _workers_lock:
+        worker = _workers.get(key)
+        if worker is None or not worker.is_alive():
+            worker = InferenceWorker(*key)
+            worker.start()
+            _workers[key] = worker
+        return worker
@@ -0,0 +1,185 @@
+"""Caminho enxuto de inferência para o imgsz fixo dos nossos modelos.
+
+Cada `model(frame)` do Ultralytics refaz a montagem do letterbox, aloca um
+tensor novo, converte BGR para RGB, normaliza e monta objetos `Results`. Para
+uma sequência de frames do mesmo tamanho isso é trabalho repetido. Aqui:
+
+- a transformação do letterbox (escala, tamanho redimensionado e bordas) é
+  calculada uma vez por resolução de entrada;
+- o frame é redimensionado num buffer reaproveitado e copiado direto para a
+  região útil do tensor de entrada, cuja borda (cor 114) é preenchida uma
+  única vez; BGR→RGB, HWC→CHW e a conversão para float vão numa única cópia
+  vetorizada, e a normalização escreve num tensor de saída pré-alocado;
+- a saída são arrays NumPy (caixas xyxy, confianças, classes), sem `Results`.
+
+A rede é a mesma que o predictor do Ultralytics já preparou (pesos fundidos
+ou backend exportado), e o pós-processamento usa a mesma NMS e o mesmo
+reescalonamento das caixas, então as detecções são idênticas às do caminho
+normal. Para conferir num vídeo e medir o ganho:
+
+    python lean_predictor.py --weights weights/medium.pt --video videos/exemplo.mp4 --frames 200
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+IMGSZ = 512  # imgsz usado no treino (antigo/runs/train/*/args.yaml)
+PAD_VALUE = 114  # Cor da borda do LetterBox do Ultralytics
+
+
+def letterbox_transform(shape, imgsz=IMGSZ, stride=32, auto=True):
+    """Mesmas contas do `LetterBox` do Ultralytics para um frame de formato `shape`.
+
+    Retorna ((largura, altura) redimensionada, (topo, esquerda), (altura, largura) da entrada do modelo).
+    Com `auto` (modelos PyTorch), a borda só completa até o múltiplo de `stride`.
+    """
+    height, width = shape[:2]
+    r = min(imgsz / height, imgsz / width)
+    new_w, new_h = int(round(width * r)), int(round(height * r))
+    dw, dh = imgsz - new_w, imgsz - new_h
+    if auto:
+        dw, dh = dw % stride, dh % stride
+    dw, dh = dw / 2, dh / 2
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    return (new_w, new_h), (top, left), (new_h + top + bottom, new_w + left + right)
+
+
+class LeanPredictor:
+    """Detecção frame a frame com buffers reaproveitados; retorna (caixas, confianças, classes).
+
+    Não é thread-safe: use um por laço de inferência.
+    """
+
+    def __init__(self, model, imgsz=IMGSZ, conf=0.25):
+        import torch
+
+        if getattr(model, "predictor", None) is None:
+            # O predictor (e a rede que ele prepara) só existe depois da primeira chamada
+            model(np.zeros((imgsz, imgsz, 3), dtype=np.uint8), imgsz=imgsz, conf=conf, verbose=False)
+        predictor = model.predictor
+        self.net = predictor.model  # AutoBackend já preparado pelo Ultralytics
+        self.device = predictor.device
+        self.dtype = torch.float16 if self.net.fp16 else torch.float32
+        self.names = model.names
+        self.imgsz = imgsz
+        self.conf = conf
+        self.iou = predictor.args.iou
+        self.max_det = predictor.args.max_det
+        self.agnostic = predictor.args.agnostic_nms
+        self._shape = None  # Formato do frame para o qual os buffers foram montados
+
+    def _prepare(self, shape):
+        import torch
+
+        size, (top, left), (height, width) = letterbox_transform(shape, self.imgsz, self.net.stride, self.net.pt)
+        self._size = size
+        self._resize = size != (shape[1], shape[0])
+        self._resized = np.empty((size[1], size[0], 3), dtype=np.uint8)
+        # Entrada em float ainda sem normalizar: a borda fica pronta de uma vez
+        staging = np.full((1, 3, height, width), PAD_VALUE, dtype=np.float16 if self.net.fp16 else np.float32)
+        self._window = staging[0, :, top:top + size[1], left:left + size[0]]
+        self._staging = torch.from_numpy(staging)
+        if self.device.type != "cpu":
+            self._staging = self._staging.pin_memory()
+            self._window = self._staging.numpy()[0, :, top:top + size[1], left:left + size[0]]
+        self._input = torch.empty((1, 3, height, width), dtype=self.dtype, device=self.device)
+        self._shape = shape
+
+    def preprocess(self, frame):
+        """Letterbox do frame BGR direto no tensor de entrada reaproveitado."""
+        import torch
+
+        if frame.shape != self._shape:
+            self._prepare(frame.shape)
+        image = cv2.resize(frame, self._size, dst=self._resized, interpolation=cv2.INTER_LINEAR) \
+            if self._resize else frame
+        # BGR→RGB, HWC→CHW e uint8→float numa única cópia
+        np.copyto(self._window, image[..., ::-1].transpose(2, 0, 1))
+        if self.device.type == "cpu":
+            torch.div(self._staging, 255, out=self._input)
+        else:
+            self._input.copy_(self._staging, non_blocking=True)
+            self._input.div_(255)
+        return self._input
+
+    def inference(self, tensor):
+        return self.net(tensor)
+
+    def postprocess(self, preds, shape):
+        """Mesma NMS e reescalonamento do `DetectionPredictor`, com saída em NumPy."""
+        from ultralytics.utils import ops
+
+        pred = ops.non_max_suppression(preds, self.conf, self.iou, agnostic=self.agnostic, max_det=self.max_det)[0]
+        pred[:, :4] = ops.scale_boxes(self._input.shape[2:], pred[:, :4], shape)
+        data = pred.cpu().numpy()
+        return data[:, :4], data[:, 4], data[:, 5].astype(int)
+
+    def predict(self, frame):
+        """(caixas xyxy, confianças, classes) do frame BGR, como `result_arrays(model(frame)[0])`."""
+        import torch
+
+        with torch.inference_mode():
+            preds = self.inference(self.preprocess(frame))
+            return self.postprocess(preds, frame.shape)
+
+    __call__ = predict
+
+
+def parity(weights, video, frames=200, backend="pytorch", conf=0.25, imgsz=IMGSZ):
+    """Compara o caminho enxuto com `model(frame)` em `frames` frames do vídeo e mede os dois."""
+    import backends
+    from renderer import result_arrays
+
+    model = backends.load(weights, backend, imgsz)
+    lean = LeanPredictor(model, imgsz, conf)
+    cap = cv2.VideoCapture(video)
+    identical = total = 0
+    max_delta = 0.0
+    normal_seconds = lean_seconds = 0.0
+    while total < frames:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        start = time.perf_counter()
+        expected = result_arrays(model(frame, imgsz=imgsz, conf=conf, verbose=False)[0])
+        normal_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        got = lean.predict(frame)
+        lean_seconds += time.perf_counter() - start
+
+        total += 1
+        if all(a.shape == b.shape for a, b in zip(expected, got)):
+            if all(np.array_equal(a, b) for a, b in zip(expected, got)):
+                identical += 1
+            elif len(got[0]):
+                max_delta = max(max_delta, float(np.abs(expected[0] - got[0]).max()),
+                                float(np.abs(expected[1] - got[1]).max()))
+        else:
+            max_delta = float("inf")
+    cap.release()
+    if not total:
+        raise SystemExit(f"Erro ao ler o vídeo: {video}")
+    print(f"{identical}/{total} frames com detecções idênticas (maior diferença: {max_delta:g})")
+    print(f"model(frame): {normal_seconds / total * 1000:.1f} ms/frame · enxuto: {lean_seconds / total * 1000:.1f} ms/frame "
+          f"({normal_seconds / lean_seconds if lean_seconds else 0:.2f}x)")
+    return identical == total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Confere e mede o caminho enxuto de inferência.")
+    parser.add_argument("--weights", default="weights/medium.pt")
+    parser.add_argument("--backend", default="pytorch", help="pytorch, onnx, openvino...")
+    parser.add_argument("--video", default="videos/exemplo.mp4")
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--imgsz", type=int, default=IMGSZ)
+    args = parser.parse_args()
+    if not parity(args.weights, args.video, args.frames, args.backend, args.conf, args.imgsz):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
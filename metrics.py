@@ -0,0 +1,272 @@
+"""Métricas de latência por estágio dos laços de vídeo.
+
+Cada estágio (captura, inferência, anotação, exibição...) grava suas durações
+num histograma circular de tamanho fixo: registrar custa uma escrita num array
+pré-alocado, e os percentis só são calculados quando alguém pede um resumo.
+Os mesmos histogramas alimentam a sobreposição da interface, o endpoint em
+formato Prometheus e o log periódico em JSON.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+HISTOGRAM_SIZE = 256  # Amostras mantidas por estágio
+QUANTILES = (0.5, 0.95, 0.99)
+PROFILE_ENV = "AGUAVIVA_PROFILE_FRAMES"  # Liga o profiler nas interfaces (número de frames)
+PROFILERS = ("cprofile", "torch")
+_PROCESS_START = time.perf_counter()  # Aproximação do início do processo: os pontos de entrada importam este módulo cedo
+
+
+class RollingHistogram:
+    """Últimas `size` durações (s) de um estágio, mais contagem e soma acumuladas."""
+
+    def __init__(self, size=HISTOGRAM_SIZE):
+        self._samples = np.zeros(size, dtype=np.float64)
+        self._next = 0
+        self._filled = 0
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples[self._next] = seconds
+            self._next = (self._next + 1) % len(self._samples)
+            self._filled = min(self._filled + 1, len(self._samples))
+            self.count += 1
+            self.total += seconds
+
+    def quantiles(self, qs=QUANTILES):
+        """Percentis da janela atual (zeros enquanto não houver amostras)."""
+        with self._lock:
+            window = self._samples[:self._filled].copy()
+        if not len(window):
+            return [0.0] * len(qs)
+        return list(np.quantile(window, qs))
+
+    def mean(self):
+        with self._lock:
+            return float(self._samples[:self._filled].mean()) if self._filled else 0.0
+
+
+class StageMetrics:
+    """Conjunto de histogramas por estágio, seguro para várias threads."""
+
+    def __init__(self, size=HISTOGRAM_SIZE):
+        self.size = size
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name):
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, RollingHistogram(self.size))
+        return histogram
+
+    def observe(self, name, seconds):
+        self.histogram(name).observe(seconds)
+
+    @contextmanager
+    def time(self, name):
+        """Cronometra o bloco como uma amostra do estágio `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self):
+        """Resumo em milissegundos: {estágio: {p50, p95, p99, mean, count}}."""
+        summary = {}
+        for name, histogram in list(self._histograms.items()):
+            p50, p95, p99 = histogram.quantiles()
+            summary[name] = {"p50": p50 * 1000, "p95": p95 * 1000, "p99": p99 * 1000,
+                             "mean": histogram.mean() * 1000, "count": histogram.count}
+        return summary
+
+    def lines(self):
+        """Uma linha por estágio, para a sobreposição da interface."""
+        return [f"{name}: p50 {s['p50']:.1f} ms · p95 {s['p95']:.1f} ms"
+                for name, s in self.snapshot().items()]
+
+    def prometheus(self, labels=None, prefix="aguaviva_stage_seconds"):
+        """Histogramas no formato de texto do Prometheus (tipo summary)."""
+        extra = "".join(f',{key}="{value}"' for key, value in (labels or {}).items())
+        out = []
+        for name, histogram in list(self._histograms.items()):
+            base = f'stage="{name}"{extra}'
+            for q, value in zip(QUANTILES, histogram.quantiles()):
+                out.append(f'{prefix}{{{base},quantile="{q}"}} {value:.6f}')
+            out.append(f"{prefix}_sum{{{base}}} {histogram.total:.6f}")
+            out.append(f"{prefix}_count{{{base}}} {histogram.count}")
+        return "\n".join(out)
+
+
+def prometheus_text(sources, prefix="aguaviva_stage_seconds"):
+    """Junta várias métricas num único texto; `sources` é [(rótulos, StageMetrics)]."""
+    body = [metrics.prometheus(labels, prefix) for labels, metrics in sources]
+    header = f"# HELP {prefix} Latência por estágio do pipeline de vídeo.\n# TYPE {prefix} summary\n"
+    return header + "\n".join(part for part in body if part) + "\n"
+
+
+class MetricsServer:
+    """Servidor HTTP mínimo que expõe `/metrics` em formato Prometheus."""
+
+    def __init__(self, metrics, port=9100, host="0.0.0.0"):
+        def render():
+            return prometheus_text([({}, metrics)])
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # Sem uma linha de log por coleta
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metricas", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        print(f"Métricas em http://localhost:{self._server.server_address[1]}/metrics")
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class MetricsLog(threading.Thread):
+    """Acrescenta um resumo JSON por linha a `path` a cada `interval` segundos."""
+
+    def __init__(self, metrics, path, interval=10.0):
+        super().__init__(name="log-metricas", daemon=True)
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def write(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"time": time.time(), "stages": self.metrics.snapshot()}) + "\n")
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.write()
+
+    def stop(self):
+        """Para o log gravando um último resumo."""
+        self._stop_event.set()
+        self.join()
+        self.write()
+
+
+class StartupTimer:
+    """Marcos da inicialização (primeiro frame, modelo pronto, primeira detecção).
+
+    Cada marco é gravado só na primeira vez, em segundos desde o início do
+    processo, e impresso no console.
+    """
+
+    def __init__(self, start=None):
+        self.start = _PROCESS_START if start is None else start
+        self.marks = {}
+        self._lock = threading.Lock()
+
+    def mark(self, name):
+        """Registra o marco `name` (se ainda não registrado) e retorna os segundos desde o início."""
+        with self._lock:
+            if name in self.marks:
+                return self.marks[name]
+            elapsed = self.marks[name] = time.perf_counter() - self.start
+        print(f"Inicialização: {name} em {elapsed:.2f} s")
+        return elapsed
+
+    def lines(self):
+        return [f"{name}: {seconds:.2f} s" for name, seconds in self.marks.items()]
+
+    def prometheus(self, prefix="aguaviva_startup_seconds"):
+        """Marcos já registrados, um gauge por marco."""
+        return "".join(f'{prefix}{{mark="{name}"}} {seconds:.3f}\n' for name, seconds in list(self.marks.items()))
+
+
+startup = StartupTimer()
+
+
+class FrameProfiler:
+    """Perfila os próximos `frames` frames (contados por `step()`) e grava o resultado.
+
+    `cprofile` só enxerga a thread em que foi ligado, por isso `step()` deve
+    ser chamado na thread que interessa (em geral a de inferência). `torch`
+    grava um trace do Chrome (abrir em chrome://tracing ou no Perfetto).
+    """
+
+    def __init__(self, frames, output=None, kind="cprofile"):
+        if kind not in PROFILERS:
+            raise ValueError(f"Profiler desconhecido: {kind} (use {', '.join(PROFILERS)})")
+        self.frames = frames
+        self.kind = kind
+        self.output = output or ("perfil.prof" if kind == "cprofile" else "perfil.json")
+        self.done = False
+        self._seen = 0
+        self._profiler = None
+
+    def step(self, frames=1):
+        """Marca o início de `frames` frames (um lote); liga o profiler no primeiro e grava após o último."""
+        if self.done:
+            return
+        if self._profiler is None:
+            self._start()
+        elif self.kind == "torch":
+            self._profiler.step()
+        self._seen += frames
+        if self._seen > self.frames:
+            self._finish()
+
+    def _start(self):
+        if self.kind == "cprofile":
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            import torch.profiler
+            self._profiler = torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU],
+                                                    record_shapes=True)
+            self._profiler.__enter__()
+
+    def _finish(self):
+        self.done = True
+        if self.kind == "cprofile":
+            self._profiler.disable()
+            self._profiler.dump_stats(self.output)
+        else:
+            self._profiler.__exit__(None, None, None)
+            self._profiler.export_chrome_trace(self.output)
+        print(f"Perfil de {self.frames} frames gravado em {self.output}")
+
+    def close(self):
+        """Grava o perfil parcial se a fonte acabar antes de `frames`."""
+        if self._profiler is not None and not self.done:
+            self._finish()
+
+
+def profiler_from_env():
+    """Profiler pedido por variável de ambiente (AGUAVIVA_PROFILE_FRAMES=N[:torch])."""
+    value = os.environ.get(PROFILE_ENV)
+    if not value:
+        return None
+    frames, _, kind = value.partition(":")
+    return FrameProfiler(int(frames), kind=kind or "cprofile")
@@ -0,0 +1,169 @@
+"""Registro de modelos compartilhado pelo processo.
+
+Cada arquivo de pesos é carregado uma única vez, aquecido com uma inferência
+de teste e mantido em memória enquanto estiver entre os N usados mais
+recentemente e dentro do orçamento de memória. A interface, o Streamlit e o
+`rapido.py` usam o mesmo registro, então trocar de fonte ou de modelo não
+paga o carregamento de novo.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import backends
+
+MAX_MODELS = 3  # Modelos mantidos em memória: o escolhido mais o nano e o large da cascata
+MEMORY_BUDGET_MB = 1024  # Orçamento aproximado para os pesos residentes
+WARMUP_SIZE = 512  # imgsz usado no treino (antigo/runs/train/*/args.yaml)
+
+
+def model_size_bytes(model, path):
+    """Estimativa da memória ocupada pelos pesos de um modelo carregado."""
+    try:
+        return sum(p.numel() * p.element_size() for p in model.model.parameters())
+    except (AttributeError, TypeError):
+        # Backends exportados: tamanho do arquivo (ou da pasta, no OpenVINO)
+        if os.path.isdir(path):
+            return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+        return os.path.getsize(path)
+
+
+class SharedModel:
+    """Modelo do registro, compartilhado entre threads com uma chamada por vez.
+
+    O predictor do Ultralytics reescreve `predictor.args` (conf, imgsz...) a
+    cada chamada e não é thread-safe: sem a trava, o `conf` de uma fonte vaza
+    para a chamada de outra. Os demais atributos (`names`, `predictor`...)
+    são os do modelo original.
+    """
+
+    def __init__(self, model):
+        self._wrapped = model
+        self._lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        with self._lock:
+            return self._wrapped(*args, **kwargs)
+
+    def predict(self, *args, **kwargs):
+        with self._lock:
+            return self._wrapped.predict(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._wrapped, name)
+
+
+class ModelRegistry:
+    """Cache LRU de modelos YOLO com aquecimento e limite de memória."""
+
+    def __init__(self, max_models=MAX_MODELS, memory_budget_mb=MEMORY_BUDGET_MB, warmup_size=WARMUP_SIZE):
+        self.max_models = max_models
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.warmup_size = warmup_size
+        self._models = OrderedDict()  # (caminho, backend) -> (modelo, bytes)
+        self._lock = threading.Lock()
+        self._loading = {}  # (caminho, backend) -> Lock, evita carregar o mesmo modelo duas vezes
+        self._errors = {}  # (caminho, backend) -> exceção do último preload que falhou
+
+    @staticmethod
+    def _key(path, backend):
+        return os.path.abspath(path), backend
+
+    def get(self, path, backend="pytorch", progress=None):
+        """Retorna o modelo de `path` no `backend`, carregando e aquecendo se necessário.
+
+        `progress(etapa)` é chamado no início do carregamento ("carregando") e
+        do aquecimento ("aquecendo"), para indicadores de progresso; um modelo
+        já residente volta direto, sem chamadas.
+        """
+        key = self._key(path, backend)
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key][0]
+            load_lock = self._loading.setdefault(key, threading.Lock())
+
+        with load_lock:
+            # Outro thread pode ter terminado o carregamento enquanto esperávamos
+            with self._lock:
+                if key in self._models:
+                    self._models.move_to_end(key)
+                    return self._models[key][0]
+
+            if progress:
+                progress("carregando")
+            model = backends.load(path, backend)
+            if progress:
+                progress("aquecendo")
+            self.warmup(model)
+            size = model_size_bytes(model, model.overrides.get("model", path))
+            model = SharedModel(model)
+
+            with self._lock:
+                self._models[key] = (model, size)
+                self._loading.pop(key, None)
+                self._evict()
+            return model
+
+    def warmup(self, model):
+        """Executa uma inferência de teste para alocar buffers e compilar kernels."""
+        dummy = np.zeros((self.warmup_size, self.warmup_size, 3), dtype=np.uint8)
+        model(dummy, imgsz=self.warmup_size, verbose=False)
+
+    def preload(self, path, callback=None, backend="pytorch", progress=None, on_error=None):
+        """Carrega `path` em segundo plano; `callback(modelo)` é chamado ao terminar.
+
+        Se o carregamento falhar (pacote do backend ausente, exportação com
+        erro, variante INT8 não publicada), a exceção não morre na thread:
+        fica em `load_error()`, é impressa, vai para `progress("erro: ...")`
+        e para `on_error(exceção)`.
+        """
+        key = self._key(path, backend)
+
+        def load():
+            try:
+                model = self.get(path, backend, progress)
+            except Exception as exc:
+                with self._lock:
+                    self._errors[key] = exc
+                    self._loading.pop(key, None)
+                print(f"Erro ao carregar {path} [{backend}]: {exc}")
+                if progress:
+                    progress(f"erro: {exc}")
+                if on_error:
+                    on_error(exc)
+                return
+            with self._lock:
+                self._errors.pop(key, None)
+            if callback:
+                callback(model)
+
+        thread = threading.Thread(target=load, name=f"preload-{os.path.basename(path)}", daemon=True)
+        thread.start()
+        return thread
+
+    def is_loaded(self, path, backend="pytorch"):
+        with self._lock:
+            return self._key(path, backend) in self._models
+
+    def load_error(self, path, backend="pytorch"):
+        """Exceção do último carregamento em segundo plano que falhou (ou None)."""
+        with self._lock:
+            return self._errors.get(self._key(path, backend))
+
+    def _evict(self):
+        # Sempre mantém o modelo mais recente, mesmo que ele sozinho estoure o orçamento
+        while len(self._models) > 1 and (
+            len(self._models) > self.max_models
+            or sum(size for _, size in self._models.values()) > self.memory_budget
+        ):
+            self._models.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+
+registry = ModelRegistry()
@@ -0,0 +1,99 @@
+"""Filtro de movimento na frente do detector.
+
+Em filmagens subaquáticas há longos trechos em que quase nada muda. O filtro
+compara uma versão reduzida em tons de cinza do frame com a do último frame
+que passou pelo detector (diferença absoluta média ou distância entre
+histogramas). Se a cena não mudou além do limiar, o detector é pulado e as
+detecções anteriores são reaproveitadas; a cada `refresh_every` frames a
+inferência é forçada.
+"""
+import time
+
+import cv2
+import numpy as np
+
+GATE_SIZE = (64, 36)  # Resolução reduzida usada na comparação
+GATE_METHODS = ("diff", "hist")
+
+
+class MotionGate:
+    """Decide, por frame, se vale a pena rodar o detector."""
+
+    def __init__(self, threshold=0.02, refresh_every=30, method="diff", size=GATE_SIZE):
+        if method not in GATE_METHODS:
+            raise ValueError(f"Método desconhecido: {method} (use {', '.join(GATE_METHODS)})")
+        self.threshold = threshold
+        self.refresh_every = refresh_every
+        self.method = method
+        self.size = size
+        self.frames = 0
+        self.skipped = 0
+        self.gate_seconds = 0.0
+        self.inference_seconds = 0.0
+        self.inferences = 0
+        self._reference = None
+        self._since_refresh = 0
+
+    def _signature(self, image):
+        small = cv2.resize(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), self.size, interpolation=cv2.INTER_AREA)
+        if self.method == "hist":
+            hist = cv2.calcHist([small], [0], None, [32], [0, 256])
+            return cv2.normalize(hist, hist).flatten()
+        return small
+
+    def _distance(self, signature):
+        if self.method == "hist":
+            return cv2.compareHist(self._reference, signature, cv2.HISTCMP_BHATTACHARYYA)
+        return float(np.mean(cv2.absdiff(self._reference, signature))) / 255.0
+
+    def should_infer(self, image):
+        """True se o frame deve passar pelo detector."""
+        start = time.perf_counter()
+        signature = self._signature(image)
+        self.frames += 1
+        self._since_refresh += 1
+        changed = (
+            self._reference is None
+            or self._since_refresh >= self.refresh_every
+            or self._distance(signature) > self.threshold
+        )
+        if changed:
+            # A referência é o último frame inferido, para que mudanças lentas se acumulem
+            self._reference = signature
+            self._since_refresh = 0
+        else:
+            self.skipped += 1
+        self.gate_seconds += time.perf_counter() - start
+        return changed
+
+    def record_inference(self, seconds):
+        """Registra a duração de uma inferência para estimar o tempo economizado."""
+        self.inferences += 1
+        self.inference_seconds += seconds
+
+    def summary(self):
+        """Fração de frames pulados e tempo de CPU economizado (estimado)."""
+        mean_inference = self.inference_seconds / self.inferences if self.inferences else 0.0
+        saved = self.skipped * mean_inference - self.gate_seconds
+        return {
+            "frames": self.frames,
+            "skipped": self.skipped,
+            "skipped_fraction": self.skipped / self.frames if self.frames else 0.0,
+            "saved_seconds": saved,
+        }
+
+    def log(self, prefix="Filtro de movimento"):
+        stats = self.summary()
+        print(f"{prefix}: {stats['skipped']}/{stats['frames']} frames pulados "
+              f"({stats['skipped_fraction']:.1%}), ~{stats['saved_seconds']:.1f}s de inferência economizados")
+
+
+def reuse_results(results, image):
+    """Reaproveita as detecções de `results` sobre um novo frame de mesmo tamanho."""
+    reused = []
+    for result in results:
+        copy = result.new()
+        copy.orig_img = image
+        copy.boxes = result.boxes
+        reused.append(copy)
+    return reused
@@ -0,0 +1,212 @@
+"""Pipeline de vídeo em estágios: captura, inferência e anotação.
+
+Cada estágio roda na sua própria thread e conversa com o seguinte por filas
+limitadas que descartam o frame mais antigo quando estão cheias. Assim o
+consumidor sempre recebe o frame mais recente disponível, e um estágio lento
+perde frames em vez de acumular atraso.
+"""
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+
+@dataclass
+class Frame:
+    """Frame que atravessa o pipeline junto com o resultado de cada estágio."""
+    index: int
+    timestamp: float  # Segundos no relógio da fonte
+    image: object
+    results: object = None
+    annotated: object = None
+    count: int = 0
+    extra: dict = field(default_factory=dict)
+    captured: float = field(default_factory=time.perf_counter)  # Instante da decodificação (perf_counter)
+
+
+class LatestQueue:
+    """Fila limitada que descarta o item mais antigo quando está cheia."""
+
+    def __init__(self, maxsize=1):
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.closed = False
+        self._items = deque()
+        self._cond = threading.Condition()
+
+    def put(self, item):
+        """Enfileira um item, descartando o mais antigo se necessário."""
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Retorna o próximo item, ou None se a fila fechar ou o tempo esgotar."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._items or self.closed, timeout)
+            return self._items.popleft() if self._items else None
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+    def close(self):
+        """Fecha a fila e acorda quem estiver esperando."""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class SourceClock:
+    """Cadencia a leitura pelo relógio da fonte em vez de um sleep fixo."""
+
+    # Atraso máximo (s) antes de ressincronizar com o relógio da fonte
+    MAX_LAG = 1.0
+
+    def __init__(self):
+        self._origin = None
+
+    def reset(self):
+        """Reinicia o relógio (por exemplo, ao voltar para o início do vídeo)."""
+        self._origin = None
+
+    def wait(self, timestamp):
+        """Dorme até o instante em que o frame `timestamp` deve ser exibido."""
+        now = time.monotonic()
+        if self._origin is None:
+            self._origin = now - timestamp
+        delay = self._origin + timestamp - now
+        if delay > 0:
+            time.sleep(delay)
+        elif delay < -self.MAX_LAG:
+            self._origin = now - timestamp
+
+
+class CaptureStage(threading.Thread):
+    """Estágio de captura: recebe os frames já decodificados pela `FrameSource` e publica o mais recente."""
+
+    def __init__(self, source, output, paced=True):
+        super().__init__(name="captura", daemon=True)
+        self.source = source
+        self.output = output
+        self.fps = source.fps
+        self.paced = paced
+        self.clock = SourceClock()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        last_index = -1
+        while not self._stop_event.is_set():
+            item = self.source.read(timeout=0.1)
+            if item is None:
+                if self.source.finished:
+                    break
+                continue
+            index, image = item
+            if index < last_index:
+                # A fonte voltou ao início do arquivo: reiniciar o relógio
+                self.clock.reset()
+            last_index = index
+
+            timestamp = index / self.fps
+            if self.paced:
+                self.clock.wait(timestamp)
+            self.output.put(Frame(index=index, timestamp=timestamp, image=image))
+        self.output.close()
+
+    def stop(self):
+        self._stop_event.set()
+        self.source.stop()
+
+
+class Stage(threading.Thread):
+    """Estágio genérico: consome da fila de entrada, processa e publica."""
+
+    def __init__(self, name, process, input, output, metrics=None):
+        super().__init__(name=name, daemon=True)
+        self.process = process
+        self.input = input
+        self.output = output
+        self.metrics = metrics
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            item = self.input.get(timeout=0.1)
+            if item is None:
+                if self.input.closed:
+                    break
+                continue
+            start = time.perf_counter()
+            item = self.process(item)
+            if self.metrics:
+                self.metrics.observe(self.name, time.perf_counter() - start)
+            self.output.put(item)
+        self.output.close()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class Pipeline:
+    """Encadeia captura → inferência → anotação com filas de frame mais recente.
+
+    `source` é uma `frame_source.FrameSource` (ainda não iniciada), que
+    decodifica na sua própria thread e é parada junto com o pipeline.
+    `infer` e `annotate` recebem e devolvem um `Frame`. O consumidor lê o
+    resultado final com `get()`; `dropped()` informa quantos frames cada
+    estágio deixou de processar por estar ocupado. Com `metrics` (um
+    `metrics.StageMetrics`), cada estágio registra quanto tempo levou por frame
+    (a decodificação é registrada pela própria fonte).
+    """
+
+    def __init__(self, source, infer, annotate, paced=True, depth=1, metrics=None):
+        self.metrics = metrics
+        self.source = source
+        self.frames = LatestQueue(depth)
+        self.detections = LatestQueue(depth)
+        self.rendered = LatestQueue(depth)
+        self.stages = [
+            CaptureStage(source, self.frames, paced=paced),
+            Stage("inferência", infer, self.frames, self.detections, metrics=metrics),
+            Stage("anotação", annotate, self.detections, self.rendered, metrics=metrics),
+        ]
+
+    def start(self):
+        self.source.start()
+        for stage in self.stages:
+            stage.start()
+
+    def stop(self):
+        """Para todos os estágios e aguarda o término das threads."""
+        for stage in self.stages:
+            stage.stop()
+        for queue in (self.frames, self.detections, self.rendered):
+            queue.close()
+        for stage in self.stages:
+            stage.join()
+
+    def get(self, timeout=None):
+        """Retorna o frame anotado mais recente (ou None)."""
+        frame = self.rendered.get(timeout)
+        if frame is not None and self.metrics:
+            # Da decodificação até a entrega ao consumidor, incluindo as esperas nas filas
+            self.metrics.observe("ponta a ponta", time.perf_counter() - frame.captured)
+        return frame
+
+    @property
+    def finished(self):
+        """Indica se a fonte terminou e todos os frames já foram consumidos."""
+        return self.rendered.closed and not len(self.rendered)
+
+    def dropped(self):
+        """Frames descartados na entrada de cada estágio."""
+        return {
+            "captura": self.source.dropped,
+            "inferência": self.frames.dropped,
+            "anotação": self.detections.dropped,
+            "exibição": self.rendered.dropped,
+        }
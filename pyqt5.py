@@ -1,88 +1,370 @@
 import sys
 import os
+import time
 import cv2
 import numpy as np
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QLabel, QPushButton, QFileDialog,
-    QWidget, QVBoxLayout, QHBoxLayout, QFrame, QMessageBox, QComboBox, QSizePolicy, QSpacerItem
+    QWidget, QVBoxLayout, QHBoxLayout, QFrame, QMessageBox, QComboBox, QSizePolicy, QSpacerItem, QCheckBox, QSpinBox,
+    QGridLayout, QInputDialog, QProgressBar
 )
 from PyQt5.QtGui import QImage, QPixmap, QFont, QPainter
-from PyQt5.QtCore import Qt, pyqtSignal, QThread, QSize
-
-from ultralytics import YOLO
+from PyQt5.QtCore import Qt, pyqtSignal, QThread, QSize, QTimer
+
+from adaptive import QualityController, build_ladder
+from backends import model_choices, parse_label
+from batch_scheduler import BatchScheduler
+from cascade import Cascade
+from clip_recorder import ClipRecorder, clip_prefix
+from detection_store import open_store
+from frame_source import FrameSource, parse_source
+from metrics import StageMetrics, profiler_from_env, startup
+from model_registry import registry
+from motion_gate import MotionGate, reuse_results
+from pipeline import Pipeline
+from renderer import Renderer
+from result_cache import result_cache
+from tracking import KeyframeTracker
+
+
+class DisplayBuffers:
+    """Anel de buffers pré-alocados com os frames já no tamanho de exibição."""
+
+    def __init__(self, size, count=3):
+        self.size = size  # (largura, altura) do QLabel de vídeo
+        self.count = count
+        self._ring = []
+        self._next = 0
+
+    def to_qimage(self, frame):
+        """Redimensiona o frame para o próximo buffer e o embrulha num QImage sem cópia."""
+        h, w = frame.shape[:2]
+        scale = min(self.size[0] / w, self.size[1] / h)
+        dsize = (max(1, int(w * scale)), max(1, int(h * scale)))
+        shape = (dsize[1], dsize[0], 3)
+        if not self._ring or self._ring[0].shape != shape:
+            self._ring = [np.empty(shape, dtype=np.uint8) for _ in range(self.count)]
+        buffer = self._ring[self._next]
+        self._next = (self._next + 1) % self.count
+
+        if dsize == (w, h):
+            np.copyto(buffer, frame)
+        else:
+            interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+            cv2.resize(frame, dsize, dst=buffer, interpolation=interpolation)
+        # BGR888 dispensa a conversão de cor; o buffer continua vivo no anel até ser pintado
+        return QImage(buffer.data, dsize[0], dsize[1], buffer.strides[0], QImage.Format_BGR888)
 
 
 class VideoThread(QThread):
-    change_pixmap_signal = pyqtSignal(np.ndarray)
+    change_pixmap_signal = pyqtSignal(QImage)
     update_count_signal = pyqtSignal(int)
-
-    def __init__(self, video_source=0, model_path='weights/medium.pt'):
+    update_drops_signal = pyqtSignal(dict)
+    operating_point_signal = pyqtSignal(str)
+    stats_signal = pyqtSignal(list)
+    model_status_signal = pyqtSignal(str)  # Etapa do carregamento do modelo: carregando, aquecendo, pronto, erro: ...
+    unique_count_signal = pyqtSignal(int)  # Itens únicos contados pelo rastreamento
+
+    def __init__(self, video_source=0, model_path='weights/medium.pt', backend='pytorch', display_size=(800, 500),
+                 scheduler=None, stream=None):
         super().__init__()
         self._run_flag = True
         self.video_source = video_source
         self.model_path = model_path
+        self.backend = backend
+        self.model = None
+        self.model_key = None  # (pesos, backend) do modelo em self.model, para a chave do cache
+        self.pipeline = None
         self.detect = False  # Flag para controlar a detecção
+        self.gate = None  # Filtro de movimento opcional na frente do detector
+        self.tracker = None  # Rastreamento com detecção só em quadros-chave
+        self.clip_threshold = None  # Detecções num frame que disparam a gravação de um trecho (None: desligado)
+        self.controller = None  # Controle adaptativo de qualidade (pesos e imgsz)
+        self.cascade = None  # Cascata nano → large (substitui o modelo escolhido enquanto ligada)
+        self.cascade_dir = None  # Pesos da cascata pedida (pode ainda estar carregando)
+        self.imgsz = None  # Tamanho de entrada imposto pelo controle adaptativo
+        self.display_size = display_size
+        self._frame_pending = False  # Último frame emitido ainda não foi pintado pela interface
+        self.display_skipped = 0
+        self.scheduler = scheduler  # Agendador em lote compartilhado com outras fontes (modo de várias câmeras)
+        self.stream = stream or str(video_source)
+        self.metrics = StageMetrics()  # Latência por estágio (captura, inferência, anotação, exibição)
+        self.profiler = profiler_from_env()  # AGUAVIVA_PROFILE_FRAMES=N perfila N frames de inferência
 
     def run(self):
-        # Carregar o modelo YOLO
-        if not os.path.exists(self.model_path):
+        # O modelo carrega e aquece em segundo plano; até ficar pronto o vídeo passa sem detecções
+        if self.controller:
+            pass  # O controle adaptativo já carrega o modelo do seu ponto de operação (set_adaptive)
+        elif os.path.exists(self.model_path):
+            self.swap_model(self.model_path, self.backend)
+        else:
             print(f"Modelo YOLO não encontrado em: {self.model_path}")
-            self._run_flag = False
-            return
-
-        model = YOLO(self.model_path)
 
-        # Inicializar a captura de vídeo
-        cap = cv2.VideoCapture(self.video_source)
-        if not cap.isOpened():
+        # Inicializar a captura de vídeo: arquivos reiniciam ao chegar ao fim, streams reconectam
+        source = FrameSource(self.video_source, loop=True, metrics=self.metrics)
+        if not source.opened:
             print(f"Erro ao abrir a fonte de vídeo: {self.video_source}")
+            source.stop()
             self._run_flag = False
             return
-
-        # Obter FPS do vídeo
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        if fps <= 0:
-            fps = 30  # FPS padrão caso não seja possível obter
-        frame_duration_ms = int(1000 / fps)
-
-        while self._run_flag:
-            ret, frame = cap.read()
-            if ret:
-                if self.detect:
-                    # Realizar a detecção
-                    results = model(frame, conf=0.25, verbose=False)
-
-                    # Anotar o frame com as detecções
-                    annotated_frame = results[0].plot()
-
-                    # Contagem de objetos detectados
-                    object_count = len(results[0].boxes)
-
-                    # Emitir sinais para atualizar a interface
-                    self.change_pixmap_signal.emit(annotated_frame)
-                    self.update_count_signal.emit(object_count)
-                else:
-                    # Sem detecção, exibir frame original
-                    self.change_pixmap_signal.emit(frame)
-                    self.update_count_signal.emit(0)
-
-                # Controlar a taxa de quadros
-                QThread.msleep(frame_duration_ms)
+        fps = source.fps  # 30 quando a fonte não informa
+
+        last_results = None
+        cache, cache_config = None, None
+
+        def cached(frame, model, config):
+            # Entrada do cache do modelo atual; reaberta quando o modelo ou o imgsz mudam
+            nonlocal cache, cache_config
+            if config != cache_config:
+                if cache:
+                    cache.close()
+                (weights, backend), imgsz = config
+                cache = result_cache.open(self.video_source, weights, model.names, fps, 0.25, imgsz, backend)
+                cache_config = config
+            return cache.lookup(frame.index, frame.image) if cache else None
+
+        def infer(frame):
+            # Realizar a detecção apenas quando ativada e com o modelo pronto
+            if not self.detect or self.model is None:
+                return frame
+            if self.profiler:
+                self.profiler.step()
+            tracker = self.tracker
+            if tracker is None:
+                return detect(frame)
+            # Rastreamento: detector só nos quadros-chave, caixas propagadas nos demais frames
+            names = self.model.names
+            if tracker.needs_keyframe() and detect(frame).results is not None:
+                tracker.update(frame.results[0].boxes.data.cpu().numpy(), frame.image.shape)
+            else:
+                tracker.propagate(frame.image.shape)
+            frame.results = [tracker.result(frame.image, names)]
+            return frame
+
+        def detect(frame):
+            nonlocal last_results
+            # Ler modelo, imgsz e chave juntos: uma troca no meio não mistura entradas do cache
+            model, imgsz, model_key = self.model, self.imgsz, self.model_key
+            cascade = self.cascade
+            # Modelo que produziu as detecções deste frame: a anotação grava cada modelo na sua gravação
+            frame.extra["model"] = model_key[0] if model_key else self.model_path
+            if cascade:
+                # O cache guarda resultados de um único modelo: a cascata não passa por ele
+                model, imgsz, model_key = cascade, None, None
+                frame.extra["model"] = "cascata"
+            hit = cached(frame, model, (model_key, imgsz)) if model_key else None
+            if hit is not None:
+                # Frame já processado por este modelo: só desenhar
+                frame.results = last_results = [hit]
+                return frame
+            gate = self.gate
+            if gate and not gate.should_infer(frame.image) and last_results is not None:
+                # Cena parada: reaproveitar as detecções anteriores
+                frame.results = reuse_results(last_results, frame.image)
+                return frame
+            start = time.perf_counter()
+            if self.scheduler:
+                # O agendador junta este frame aos das outras câmeras num único lote
+                try:
+                    frame.results = self.scheduler.predict(self.stream, frame.image)
+                except RuntimeError:
+                    return frame  # Agendador parado: exibir o frame sem detecções
+            elif imgsz:
+                frame.results = model(frame.image, conf=0.25, imgsz=imgsz, verbose=False)
             else:
-                # Se for um arquivo de vídeo, reiniciar quando chegar ao fim
-                if isinstance(self.video_source, str):
-                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                else:
-                    self._run_flag = False
+                frame.results = model(frame.image, conf=0.25, verbose=False)
+            last_results = frame.results
+            elapsed = time.perf_counter() - start
+            if cache and model_key:
+                cache.store(frame.index, frame.timestamp, frame.results[0])
+            if gate:
+                gate.record_inference(elapsed)
+            controller = self.controller
+            if controller:
+                point = controller.record(elapsed)
+                if point:
+                    self._apply_operating_point(point)
+            return frame
+
+        renderer = Renderer()  # Anel de buffers próprio desta thread de anotação
+        store = store_model = None
+        recorder = None
+
+        def annotate(frame):
+            nonlocal store, store_model, recorder
+            # Anotar o frame com as detecções (ou exibir o frame original)
+            if frame.results is not None:
+                frame.annotated = renderer.render_result(frame.image, frame.results[0])
+                frame.count = len(frame.results[0].boxes)
+                model_path = frame.extra.get("model", store_model or self.model_path)
+                if store is None or model_path != store_model:
+                    # Detecções gravadas em disco para consultas e gráficos sem rodar o modelo de novo;
+                    # aberta na primeira detecção, quando os nomes das classes já são conhecidos, e
+                    # reaberta quando a troca de modelo, o controle adaptativo ou a cascata mudam o modelo
+                    if store is None:
+                        startup.mark("primeira detecção")
+                    else:
+                        store.close()
+                    store = open_store(self.video_source, model_path, frame.results[0].names, fps,
+                                       source=str(self.video_source), conf=0.25)
+                    store_model = model_path
+                store.append_result(frame.index, frame.timestamp, frame.results[0])
+            else:
+                frame.annotated = frame.image
+            # Gravação de trechos: o anel guarda os últimos segundos; a codificação fica em outra thread
+            threshold = self.clip_threshold
+            if threshold:
+                if recorder is None:
+                    recorder = ClipRecorder(fps, threshold, prefix=clip_prefix(self.video_source))
+                recorder.threshold = threshold
+                recorder.add(frame.index, frame.timestamp, frame.image,
+                             frame.results[0] if frame.results is not None else None)
+            elif recorder:
+                recorder.close(wait=False)
+                recorder = None
+            return frame
+
+        # Arquivos de vídeo são cadenciados pelo relógio da fonte; webcam e
+        # streams já entregam frames no ritmo do driver.
+        pipeline = self.pipeline = Pipeline(source, infer, annotate, paced=source.kind == "file",
+                                            metrics=self.metrics)
+        pipeline.start()
+
+        # Redimensionamento para o QLabel feito aqui, fora da thread da interface
+        display = DisplayBuffers(self.display_size)
+        last_report = time.monotonic()
+        while self._run_flag and not pipeline.finished:
+            frame = pipeline.get(timeout=0.1)
+            if frame is None:
+                continue
+
+            # Não empilhar sinais enquanto a interface não pintar o frame anterior
+            if self._frame_pending:
+                self.display_skipped += 1
+            else:
+                # Emitir sinais para atualizar a interface
+                self._frame_pending = True
+                with self.metrics.time("exibição"):
+                    self.change_pixmap_signal.emit(display.to_qimage(frame.annotated))
+                startup.mark("primeiro frame")
+                self.update_count_signal.emit(frame.count)
+                tracker = self.tracker
+                if tracker:
+                    self.unique_count_signal.emit(tracker.unique_count)
+
+            now = time.monotonic()
+            if now - last_report >= 1.0:
+                self.update_drops_signal.emit(self.dropped())
+                cascade = self.cascade
+                self.stats_signal.emit(self.metrics.lines() + startup.lines() + (cascade.lines() if cascade else []))
+                last_report = now
+
+        pipeline.stop()
+        if self.scheduler:
+            self.scheduler.unregister(self.stream)
+        if store:
+            store.close()
+        if recorder:
+            recorder.close()
+            print(f"Gravação de trechos: {recorder.summary()}")
+        if cache:
+            cache.close()
+        if self.profiler:
+            self.profiler.close()
+        print(f"Frames descartados por estágio: {self.dropped()}")
+        if self.gate:
+            self.gate.log()
+        if self.tracker:
+            print(f"Rastreamento: {self.tracker.summary()}")
+        if self.cascade:
+            self.cascade.log()
+        self._run_flag = False
 
-        # Liberar a captura de vídeo
-        cap.release()
+    def dropped(self):
+        """Frames descartados por estágio, incluindo os não exibidos pela interface."""
+        drops = self.pipeline.dropped() if self.pipeline else {}
+        drops["interface"] = self.display_skipped
+        return drops
+
+    def frame_shown(self):
+        """Chamado pela interface depois de pintar o último frame emitido."""
+        self._frame_pending = False
 
     def stop(self):
         """Pare o thread de vídeo."""
         self._run_flag = False
         self.wait()
 
+    def swap_model(self, model_path, backend='pytorch'):
+        """Troca o modelo em uso sem reabrir a captura de vídeo."""
+        self.model_path = model_path
+        self.backend = backend
+
+        def set_model(model):
+            # Ignorar se outro modelo foi selecionado durante o carregamento
+            if (self.model_path, self.backend) == (model_path, backend):
+                self.model, self.model_key = model, (model_path, backend)
+                startup.mark("modelo pronto")
+                self.model_status_signal.emit("pronto")
+
+        registry.preload(model_path, callback=set_model, backend=backend, progress=self.model_status_signal.emit)
+
+    def set_adaptive(self, target_fps, weights_dir):
+        """Liga (FPS alvo) ou desliga (None) o controle adaptativo de qualidade."""
+        if not target_fps:
+            self.controller = None
+            self.imgsz = None
+            return
+        self.controller = QualityController.for_fps(build_ladder(weights_dir), target_fps)
+        self._apply_operating_point(self.controller.current)
+
+    def _apply_operating_point(self, point):
+        # Carregar em segundo plano: captura e exibição seguem com o modelo atual
+        def set_model(model):
+            controller = self.controller
+            if controller and controller.current == point:
+                self.model, self.imgsz, self.model_key = model, point.imgsz, (point.weights, 'pytorch')
+                self.model_path, self.backend = point.weights, 'pytorch'
+                controller.applied()
+                self.operating_point_signal.emit(str(point))
+
+        def report_error(exc):
+            self._report_load_error(exc)
+            controller = self.controller
+            retry = controller.failed(point) if controller else None
+            if retry:
+                self._apply_operating_point(retry)
+
+        registry.preload(point.weights, callback=set_model, on_error=report_error)
+
+    def set_cascade(self, weights_dir):
+        """Liga (nano.pt em todo frame, large.pt nos casos incertos de `weights_dir`) ou desliga (None) a cascata."""
+        self.cascade_dir = weights_dir
+        if not weights_dir:
+            if self.cascade:
+                self.cascade.log()
+            self.cascade = None
+            return
+        small_path, large_path = (os.path.join(weights_dir, f"{name}.pt") for name in ("nano", "large"))
+
+        # Carregar os dois em segundo plano; até lá segue o modelo escolhido
+        def set_models(large):
+            try:
+                small = registry.get(small_path)
+            except Exception as exc:
+                self._report_load_error(exc)
+                return
+            # Ignorar se a cascata foi desligada durante o carregamento
+            if self.cascade_dir == weights_dir:
+                self.cascade = Cascade(small, large)
+                self.operating_point_signal.emit("cascata nano → large")
+
+        registry.preload(large_path, callback=set_models, on_error=self._report_load_error)
+
+    def _report_load_error(self, exc):
+        # Chamado na thread do preload: o sinal leva o erro para a interface
+        self.model_status_signal.emit(f"erro: {exc}")
+
     def start_detection(self):
         """Ative a detecção."""
         self.detect = True
@@ -91,6 +373,94 @@ def stop_detection(self):
         """Desative a detecção."""
         self.detect = False
 
+    def set_tracking(self, interval):
+        """Liga (detector a cada `interval` frames) ou desliga (None) o rastreamento."""
+        self.tracker = KeyframeTracker(interval) if interval else None
+
+    def set_recording(self, threshold):
+        """Liga (gravar trechos com `threshold` ou mais detecções) ou desliga (None) a gravação."""
+        self.clip_threshold = threshold
+
+    def set_motion_gate(self, enabled):
+        """Liga ou desliga o filtro que pula a inferência em cenas paradas."""
+        if self.gate and not enabled:
+            self.gate.log()
+        self.gate = MotionGate() if enabled else None
+
+
+class GridWindow(QWidget):
+    """Grade de câmeras com um único modelo, alimentado pelo agendador em lote."""
+
+    TILE_SIZE = (400, 250)
+
+    def __init__(self, sources, model_path, backend='pytorch'):
+        super().__init__()
+        self.setWindowTitle("Água Viva — Várias Câmeras")
+        self.setStyleSheet("background-color: #1E2A38; color: #ECEFF4;")
+
+        # Um modelo e um agendador para todas as fontes
+        self.scheduler = BatchScheduler(model_path, backend, conf=0.25)
+        self.scheduler.start()
+
+        layout = QVBoxLayout(self)
+        grid = QGridLayout()
+        layout.addLayout(grid)
+        columns = max(1, int(np.ceil(np.sqrt(len(sources)))))
+        self.threads = []
+        self.tiles = {}
+        for i, source in enumerate(sources):
+            tile = QLabel(self)
+            tile.setFixedSize(*self.TILE_SIZE)
+            tile.setAlignment(Qt.AlignCenter)
+            tile.setStyleSheet("background-color: #3B4252; border-radius: 8px;")
+            grid.addWidget(tile, i // columns, i % columns)
+
+            name = f"{i + 1}: {os.path.basename(source) if isinstance(source, str) else f'webcam {source}'}"
+            thread = VideoThread(video_source=source, model_path=model_path, backend=backend,
+                                 display_size=self.TILE_SIZE, scheduler=self.scheduler, stream=name)
+            thread.detect = True
+            thread.change_pixmap_signal.connect(self.update_tile)
+            self.tiles[thread] = tile
+            self.threads.append(thread)
+
+        self.stats_label = QLabel("", self)
+        self.stats_label.setFont(QFont('Arial', 10))
+        self.stats_label.setStyleSheet("color: #81A1C1;")
+        layout.addWidget(self.stats_label)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.update_stats)
+        self.timer.start(1000)
+
+        for thread in self.threads:
+            thread.start()
+
+    def update_tile(self, qt_img):
+        thread = self.sender()
+        self.tiles[thread].setPixmap(QPixmap.fromImage(qt_img))
+        thread.frame_shown()
+
+    def update_stats(self):
+        """Tamanho médio do lote e, por câmera, frames inferidos, espera no agendador e descartes."""
+        summary = self.scheduler.summary()
+        lines = [f"🧩 Lotes: {summary['batches']} | tamanho médio: {summary['mean_batch']:.1f}"]
+        for thread in self.threads:
+            stats = summary['streams'].get(thread.stream, {"frames": 0, "mean_wait_ms": 0.0})
+            dropped = sum(thread.dropped().values())
+            lines.append(f"{thread.stream} — inferidos: {stats['frames']} | espera: {stats['mean_wait_ms']:.1f} ms"
+                         f" | descartados: {dropped}")
+        self.stats_label.setText("\n".join(lines))
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        # Câmeras primeiro: cada uma pode estar esperando um lote do agendador
+        for thread in self.threads:
+            thread._run_flag = False
+        for thread in self.threads:
+            thread.wait()
+        self.scheduler.stop()
+        event.accept()
+
 
 class App(QMainWindow):
     def __init__(self):
@@ -126,6 +496,7 @@ def __init__(self):
         # Construir caminho absoluto para o modelo padrão
         self.weights_dir = os.path.join(script_dir, 'weights')
         self.model_path = os.path.join(self.weights_dir, 'medium.pt')  # Modelo padrão
+        self.backend = 'pytorch'  # Backend de inferência (PyTorch, ONNX ou OpenVINO)
 
         # Central widget
         self.central_widget = QWidget(self)
@@ -150,6 +521,18 @@ def __init__(self):
         self.label.setFixedSize(800, 500)  # Definir tamanho fixo para o vídeo
         self.video_metrics_layout.addWidget(self.label, alignment=Qt.AlignCenter)
 
+        # Sobreposição com a latência por estágio, desenhada sobre o vídeo
+        self.stats_overlay = QLabel("", self.label)
+        self.stats_overlay.setFont(QFont('Consolas', 9))
+        self.stats_overlay.setStyleSheet("""
+            background-color: rgba(46, 52, 64, 180);
+            color: #ECEFF4;
+            border-radius: 6px;
+            padding: 6px;
+        """)
+        self.stats_overlay.move(12, 12)
+        self.stats_overlay.hide()
+
         # Contagem de objetos detectados
         self.count_label = QLabel("🔍 Objetos Detectados: 0", self)
         self.count_label.setFont(QFont('Arial', 18))
@@ -157,6 +540,45 @@ def __init__(self):
         self.count_label.setStyleSheet("color: #A3BE8C;")
         self.video_metrics_layout.addWidget(self.count_label)
 
+        # Itens únicos desde que o rastreamento foi ligado
+        self.unique_label = QLabel("", self)
+        self.unique_label.setFont(QFont('Arial', 14))
+        self.unique_label.setAlignment(Qt.AlignCenter)
+        self.unique_label.setStyleSheet("color: #A3BE8C;")
+        self.video_metrics_layout.addWidget(self.unique_label)
+
+        # Carregamento do modelo em segundo plano: o vídeo já roda enquanto a barra estiver visível
+        self.loading_bar = QProgressBar(self)
+        self.loading_bar.setRange(0, 0)  # Modo indeterminado
+        self.loading_bar.setFixedWidth(400)
+        self.loading_bar.setAlignment(Qt.AlignCenter)
+        self.loading_bar.setStyleSheet("""
+            QProgressBar {
+                background-color: #3B4252;
+                color: #ECEFF4;
+                border-radius: 6px;
+            }
+            QProgressBar::chunk {
+                background-color: #88C0D0;
+            }
+        """)
+        self.loading_bar.hide()
+        self.video_metrics_layout.addWidget(self.loading_bar, alignment=Qt.AlignCenter)
+
+        # Frames descartados por estágio do pipeline
+        self.drops_label = QLabel("", self)
+        self.drops_label.setFont(QFont('Arial', 10))
+        self.drops_label.setAlignment(Qt.AlignCenter)
+        self.drops_label.setStyleSheet("color: #81A1C1;")
+        self.video_metrics_layout.addWidget(self.drops_label)
+
+        # Ponto de operação atual do controle adaptativo
+        self.operating_point_label = QLabel("", self)
+        self.operating_point_label.setFont(QFont('Arial', 10))
+        self.operating_point_label.setAlignment(Qt.AlignCenter)
+        self.operating_point_label.setStyleSheet("color: #EBCB8B;")
+        self.video_metrics_layout.addWidget(self.operating_point_label)
+
         # Seleção de Modelo
         self.model_selection_layout = QHBoxLayout()
         self.video_metrics_layout.addLayout(self.model_selection_layout)
@@ -258,6 +680,25 @@ def __init__(self):
         self.webcam_button.clicked.connect(self.use_webcam)
         self.button_layout.addWidget(self.webcam_button)
 
+        # Botão para abrir várias câmeras numa grade, com um único modelo em lote
+        self.grid_button = QPushButton("🧩 Várias Câmeras", self)
+        self.grid_button.setStyleSheet("""
+            QPushButton {
+                background-color: #81A1C1;
+                color: #2E3440;
+                padding: 10px 20px;
+                border-radius: 10px;
+                font-size: 14px;
+                font-weight: bold;
+            }
+            QPushButton:hover {
+                background-color: #5E81AC;
+            }
+        """)
+        self.grid_button.clicked.connect(self.open_grid)
+        self.button_layout.addWidget(self.grid_button)
+        self.grid_window = None
+
         # Botão para iniciar/parar detecção
         self.start_button = QPushButton("🚀 Iniciar Detecção", self)
         self.start_button.setStyleSheet("""
@@ -276,6 +717,69 @@ def __init__(self):
         self.start_button.clicked.connect(self.toggle_detection)
         self.button_layout.addWidget(self.start_button)
 
+        # Filtro de movimento: pular a inferência quando a cena não muda
+        self.gate_checkbox = QCheckBox("⏸️ Pular frames parados", self)
+        self.gate_checkbox.setStyleSheet("color: #ECEFF4; font-size: 13px;")
+        self.gate_checkbox.toggled.connect(self.toggle_motion_gate)
+        self.button_layout.addWidget(self.gate_checkbox)
+
+        # Qualidade adaptativa: o controlador escolhe pesos e imgsz para atingir o FPS alvo
+        self.adaptive_checkbox = QCheckBox("🎯 Qualidade adaptativa", self)
+        self.adaptive_checkbox.setStyleSheet("color: #ECEFF4; font-size: 13px;")
+        self.adaptive_checkbox.toggled.connect(self.toggle_adaptive)
+        self.button_layout.addWidget(self.adaptive_checkbox)
+
+        self.target_fps_spin = QSpinBox(self)
+        self.target_fps_spin.setRange(1, 60)
+        self.target_fps_spin.setValue(15)
+        self.target_fps_spin.setSuffix(" FPS alvo")
+        self.target_fps_spin.setStyleSheet("background-color: #3B4252; color: #ECEFF4; padding: 5px;")
+        self.target_fps_spin.valueChanged.connect(lambda _: self.toggle_adaptive(self.adaptive_checkbox.isChecked()))
+        self.button_layout.addWidget(self.target_fps_spin)
+
+        # Cascata: nano em todo frame, large só nas detecções incertas ou em mudanças bruscas de contagem
+        self.cascade_checkbox = QCheckBox("🪜 Cascata nano → large", self)
+        self.cascade_checkbox.setStyleSheet("color: #ECEFF4; font-size: 13px;")
+        self.cascade_checkbox.toggled.connect(self.toggle_cascade)
+        self.button_layout.addWidget(self.cascade_checkbox)
+
+        # Rastreamento: detector só a cada N frames e contagem de itens únicos
+        self.tracking_checkbox = QCheckBox("🔗 Rastrear objetos", self)
+        self.tracking_checkbox.setStyleSheet("color: #ECEFF4; font-size: 13px;")
+        self.tracking_checkbox.toggled.connect(self.toggle_tracking)
+        self.button_layout.addWidget(self.tracking_checkbox)
+
+        self.keyframe_spin = QSpinBox(self)
+        self.keyframe_spin.setRange(1, 30)
+        self.keyframe_spin.setValue(5)
+        self.keyframe_spin.setPrefix("Detector a cada ")
+        self.keyframe_spin.setSuffix(" frames")
+        self.keyframe_spin.setStyleSheet("background-color: #3B4252; color: #ECEFF4; padding: 5px;")
+        self.keyframe_spin.valueChanged.connect(lambda _: self.toggle_tracking(self.tracking_checkbox.isChecked()))
+        self.button_layout.addWidget(self.keyframe_spin)
+
+        # Gravação de trechos: só os segundos em volta de momentos com várias detecções
+        self.recording_checkbox = QCheckBox("🎬 Gravar trechos com detecções", self)
+        self.recording_checkbox.setStyleSheet("color: #ECEFF4; font-size: 13px;")
+        self.recording_checkbox.toggled.connect(self.toggle_recording)
+        self.button_layout.addWidget(self.recording_checkbox)
+
+        self.clip_threshold_spin = QSpinBox(self)
+        self.clip_threshold_spin.setRange(1, 100)
+        self.clip_threshold_spin.setValue(3)
+        self.clip_threshold_spin.setPrefix("A partir de ")
+        self.clip_threshold_spin.setSuffix(" objetos")
+        self.clip_threshold_spin.setStyleSheet("background-color: #3B4252; color: #ECEFF4; padding: 5px;")
+        self.clip_threshold_spin.valueChanged.connect(
+            lambda _: self.toggle_recording(self.recording_checkbox.isChecked()))
+        self.button_layout.addWidget(self.clip_threshold_spin)
+
+        # Estatísticas de latência por estágio sobre o vídeo
+        self.stats_checkbox = QCheckBox("📊 Estatísticas por estágio", self)
+        self.stats_checkbox.setStyleSheet("color: #ECEFF4; font-size: 13px;")
+        self.stats_checkbox.toggled.connect(self.stats_overlay.setVisible)
+        self.button_layout.addWidget(self.stats_checkbox)
+
         # Espaçador no final da barra lateral
         self.button_layout.addSpacerItem(QSpacerItem(20, 40, QSizePolicy.Minimum, QSizePolicy.Expanding))
 
@@ -316,7 +820,8 @@ def populate_models(self):
             QMessageBox.warning(self, "⚠️ Atenção", "Nenhum modelo encontrado em weights/.", QMessageBox.Ok)
             return
 
-        self.model_combo.addItems(models)
+        # Cada modelo aparece também nas variantes exportadas (ONNX/OpenVINO) e nas INT8 publicadas
+        self.model_combo.addItems(model_choices(models, self.weights_dir))
 
     def get_current_model_name(self):
         """Retorna o nome do modelo atual."""
@@ -326,13 +831,17 @@ def get_current_model_name(self):
     def change_model(self, index):
         """Atualiza o modelo YOLO com base na seleção do usuário."""
         selected_model = self.model_combo.currentText()
-        self.model_path = os.path.join(self.weights_dir, selected_model)
+        weights_file, self.backend = parse_label(selected_model)
+        self.model_path = os.path.join(self.weights_dir, weights_file)
         if not os.path.exists(self.model_path):
             QMessageBox.warning(self, "⚠️ Atenção", f"Modelo selecionado não encontrado: {self.model_path}", QMessageBox.Ok)
             return
-        if self.thread and self.thread.isRunning():
-            self.thread.stop()
-            self.display_video()  # Reiniciar a captura com o novo modelo
+        if self.adaptive_checkbox.isChecked():
+            pass  # O controle adaptativo escolhe o modelo; a seleção vale ao desligá-lo
+        elif self.thread and self.thread.isRunning():
+            self.thread.swap_model(self.model_path, self.backend)  # Trocar o modelo sem reiniciar a captura
+        else:
+            registry.preload(self.model_path, backend=self.backend)  # Deixar o modelo pronto para o próximo início
         self.status_label.setText(f"📡 Fonte de Vídeo: {self.video_source if self.video_source else 'Nenhuma selecionada'}\n🛠️ Modelo: {selected_model}")
 
     def select_video(self):
@@ -352,6 +861,20 @@ def use_webcam(self):
         self.status_label.setText(f"📡 Fonte de Vídeo: Webcam\n🛠️ Modelo: {self.get_current_model_name()}")
         self.display_video()
 
+    def open_grid(self):
+        """Pede as fontes (uma por linha) e abre a grade de câmeras."""
+        text, ok = QInputDialog.getMultiLineText(
+            self, "Várias Câmeras", "Fontes (uma por linha: vídeo, índice da webcam ou URL):",
+            self.video_source if isinstance(self.video_source, str) else "")
+        sources = [line.strip() for line in text.splitlines() if line.strip()] if ok else []
+        if not sources:
+            return
+        sources = [parse_source(s) for s in sources]
+        if self.grid_window:
+            self.grid_window.close()
+        self.grid_window = GridWindow(sources, self.model_path, self.backend)
+        self.grid_window.show()
+
     def display_video(self):
         """Exibe o vídeo sem detecção."""
         if self.thread:
@@ -364,10 +887,23 @@ def display_video(self):
             return
 
         # Criar e iniciar o thread de vídeo sem detecção
-        self.thread = VideoThread(video_source=self.video_source, model_path=self.model_path)
+        self.thread = VideoThread(video_source=self.video_source, model_path=self.model_path, backend=self.backend,
+                                  display_size=(self.label.width(), self.label.height()))
         self.thread.detect = False  # Garantir que a detecção está desativada
         self.thread.change_pixmap_signal.connect(self.update_image)
         self.thread.update_count_signal.connect(self.update_count)
+        self.thread.update_drops_signal.connect(self.update_drops)
+        self.thread.stats_signal.connect(self.update_stats)
+        self.thread.model_status_signal.connect(self.update_model_status)
+        self.thread.unique_count_signal.connect(self.update_unique_count)
+        self.toggle_tracking(self.tracking_checkbox.isChecked())
+        self.thread.set_motion_gate(self.gate_checkbox.isChecked())
+        self.toggle_recording(self.recording_checkbox.isChecked())
+        self.thread.operating_point_signal.connect(self.update_operating_point)
+        if self.adaptive_checkbox.isChecked():
+            self.thread.set_adaptive(self.target_fps_spin.value(), self.weights_dir)
+        if self.cascade_checkbox.isChecked():
+            self.thread.set_cascade(self.weights_dir)
         self.thread.start()
 
         # Atualizar o status para refletir a fonte de vídeo atual
@@ -419,31 +955,106 @@ def toggle_detection(self):
                 }
             """)
 
+    def toggle_adaptive(self, enabled):
+        """Liga ou desliga o controle adaptativo no thread de vídeo atual."""
+        if enabled and not build_ladder(self.weights_dir):
+            QMessageBox.warning(self, "⚠️ Atenção", "Nenhum de nano/small/medium/large.pt encontrado em weights/.",
+                                QMessageBox.Ok)
+            self.adaptive_checkbox.setChecked(False)
+            return
+        if not self.thread:
+            return
+        if enabled:
+            self.thread.set_adaptive(self.target_fps_spin.value(), self.weights_dir)
+        else:
+            self.thread.set_adaptive(None, self.weights_dir)
+            self.thread.swap_model(self.model_path, self.backend)  # Voltar ao modelo escolhido
+            self.operating_point_label.setText("")
+
+    def toggle_cascade(self, enabled):
+        """Liga ou desliga a cascata nano → large no thread de vídeo atual."""
+        missing = [name for name in ("nano.pt", "large.pt") if not os.path.exists(os.path.join(self.weights_dir, name))]
+        if enabled and missing:
+            QMessageBox.warning(self, "⚠️ Atenção", f"Pesos ausentes em weights/: {', '.join(missing)}.",
+                                QMessageBox.Ok)
+            self.cascade_checkbox.setChecked(False)
+            return
+        if not self.thread:
+            return
+        self.thread.set_cascade(self.weights_dir if enabled else None)
+        if not enabled:
+            self.operating_point_label.setText("")
+
+    def update_operating_point(self, point):
+        """Mostra o ponto de operação escolhido pelo controle adaptativo."""
+        self.operating_point_label.setText(f"⚙️ Ponto de operação: {point}")
+
+    def toggle_tracking(self, enabled):
+        """Liga ou desliga o rastreamento no thread de vídeo atual (zera a contagem de itens únicos)."""
+        if self.thread:
+            self.thread.set_tracking(self.keyframe_spin.value() if enabled else None)
+        self.unique_label.setText("🧮 Itens únicos: 0" if enabled else "")
+
+    def update_unique_count(self, count):
+        """Atualiza a contagem acumulada de itens únicos."""
+        self.unique_label.setText(f"🧮 Itens únicos: {count}")
+
+    def toggle_recording(self, enabled):
+        """Liga ou desliga a gravação de trechos no thread de vídeo atual (arquivos em clips/)."""
+        if self.thread:
+            self.thread.set_recording(self.clip_threshold_spin.value() if enabled else None)
+
+    def toggle_motion_gate(self, enabled):
+        """Aplica o filtro de movimento ao thread de vídeo atual."""
+        if self.thread:
+            self.thread.set_motion_gate(enabled)
+
     def closeEvent(self, event):
         """Garantir que o thread de vídeo seja parado ao fechar o aplicativo."""
         if self.thread:
             self.thread.stop()
+        if self.grid_window:
+            self.grid_window.close()
         event.accept()
 
-    def update_image(self, cv_img):
+    def update_image(self, qt_img):
         """Atualiza a imagem exibida na interface."""
-        qt_img = self.convert_cv_qt(cv_img)
-        self.label.setPixmap(qt_img)
+        # O frame já chega no tamanho do QLabel e em BGR; resta apenas enviá-lo ao QPixmap
+        self.label.setPixmap(QPixmap.fromImage(qt_img))
+        sender = self.sender()
+        if sender is not None:
+            sender.frame_shown()
 
     def update_count(self, count):
         """Atualiza a contagem de objetos detectados."""
         self.count_label.setText(f"🔍 Objetos Detectados: {count}")
 
-    def convert_cv_qt(self, cv_img):
-        """Converte um frame do OpenCV para QPixmap."""
-        rgb_image = cv2.cvtColor(cv_img, cv2.COLOR_BGR2RGB)
-        h, w, ch = rgb_image.shape
-        bytes_per_line = ch * w
-        convert_to_Qt_format = QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format_RGB888)
-        p = convert_to_Qt_format.scaled(
-            self.label.width(), self.label.height(), Qt.KeepAspectRatio, Qt.SmoothTransformation
-        )
-        return QPixmap.fromImage(p)
+    def update_model_status(self, stage):
+        """Mostra a barra de carregamento até o modelo ficar pronto, ou o erro se o carregamento falhar."""
+        if stage == "pronto":
+            self.loading_bar.hide()
+            return
+        if stage.startswith("erro: "):
+            self.loading_bar.setRange(0, 1)  # Parar a animação: não há mais o que esperar
+            self.loading_bar.setFormat("❌ Falha ao carregar o modelo")
+            self.loading_bar.show()
+            QMessageBox.critical(self, "❌ Erro", f"Falha ao carregar o modelo:\n{stage[len('erro: '):]}", QMessageBox.Ok)
+            return
+        texto = {"carregando": "⏳ Carregando o modelo...", "aquecendo": "🔥 Aquecendo o modelo..."}
+        self.loading_bar.setRange(0, 0)
+        self.loading_bar.setFormat(texto.get(stage, stage))
+        self.loading_bar.show()
+
+    def update_drops(self, drops):
+        """Atualiza a contagem de frames descartados por estágio."""
+        texto = " | ".join(f"{estagio}: {total}" for estagio, total in drops.items())
+        self.drops_label.setText(f"⏭️ Frames descartados — {texto}")
+
+    def update_stats(self, lines):
+        """Atualiza a sobreposição com a latência por estágio."""
+        if self.stats_overlay.isVisible():
+            self.stats_overlay.setText("\n".join(lines))
+            self.stats_overlay.adjustSize()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,287 @@
+"""Quantização INT8 dos pesos para inferência em CPU.
+
+Parte da exportação ONNX (FP32) de cada `.pt` e gera uma variante INT8 com o
+ONNX Runtime:
+
+- `static` (`onnx-int8`): pesos e ativações em INT8, com as faixas das
+  ativações calibradas em frames do vídeo de exemplo e nas fotos de `images/`;
+- `dynamic` (`onnx-int8-dynamic`): só os pesos são quantizados de antemão, as
+  ativações são quantizadas em tempo de execução (sem calibração).
+
+Cada variante é comparada com a linha de base registrada no treino
+(`antigo/runs/train/<modelo>_finetuned/results.csv`, época com melhor
+fitness) e só é publicada em `weights/exports/` se a queda de mAP50 e de
+mAP50-95 ficar dentro de `--max-drop`. Com `--data` (o `data.yaml` do
+conjunto de validação) o mAP é medido de fato (`"gate": "val"`); sem ele,
+a queda é só uma estimativa (`"gate": "agreement"`, campos `estimated_*`):
+a linha de base multiplicada pela concordância das caixas INT8 com as do
+PyTorch em frames que não entraram na calibração, sem relação com o mAP de
+validação. Depois de publicada, a variante aparece nos seletores de modelo,
+por exemplo `medium.pt [onnx-int8]`.
+
+    python quantize.py --weights weights/medium.pt weights/large.pt --mode static dynamic
+    python quantize.py --weights weights/large.pt --mode static --data data.yaml --max-drop 0.01
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import shutil
+import time
+
+import cv2
+import numpy as np
+from ultralytics import YOLO
+
+from backends import IMGSZ, QUANTIZATION_REPORT, box_iou, export, export_dir, file_hash, load
+
+MODES = {"static": "onnx-int8", "dynamic": "onnx-int8-dynamic"}
+BASELINE_DIR = os.path.join("antigo", "runs", "train")
+MAX_DROP = 0.02  # Queda máxima de mAP (pontos absolutos, 0-1) aceita para publicar
+CALIBRATION_FRAMES = 64
+EVAL_FRAMES = 32
+SPEED_RUNS = 3  # Passadas pelas imagens de avaliação ao medir a latência
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)  # Mesmos limiares do mAP50-95
+
+
+def recorded_baseline(weights, baseline_dir=BASELINE_DIR):
+    """mAP50 e mAP50-95 da melhor época do treino de `weights`, ou None se não houver registro.
+
+    A melhor época é a de maior fitness (0.1 * mAP50 + 0.9 * mAP50-95), o
+    mesmo critério que o Ultralytics usa para salvar o `best.pt`.
+    """
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    path = os.path.join(baseline_dir, f"{stem}_finetuned", "results.csv")
+    if not os.path.exists(path):
+        return None
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = [{key.strip(): value.strip() for key, value in row.items()} for row in csv.DictReader(f)]
+    best = max(rows, key=lambda r: 0.1 * float(r["metrics/mAP50(B)"]) + 0.9 * float(r["metrics/mAP50-95(B)"]))
+    return {"epoch": int(best["epoch"]), "map50": float(best["metrics/mAP50(B)"]),
+            "map50_95": float(best["metrics/mAP50-95(B)"]), "source": path}
+
+
+def sample_frames(video, count):
+    """`count` frames espaçados uniformemente ao longo do vídeo."""
+    cap = cv2.VideoCapture(video)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    frames = []
+    for index in np.linspace(0, max(total - 1, 0), num=count, dtype=int):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, int(index))
+        ret, frame = cap.read()
+        if ret:
+            frames.append(frame)
+    cap.release()
+    return frames
+
+
+def split_samples(video, images_dir, calibration=CALIBRATION_FRAMES, evaluation=EVAL_FRAMES):
+    """Imagens de calibração (fotos de `images/` e frames do vídeo) e de avaliação (outros frames).
+
+    Os frames são amostrados numa única grade e alternados entre os dois
+    conjuntos, para que a avaliação nunca use um frame visto na calibração.
+    """
+    calibration_images = []
+    if os.path.isdir(images_dir):
+        for name in sorted(os.listdir(images_dir)):
+            image = cv2.imread(os.path.join(images_dir, name))
+            if image is not None:
+                calibration_images.append(image)
+    video_calibration = max(calibration - len(calibration_images), 0)
+    frames = sample_frames(video, 2 * max(video_calibration, evaluation))
+    calibration_images.extend(frames[0::2][:video_calibration])
+    return calibration_images, frames[1::2][:evaluation]
+
+
+def letterbox(image, imgsz=IMGSZ):
+    """Entrada do modelo exportado: redimensiona mantendo a proporção, completa com cinza, NCHW RGB em 0-1."""
+    h, w = image.shape[:2]
+    scale = min(imgsz / h, imgsz / w)
+    nh, nw = round(h * scale), round(w * scale)
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top, left = (imgsz - nh) // 2, (imgsz - nw) // 2
+    canvas[top:top + nh, left:left + nw] = cv2.resize(image, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    blob = canvas[:, :, ::-1].transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+    return np.ascontiguousarray(blob)
+
+
+def quantize_onnx(source, target, mode, calibration_images=(), imgsz=IMGSZ):
+    """Grava em `target` a versão INT8 do ONNX `source`."""
+    from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType,
+                                          quantize_dynamic, quantize_static)
+
+    if mode == "dynamic":
+        quantize_dynamic(source, target, weight_type=QuantType.QInt8, per_channel=True)
+        return
+
+    class FramesReader(CalibrationDataReader):
+        def __init__(self, input_name):
+            self._inputs = iter([{input_name: letterbox(image, imgsz)} for image in calibration_images])
+
+        def get_next(self):
+            return next(self._inputs, None)
+
+    import onnx
+    input_name = onnx.load(source, load_external_data=False).graph.input[0].name
+    quantize_static(source, target, FramesReader(input_name), quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8, per_channel=True,
+                    calibrate_method=CalibrationMethod.Percentile)
+
+
+def latency(model, images, imgsz=IMGSZ, runs=SPEED_RUNS):
+    """Latência mediana (s) por imagem, depois de uma passada de aquecimento."""
+    model(images[0], imgsz=imgsz, verbose=False)
+    samples = []
+    for _ in range(runs):
+        for image in images:
+            start = time.perf_counter()
+            model(image, imgsz=imgsz, verbose=False)
+            samples.append(time.perf_counter() - start)
+    return float(np.median(samples))
+
+
+def agreement(reference, candidate, images, conf=0.25, imgsz=IMGSZ):
+    """Concordância das caixas do candidato com as da referência em cada limiar de IoU.
+
+    Para cada limiar, fração das caixas da referência reencontradas (mesma
+    classe, IoU acima do limiar), descontando as caixas a mais do candidato
+    como falsos positivos: é um F1 em que as detecções FP32 fazem o papel de
+    rótulos.
+    """
+    matched = np.zeros(len(IOU_THRESHOLDS))
+    ref_total = out_total = 0
+    for image in images:
+        ref = reference(image, conf=conf, imgsz=imgsz, verbose=False)[0].boxes.data.cpu().numpy()
+        out = candidate(image, conf=conf, imgsz=imgsz, verbose=False)[0].boxes.data.cpu().numpy()
+        ref_total += len(ref)
+        out_total += len(out)
+        if not len(ref) or not len(out):
+            continue
+        iou = box_iou(ref[:, :4], out[:, :4])
+        iou[ref[:, -1][:, None] != out[:, -1][None, :]] = 0
+        # Pareamento guloso um-para-um, da maior IoU para a menor
+        pairs = []
+        used_ref, used_out = set(), set()
+        for i, j in zip(*np.unravel_index(np.argsort(-iou, axis=None), iou.shape)):
+            if iou[i, j] <= 0:
+                break
+            if i not in used_ref and j not in used_out:
+                used_ref.add(i)
+                used_out.add(j)
+                pairs.append(iou[i, j])
+        pairs = np.array(pairs)
+        matched += (pairs[:, None] >= IOU_THRESHOLDS[None, :]).sum(axis=0) if len(pairs) else 0
+    if not ref_total and not out_total:
+        return np.ones(len(IOU_THRESHOLDS))
+    return 2 * matched / (ref_total + out_total)
+
+
+def measure_accuracy(weights, model, baseline, evaluation_images, data=None, imgsz=IMGSZ):
+    """mAP50 e mAP50-95 da variante medidos em `data` (`gate` "val"), ou estimativas pela concordância.
+
+    Sem `data`, os valores são `estimated_map50`/`estimated_map50_95` (`gate`
+    "agreement"): a linha de base vezes o F1 de concordância com as caixas
+    FP32, não um mAP medido.
+    """
+    if data:
+        metrics = model.val(data=data, imgsz=imgsz, batch=1, verbose=False, plots=False)
+        return {"gate": "val", "map50": float(metrics.box.map50), "map50_95": float(metrics.box.map),
+                "method": f"val em {data}"}
+    scores = agreement(YOLO(weights), model, evaluation_images, imgsz=imgsz)
+    return {"gate": "agreement",
+            "estimated_map50": baseline["map50"] * float(scores[0]),
+            "estimated_map50_95": baseline["map50_95"] * float(scores.mean()),
+            "agreement": {"iou50": float(scores[0]), "iou50_95": float(scores.mean())},
+            "method": f"estimativa pela concordância com o PyTorch em {len(evaluation_images)} frames "
+                      f"(não é mAP medido; use --data)"}
+
+
+def quantize(weights, mode, calibration_images, evaluation_images, max_drop=MAX_DROP, data=None, imgsz=IMGSZ,
+             baseline_dir=BASELINE_DIR):
+    """Gera, avalia e (se aprovada) publica a variante INT8 de `weights`; retorna o relatório."""
+    backend = MODES[mode]
+    baseline = recorded_baseline(weights, baseline_dir)
+    if baseline is None:
+        raise FileNotFoundError(f"Sem linha de base registrada para {weights} em {baseline_dir}")
+
+    folder = export_dir(weights, backend, imgsz)
+    shutil.rmtree(folder, ignore_errors=True)  # Uma variante antiga não continua publicada se a nova for recusada
+    os.makedirs(folder)
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    target = os.path.join(folder, f"{stem}-int8.onnx")
+    quantize_onnx(export(weights, "onnx", imgsz), target, mode, calibration_images, imgsz)
+
+    model = YOLO(target, task="detect")
+    model.overrides["imgsz"] = imgsz
+    measured = measure_accuracy(weights, model, baseline, evaluation_images, data, imgsz)
+    prefix = "" if measured["gate"] == "val" else "estimated_"
+    drop = {f"{prefix}{key}": baseline[key] - measured[f"{prefix}{key}"] for key in ("map50", "map50_95")}
+    fp32 = latency(load(weights, "pytorch", imgsz), evaluation_images, imgsz)
+    int8 = latency(model, evaluation_images, imgsz)
+
+    report = {
+        "weights": weights,
+        "weights_sha256": file_hash(weights),
+        "backend": backend,
+        "mode": mode,
+        "calibration_images": len(calibration_images) if mode == "static" else 0,
+        "baseline": baseline,
+        "gate": measured["gate"],
+        "measured": measured,
+        "drop": drop,
+        "max_drop": max_drop,
+        "latency_ms": {"pytorch": fp32 * 1000, backend: int8 * 1000},
+        "speedup": fp32 / int8 if int8 else 0.0,
+        "published": max(drop.values()) <= max_drop,
+    }
+    if report["published"]:
+        # O relatório é o que marca a variante como publicada para os seletores
+        with open(os.path.join(folder, QUANTIZATION_REPORT), "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    else:
+        shutil.rmtree(folder, ignore_errors=True)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantização INT8 com limite de perda de acurácia.")
+    parser.add_argument("--weights", nargs="+", default=sorted(glob.glob("weights/*.pt")))
+    parser.add_argument("--mode", nargs="+", choices=list(MODES), default=["static"])
+    parser.add_argument("--max-drop", type=float, default=MAX_DROP,
+                        help="Queda máxima de mAP50 e de mAP50-95 em relação ao treino (ex.: 0.02 = 2 pontos).")
+    parser.add_argument("--data", help="data.yaml do conjunto de validação (mede o mAP; sem ele, a publicação "
+                                       "usa só a estimativa por concordância com o PyTorch).")
+    parser.add_argument("--video", default="videos/exemplo.mp4", help="Vídeo de onde saem os frames de calibração.")
+    parser.add_argument("--images", default="images", help="Pasta de imagens usadas na calibração.")
+    parser.add_argument("--calibration-frames", type=int, default=CALIBRATION_FRAMES)
+    parser.add_argument("--eval-frames", type=int, default=EVAL_FRAMES)
+    parser.add_argument("--baseline-dir", default=BASELINE_DIR)
+    parser.add_argument("--imgsz", type=int, default=IMGSZ)
+    args = parser.parse_args()
+
+    calibration_images, evaluation_images = split_samples(args.video, args.images, args.calibration_frames,
+                                                          args.eval_frames)
+    if not evaluation_images:
+        parser.error(f"Nenhum frame lido de {args.video}")
+    print(f"Calibração: {len(calibration_images)} imagens · avaliação: {len(evaluation_images)} frames")
+
+    rejected = 0
+    for weights in args.weights:
+        for mode in args.mode:
+            report = quantize(weights, mode, calibration_images, evaluation_images, args.max_drop, args.data,
+                              args.imgsz, args.baseline_dir)
+            status = "publicado" if report["published"] else "RECUSADO"
+            drop50, drop50_95 = report["drop"].values()
+            label = "queda mAP" if report["gate"] == "val" else "queda ESTIMADA (proxy de concordância) mAP"
+            print(f"{os.path.basename(weights)} [{report['backend']}]: {status} · "
+                  f"{report['speedup']:.2f}x mais rápido · "
+                  f"{label}50 {drop50:+.4f}, mAP50-95 {drop50_95:+.4f} "
+                  f"(limite {args.max_drop:.4f}; {report['measured']['method']})")
+            rejected += not report["published"]
+    if rejected:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,125 +1,952 @@
+import argparse
+import contextlib
+import itertools
+import json
+import multiprocessing
 import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 import cv2
 import questionary
-from ultralytics import YOLO
 
-# Load the YOLO model
-model = YOLO("weights/nano.pt")
+from backends import BACKENDS, QUANTIZED_BACKENDS, export
+from cascade import HIGH_CONFIDENCE, LOW_CONFIDENCE, Cascade
+from clip_recorder import POST_ROLL, PRE_ROLL, THRESHOLD, ClipRecorder, clip_prefix
+from detection_store import StoreWriter
+from lean_predictor import LeanPredictor
+from frame_source import FrameSource, parse_source
+from metrics import PROFILERS, FrameProfiler, MetricsLog, MetricsServer, StageMetrics, startup
+from model_registry import registry
+from motion_gate import GATE_METHODS, MotionGate, reuse_results
+from renderer import Renderer, result_arrays
+from result_cache import result_cache
+from tiling import TILE_OVERLAP, TILE_SIZE, sliced_predict
 
 # Confidence threshold
 CONFIDENCE_THRESHOLD = 0.7
 PADDING = 5  # Padding value in pixels
+RENDERER = Renderer(label="marine debris ({conf:.2f})", threshold=CONFIDENCE_THRESHOLD, padding=PADDING)
+DEFAULT_WEIGHTS = "weights/nano.pt"
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".tif", ".tiff")
+
+
+def draw_detections(frame, result, threshold=CONFIDENCE_THRESHOLD):
+    """Draw bounding boxes and labels for detections above the threshold."""
+    boxes, confidences, _ = result_arrays(result)
+    return draw_boxes(frame, boxes, confidences, threshold)
+
+
+def draw_boxes(frame, boxes, confidences, threshold=CONFIDENCE_THRESHOLD):
+    """Draw xyxy boxes with their confidence labels onto the frame (in place)."""
+    return RENDERER.render(frame, boxes, confidences, in_place=True, threshold=threshold)
+
+
+def detection_records(result, frame_index, timestamp, names):
+    """Convert one frame's result into a list of per-detection records."""
+    boxes, confidences, classes = result_arrays(result)
+    return [
+        {
+            "frame": frame_index,
+            "timestamp": round(timestamp, 4),
+            "class": int(cls),
+            "name": names[int(cls)],
+            "confidence": round(float(conf), 4),
+            "box": [round(float(v), 1) for v in box],
+        }
+        for box, conf, cls in zip(boxes, confidences, classes)
+    ]
+
+
+class DetectionWriter:
+    """Write per-frame detections to JSONL (one line per frame) or Parquet."""
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet = path.endswith(".parquet")
+        self._rows = []
+        self._file = None if self.parquet else open(path, "w", encoding="utf-8")
+
+    def write(self, frame_index, timestamp, records):
+        if self.parquet:
+            self._rows.extend(records)
+        else:
+            line = {"frame": frame_index, "timestamp": round(timestamp, 4), "detections": records}
+            self._file.write(json.dumps(line) + "\n")
+
+    def close(self):
+        if not self.parquet:
+            self._file.close()
+            return
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise SystemExit("Parquet output requires pyarrow (pip install pyarrow).") from e
+        columns = {key: [row[key] for row in self._rows] for key in ("frame", "timestamp", "class", "name", "confidence")}
+        for i, coord in enumerate(("x1", "y1", "x2", "y2")):
+            columns[coord] = [row["box"][i] for row in self._rows]
+        pq.write_table(pa.table(columns), self.path)
+
+
+def timed(metrics, stage):
+    """metrics.time(stage), or a no-op when metrics are disabled."""
+    return metrics.time(stage) if metrics else contextlib.nullcontext()
+
+
+def read_batches(source, batch_size, out, gate=None):
+    """Group the frames decoded ahead by the source into batches for the model.
+
+    Each item is (index, frame, infer); infer is False when the motion gate
+    decided the scene has not changed since the last inferred frame.
+    """
+    batch = []
+    while True:
+        item = source.read()
+        if item is None:
+            break
+        index, frame = item
+        batch.append((index, frame, gate.should_infer(frame) if gate else True))
+        if len(batch) == batch_size:
+            out.put(batch)
+            batch = []
+    if batch:
+        out.put(batch)
+    out.put(None)
+
+
+def write_outputs(items, video_writer, detection_writer, names, fps, metrics=None, store=None, recorder=None,
+                  conf=CONFIDENCE_THRESHOLD):
+    """Annotate (boxes >= conf, same as the detections) and write frames and detections off the inference thread."""
+    while True:
+        item = items.get()
+        if item is None:
+            break
+        index, frame, result = item
+        records = detection_records(result, index, index / fps, names)
+        if detection_writer:
+            with timed(metrics, "gravação"):
+                detection_writer.write(index, index / fps, records)
+        if store:
+            store.append_result(index, index / fps, result)
+        if video_writer:
+            with timed(metrics, "anotação"):
+                annotated = draw_detections(frame, result, threshold=conf)
+            with timed(metrics, "codificação"):
+                video_writer.write(annotated)
+        if recorder:
+            # Only queues the frame; clips are encoded on the recorder's own thread
+            recorder.add(index, index / fps, frame, result)
+
+
+def open_video(input_path, **options):
+    """Open a video as a read-ahead FrameSource (options: stride, start, end, scale, metrics, stage)."""
+    source = FrameSource(input_path, **options)
+    if not source.opened:
+        source.stop()
+        raise SystemExit(f"Error: Could not load video at {input_path}")
+    return source
+
+
+def open_video_writer(output_path, fps, size):
+    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+    return cv2.VideoWriter(output_path, fourcc, fps, size)
+
+
+def detect_range(model, source, video_writer, detection_writer,
+                 batch_size=8, conf=CONFIDENCE_THRESHOLD, gate=None,
+                 metrics=None, profiler=None, store=None, cache=None, recorder=None):
+    """Batched detection over the frames of a FrameSource (its stride and [start, end) range).
+
+    With a motion gate, frames where the scene did not change reuse the
+    detections of the last inferred frame. With metrics, decode, inference
+    (per frame), render and write times land in rolling histograms; a
+    profiler covers the first frames of the inference loop. With a store
+    (detection_store.StoreWriter), every processed frame is also appended to
+    the queryable detection store. With a result cache entry, frames it already
+    holds skip the model and newly inferred frames are added to it. With a
+    clip recorder (clip_recorder.ClipRecorder), frames around detection bursts
+    are saved as short clips. Returns (frames processed, detections found).
+    """
+    # Decoding and writing run on their own threads so inference never waits on I/O
+    fps = source.fps
+    batches = queue.Queue(maxsize=4)
+    items = queue.Queue(maxsize=4 * batch_size)
+    reader = threading.Thread(target=read_batches, args=(source, batch_size, batches, gate), daemon=True)
+    writer = threading.Thread(target=write_outputs,
+                              args=(items, video_writer, detection_writer, model.names, fps, metrics, store, recorder, conf),
+                              daemon=True)
+    reader.start()
+    writer.start()
+
+    processed = 0
+    detections = 0
+    last_result = None
+    while True:
+        batch = batches.get()
+        if batch is None:
+            break
+        cached = {}
+        if cache:
+            for index, frame, infer in batch:
+                hit = cache.lookup(index, frame) if infer else None
+                if hit is not None:
+                    cached[index] = hit
+        frames = [frame for index, frame, infer in batch if infer and index not in cached]
+        if profiler:
+            profiler.step(len(batch))
+        inference_start = time.perf_counter()
+        results = iter(model.predict(frames, conf=conf, verbose=False) if frames else ())
+        inference_time = time.perf_counter() - inference_start
+        for _ in frames:
+            if gate:
+                gate.record_inference(inference_time / len(frames))
+            if metrics:
+                metrics.observe("inferência", inference_time / len(frames))
+        for index, frame, infer in batch:
+            if index in cached:
+                result = last_result = cached[index]
+            elif infer:
+                result = last_result = next(results)
+                if cache:
+                    cache.store(index, index / fps, result)
+            else:
+                result = reuse_results([last_result], frame)[0]
+            detections += len(result.boxes)
+            items.put((index, frame, result))
+        processed += len(batch)
+
+    items.put(None)
+    writer.join()
+    reader.join()
+    if profiler:
+        profiler.close()
+    return processed, detections
+
+
+def report_throughput(processed, detections, elapsed):
+    print(f"Processed {processed} frames in {elapsed:.1f}s "
+          f"({processed / elapsed if elapsed else 0:.1f} frames/s), {detections} detections.")
+
+
+def report_gate(skipped, frames, saved_seconds):
+    print(f"Motion gate: {skipped}/{frames} frames skipped "
+          f"({skipped / frames if frames else 0:.1%}), ~{saved_seconds:.1f}s of inference saved.")
+
+
+def report_metrics(metrics):
+    for name, s in metrics.snapshot().items():
+        print(f"  {name}: p50 {s['p50']:.1f} ms, p95 {s['p95']:.1f} ms, p99 {s['p99']:.1f} ms ({s['count']} samples)")
+
+
+def process_video_headless(model, input_path, output_path=None, detections_path=None,
+                           batch_size=8, stride=1, conf=CONFIDENCE_THRESHOLD, gate=None,
+                           metrics=None, profiler=None, store_path=None, weights=None, backend="pytorch",
+                           scale=None, clips_dir=None, clip_threshold=THRESHOLD, pre_roll=PRE_ROLL,
+                           post_roll=POST_ROLL):
+    """Run batched detection over a whole video without any GUI.
+
+    When the weights path is given, per-frame results go through the result
+    cache: a rerun of the same video and model only decodes (and draws), and
+    an interrupted run resumes inference where it stopped. With clips_dir,
+    only the stretches where at least clip_threshold objects show up (plus
+    pre_roll/post_roll seconds around them) are written there as MP4 clips.
+    """
+    source = open_video(input_path, stride=stride, scale=scale, metrics=metrics)
+    fps = source.fps
+    video_writer = open_video_writer(output_path, fps / stride, source.size) if output_path else None
+    detection_writer = DetectionWriter(detections_path) if detections_path else None
+    store = StoreWriter(store_path, model.names, fps, source=input_path, conf=conf, stride=stride) if store_path else None
+    # Cached boxes are in full-resolution coordinates, so a downscaled run bypasses the cache
+    use_cache = weights and not scale
+    cache = result_cache.open(input_path, weights, model.names, fps, conf, backend=backend) if use_cache else None
+    # Frames are already annotated in place when --output is also written
+    recorder = ClipRecorder(fps / stride, clip_threshold, pre_roll, post_roll, output_dir=clips_dir,
+                            prefix=clip_prefix(input_path), annotate=not output_path,
+                            names=model.names) if clips_dir else None
+
+    start = time.perf_counter()
+    processed, detections = detect_range(model, source, video_writer, detection_writer,
+                                         batch_size=batch_size, conf=conf, gate=gate,
+                                         metrics=metrics, profiler=profiler, store=store, cache=cache,
+                                         recorder=recorder)
+    source.stop()
+    if recorder:
+        recorder.close()
+        stats = recorder.summary()
+        print(f"Clips: {stats['clips']} written to {clips_dir} "
+              f"({stats['frames_written']} frames, {stats['dropped']} dropped).")
+    if video_writer:
+        video_writer.release()
+    if detection_writer:
+        detection_writer.close()
+    if store:
+        store.close()
+    if cache:
+        cache.close()
+        stats = cache.summary()
+        print(f"Result cache: {stats['hits']} frames reused, {stats['misses']} inferred.")
+
+    elapsed = time.perf_counter() - start
+    report_throughput(processed, detections, elapsed)
+    if gate:
+        stats = gate.summary()
+        report_gate(stats["skipped"], stats["frames"], stats["saved_seconds"])
+    if metrics:
+        print("Per-stage latency:")
+        report_metrics(metrics)
+    return processed, elapsed
+
+
+def physical_cores():
+    """Physical core count (psutil when available, logical count otherwise)."""
+    try:
+        import psutil
+        return psutil.cpu_count(logical=False) or os.cpu_count() or 1
+    except ImportError:
+        return os.cpu_count() or 1
+
+
+_worker_model = None
+
+
+def _init_worker(weights, threads, backend):
+    """Load the weights once per worker and cap its intra-op threads."""
+    global _worker_model
+    import torch
+    torch.set_num_threads(threads)
+    cv2.setNumThreads(1)
+    _worker_model = registry.get(weights, backend)
+
+
+def _process_shard(input_path, start, end, stride, batch_size, conf, segment_path, detections_path,
+                   gate_options=None, scale=None):
+    source = open_video(input_path, stride=stride, start=start, end=end, scale=scale)
+    gate = MotionGate(**gate_options) if gate_options else None
+    video_writer = open_video_writer(segment_path, source.fps / stride, source.size) if segment_path else None
+    detection_writer = DetectionWriter(detections_path)
+    counts = detect_range(_worker_model, source, video_writer, detection_writer,
+                          batch_size=batch_size, conf=conf, gate=gate)
+    source.stop()
+    if video_writer:
+        video_writer.release()
+    detection_writer.close()
+    return counts + ((gate.skipped, gate.inference_seconds / max(gate.inferences, 1)) if gate else (0, 0.0))
+
+
+def concat_segments(segment_paths, output_path, fps, size):
+    """Join annotated segments in order (stream copy with ffmpeg, re-encode otherwise).
+
+    Without ffmpeg the segments are decoded and encoded again with mp4v, which
+    is lossy: frame count and order are kept, but the pixels are not identical
+    to a sequential run's output.
+    """
+    if shutil.which("ffmpeg"):
+        list_path = output_path + ".segments.txt"
+        with open(list_path, "w", encoding="utf-8") as f:
+            f.writelines(f"file '{os.path.abspath(path)}'\n" for path in segment_paths)
+        subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+                        "-i", list_path, "-c", "copy", output_path], check=True)
+        os.remove(list_path)
+        return
+    print("Warning: ffmpeg not found; re-encoding the segments (the output video is not bit-identical).")
+    writer = open_video_writer(output_path, fps, size)
+    for path in segment_paths:
+        source = FrameSource(path)
+        while (item := source.read()) is not None:
+            writer.write(item[1])
+        source.stop()
+    writer.release()
+
+
+def process_video_sharded(weights, input_path, output_path=None, detections_path=None,
+                          batch_size=8, stride=1, conf=CONFIDENCE_THRESHOLD, workers=None, backend="pytorch",
+                          gate_options=None, scale=None):
+    """Split a video into frame-range shards and process them on a worker pool.
+
+    Each worker loads the weights once and is limited to its share of the
+    physical cores. Detections and annotated segments are merged back in
+    frame order, so the detections match the sequential run (with a motion
+    gate, each shard forces inference on its first frame). The annotated
+    video matches too when ffmpeg is available to join the segments.
+    """
+    if backend in BACKENDS[1:]:
+        # Export once here; the workers then only load the cached export
+        export(weights, backend)
+    source = open_video(input_path, scale=scale)
+    fps, size, total = source.fps, source.size, source.frame_count
+    source.stop()
+    if total <= 0:
+        raise SystemExit(f"Error: Unknown frame count for {input_path}; use --workers 1.")
+
+    cores = physical_cores()
+    workers = max(1, min(workers or cores, total))
+    threads = max(1, cores // workers)
+    shard_size = -(-total // workers)
+    # Align shard boundaries to the stride so every shard samples the same frames
+    shard_size += -shard_size % stride
+    # CAP_PROP_FRAME_COUNT is often off: the last shard reads to EOF, like the sequential run
+    bounds = [(start, start + shard_size) for start in range(0, total, shard_size)]
+    bounds[-1] = (bounds[-1][0], None)
+
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="rapido-shards-") as tmp:
+        segments = [os.path.join(tmp, f"segment_{i:05d}.mp4") if output_path else None for i in range(len(bounds))]
+        shard_detections = [os.path.join(tmp, f"detections_{i:05d}.jsonl") for i in range(len(bounds))]
+
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_worker, initargs=(weights, threads, backend)) as pool:
+            futures = [
+                pool.submit(_process_shard, input_path, lo, hi, stride, batch_size, conf, segment, shard_det,
+                            gate_options, scale)
+                for (lo, hi), segment, shard_det in zip(bounds, segments, shard_detections)
+            ]
+            counts = [future.result() for future in futures]
+
+        if output_path:
+            # An overestimated frame count leaves trailing shards past EOF with empty segments
+            concat_segments([segment for segment, c in zip(segments, counts) if c[0]], output_path, fps / stride, size)
+        if detections_path:
+            detection_writer = DetectionWriter(detections_path)
+            for path in shard_detections:
+                with open(path, encoding="utf-8") as f:
+                    for line in f:
+                        row = json.loads(line)
+                        detection_writer.write(row["frame"], row["timestamp"], row["detections"])
+            detection_writer.close()
+
+    elapsed = time.perf_counter() - start
+    processed = sum(c[0] for c in counts)
+    report_throughput(processed, sum(c[1] for c in counts), elapsed)
+    print(f"{len(bounds)} shards on {workers} workers x {threads} threads.")
+    if gate_options:
+        report_gate(sum(c[2] for c in counts), processed, sum(c[2] * c[3] for c in counts))
+    return processed, elapsed
+
+
+def find_images(root):
+    """Image paths under root (recursive), relative to it and sorted."""
+    found = []
+    for directory, _, files in os.walk(root):
+        for name in files:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                found.append(os.path.relpath(os.path.join(directory, name), root))
+    return sorted(found)
+
+
+def decode_images(root, paths, out, batch_size, workers):
+    """Decode images on a thread pool ahead of the model and queue size-homogeneous batches.
+
+    Decoded images wait in per-shape buckets; a bucket is queued once it holds
+    batch_size images, and the fullest bucket is flushed early when too many
+    images are buffered, so memory stays bounded on mixed-size datasets.
+    """
+    buckets = {}
+    buffered = 0
+    max_buffered = 4 * batch_size
+
+    def read(path):
+        return path, cv2.imread(os.path.join(root, path))
 
-# Ask the user for the mode
-mode = questionary.select(
-    "What would you like to process?",
-    choices=["Image", "Video"]
-).ask()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="decode") as pool:
+        pending = deque()
+        paths = iter(paths)
+        for path in itertools.islice(paths, 2 * workers):
+            pending.append(pool.submit(read, path))
+        while pending:
+            path, image = pending.popleft().result()
+            next_path = next(paths, None)
+            if next_path is not None:
+                pending.append(pool.submit(read, next_path))
+            if image is None:
+                print(f"Skipping unreadable image: {path}")
+                continue
+            bucket = buckets.setdefault(image.shape, [])
+            bucket.append((path, image))
+            buffered += 1
+            if len(bucket) == batch_size:
+                out.put(buckets.pop(image.shape))
+                buffered -= batch_size
+            elif buffered >= max_buffered:
+                fullest = max(buckets, key=lambda shape: len(buckets[shape]))
+                buffered -= len(buckets[fullest])
+                out.put(buckets.pop(fullest))
+    for bucket in buckets.values():
+        out.put(bucket)
+    out.put(None)
 
-if mode == "Image":
+
+class ImageDetectionWriter:
+    """Stream per-image detections to JSONL, or to COCO JSON (.json).
+
+    Both formats are resumable: done() lists the images already written.
+    COCO output is streamed to a .partial.jsonl file and assembled into the
+    final JSON on close; an interrupted run picks up from that file.
+    """
+
+    def __init__(self, path, names):
+        self.path = path
+        self.names = names
+        self.coco = path.endswith(".json")
+        self.partial = path + ".partial.jsonl" if self.coco else path
+        self._images = []  # COCO entries from a previous complete run
+        self._annotations = []
+        self._done = set()
+        self._next_image_id = 1
+        self._next_annotation_id = 1
+        if self.coco and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                previous = json.load(f)
+            self._images, self._annotations = previous["images"], previous["annotations"]
+            self._done.update(image["file_name"] for image in self._images)
+            self._next_image_id = max((i["id"] for i in self._images), default=0) + 1
+            self._next_annotation_id = max((a["id"] for a in self._annotations), default=0) + 1
+        if os.path.exists(self.partial):
+            complete = 0  # Bytes up to the end of the last complete line
+            with open(self.partial, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # Line cut short by an interruption
+                    complete += len(line)
+                    try:
+                        row = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self._done.add(row["file"])
+                    if self.coco:
+                        self._next_image_id = max(self._next_image_id, row["image"]["id"] + 1)
+                        for annotation in row["annotations"]:
+                            self._next_annotation_id = max(self._next_annotation_id, annotation["id"] + 1)
+            # Drop the broken tail so appended rows start on a line of their own
+            with open(self.partial, "r+b") as f:
+                f.truncate(complete)
+        self._file = open(self.partial, "a", encoding="utf-8")
+
+    def done(self):
+        return set(self._done)
+
+    def write(self, file_name, image_shape, result):
+        boxes, confidences, classes = result_arrays(result)
+        if not self.coco:
+            records = detection_records(result, 0, 0.0, self.names)
+            for record in records:
+                del record["frame"], record["timestamp"]
+            row = {"file": file_name, "width": image_shape[1], "height": image_shape[0], "detections": records}
+        else:
+            image = {"id": self._next_image_id, "file_name": file_name,
+                     "width": image_shape[1], "height": image_shape[0]}
+            annotations = []
+            for box, conf, cls in zip(boxes, confidences, classes):
+                x1, y1, x2, y2 = (round(float(v), 1) for v in box)
+                annotations.append({"id": self._next_annotation_id, "image_id": image["id"], "category_id": int(cls),
+                                    "bbox": [x1, y1, round(x2 - x1, 1), round(y2 - y1, 1)],
+                                    "area": round((x2 - x1) * (y2 - y1), 1), "score": round(float(conf), 4),
+                                    "iscrowd": 0})
+                self._next_annotation_id += 1
+            self._next_image_id += 1
+            row = {"file": file_name, "image": image, "annotations": annotations}
+        self._file.write(json.dumps(row) + "\n")
+        self._done.add(file_name)
+
+    def close(self):
+        self._file.close()
+        if not self.coco:
+            return
+        # Assemble the final COCO file one element at a time
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as out:
+            categories = [{"id": int(i), "name": name} for i, name in self.names.items()]
+            out.write('{"categories": ' + json.dumps(categories) + ', "images": [')
+            first = True
+            for image in itertools.chain(self._images, (row["image"] for row in self._partial_rows())):
+                out.write(("" if first else ", ") + json.dumps(image))
+                first = False
+            out.write('], "annotations": [')
+            first = True
+            for annotation in itertools.chain(
+                    self._annotations, (a for row in self._partial_rows() for a in row["annotations"])):
+                out.write(("" if first else ", ") + json.dumps(annotation))
+                first = False
+            out.write("]}\n")
+        os.replace(tmp_path, self.path)
+        os.remove(self.partial)
+
+    def _partial_rows(self):
+        with open(self.partial, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Skip a damaged row, keep the rest
+
+
+def write_image_outputs(items, detection_writer, output_dir, conf=CONFIDENCE_THRESHOLD):
+    """Write detections and annotated copies (boxes >= conf) off the inference thread."""
+    while True:
+        item = items.get()
+        if item is None:
+            break
+        path, image, result = item
+        if output_dir:
+            target = os.path.join(output_dir, path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            cv2.imwrite(target, draw_detections(image, result, threshold=conf))
+        if detection_writer:
+            detection_writer.write(path, image.shape, result)
+
+
+def process_image_directory(model, input_dir, output_dir=None, detections_path=None,
+                            batch_size=8, conf=CONFIDENCE_THRESHOLD, decode_workers=None):
+    """Detect on every image under input_dir, skipping images already in the outputs.
+
+    Decoding runs on a thread pool and writing on its own thread, so the
+    model only waits when the disk cannot keep up. Annotated copies mirror the
+    input tree under output_dir; detections go to detections_path (JSONL, or
+    COCO when it ends in .json).
+    """
+    paths = find_images(input_dir)
+    detection_writer = ImageDetectionWriter(detections_path, model.names) if detections_path else None
+    if detection_writer:
+        done = detection_writer.done()
+    elif output_dir:
+        done = {path for path in paths if os.path.exists(os.path.join(output_dir, path))}
+    else:
+        done = set()
+    todo = [path for path in paths if path not in done]
+    if done:
+        print(f"Resuming: {len(paths) - len(todo)} of {len(paths)} images already processed.")
+
+    batches = queue.Queue(maxsize=4)
+    items = queue.Queue(maxsize=4 * batch_size)
+    decode_workers = decode_workers or min(8, os.cpu_count() or 1)
+    reader = threading.Thread(target=decode_images, args=(input_dir, todo, batches, batch_size, decode_workers),
+                              daemon=True)
+    writer = threading.Thread(target=write_image_outputs, args=(items, detection_writer, output_dir, conf),
+                              daemon=True)
+    reader.start()
+    writer.start()
+
+    start = time.perf_counter()
+    processed = detections = 0
+    while True:
+        batch = batches.get()
+        if batch is None:
+            break
+        results = model.predict([image for _, image in batch], conf=conf, verbose=False)
+        for (path, image), result in zip(batch, results):
+            detections += len(result.boxes)
+            items.put((path, image, result))
+        processed += len(batch)
+    items.put(None)
+    writer.join()
+    reader.join()
+    if detection_writer:
+        detection_writer.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Processed {processed} images in {elapsed:.1f}s "
+          f"({processed / elapsed if elapsed else 0:.1f} images/s), {detections} detections.")
+    return processed, elapsed
+
+
+def detect_image(model, frame, tiled=False, tile=TILE_SIZE, overlap=TILE_OVERLAP, conf=CONFIDENCE_THRESHOLD):
+    """Detect on a still image, either whole or sliced into overlapping tiles, keeping boxes >= conf."""
+    if tiled:
+        boxes, confidences, _ = sliced_predict(model, frame, tile=tile, overlap=overlap, conf=conf)
+        return draw_boxes(frame, boxes, confidences, threshold=conf)
+    results = model.predict(frame, conf=conf)
+    return draw_detections(frame, results[0], threshold=conf)
+
+
+def load_model(args, video=True):
+    """The --weights model, or a cascade escalating to the --cascade weights."""
+    model = registry.get(args.weights, args.backend)
+    if not args.cascade:
+        return model
+    low, high = args.cascade_band
+    # Sudden count changes only mean something between consecutive video frames
+    return Cascade(model, registry.get(args.cascade, args.backend), low=low, high=high,
+                   **({} if video else {"count_jump": None}))
+
+
+def wait_for_model(weights, backend="pytorch"):
+    """Return the model, telling the user when the background load is still running."""
+    if not registry.is_loaded(weights, backend):
+        print("Waiting for the model to finish loading...")
+    model = registry.get(weights, backend)
+    startup.mark("modelo pronto")
+    return model
+
+
+def process_image(weights):
     # List available images in the 'images' folder
     image_folder = "images"
-    images = [f for f in os.listdir(image_folder) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-    
+    images = [f for f in os.listdir(image_folder) if f.lower().endswith(IMAGE_EXTENSIONS)]
+
     if not images:
         print("No images found in the 'images' folder.")
-    else:
-        # Let the user select an image
-        selected_image = questionary.select(
-            "Select an image to process:",
-            choices=images
-        ).ask()
-
-        # Read and process the selected image
-        image_path = os.path.join(image_folder, selected_image)
-        frame = cv2.imread(image_path)
-        
-        if frame is None:
-            print(f"Error: Could not load image at {image_path}")
-        else:
-            # Perform inference
-            results = model.predict(frame)
-            
-            # Draw bounding boxes and label detections with confidence > 70%
-            for result in results[0].boxes:
-                x1, y1, x2, y2 = map(int, result.xyxy[0])
-                confidence = result.conf.item()
-                
-                if confidence >= CONFIDENCE_THRESHOLD:
-                    # Apply padding and ensure it stays within the image bounds
-                    height, width, _ = frame.shape
-                    x1 = max(0, x1 - PADDING)
-                    y1 = max(0, y1 - PADDING)
-                    x2 = min(width - 1, x2 + PADDING)
-                    y2 = min(height - 1, y2 + PADDING)
-
-                    # Adjust label position dynamically
-                    label = f"marine debris ({confidence:.2f})"
-                    label_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)[0]
-                    label_x = x1
-                    label_y = y1 - 10 if y1 - 10 > label_size[1] else y1 + label_size[1] + 10
-
-                    # Draw the bounding box and label
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                    cv2.rectangle(frame, (label_x, label_y - label_size[1] - 5), 
-                                  (label_x + label_size[0] + 5, label_y + 5), (0, 255, 0), -1)
-                    cv2.putText(frame, label, (label_x, label_y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
-            
-            # Display the image
-            cv2.imshow("Image Detection", frame)
-            cv2.waitKey(0)
-            cv2.destroyAllWindows()
-
-elif mode == "Video":
+        return
+
+    # Let the user select an image
+    selected_image = questionary.select(
+        "Select an image to process:",
+        choices=images
+    ).ask()
+
+    # Read and process the selected image
+    image_path = os.path.join(image_folder, selected_image)
+    frame = cv2.imread(image_path)
+
+    if frame is None:
+        print(f"Error: Could not load image at {image_path}")
+        return
+
+    # Sliced inference keeps small debris visible on high-resolution images
+    height, width = frame.shape[:2]
+    tiled = max(height, width) > TILE_SIZE and questionary.confirm(
+        f"Image is {width}x{height}. Use sliced (tiled) inference to find small debris?",
+        default=True
+    ).ask()
+
+    # Perform inference and draw detections with confidence > 70%
+    detect_image(wait_for_model(weights), frame, tiled=tiled)
+    startup.mark("primeira detecção")
+
+    # Display the image
+    cv2.imshow("Image Detection", frame)
+    cv2.waitKey(0)
+    cv2.destroyAllWindows()
+
+
+def draw_stats(frame, lines):
+    """Write per-stage latency lines in the top-left corner of the frame."""
+    for i, line in enumerate(lines):
+        # cv2 fonts are ASCII-only
+        line = line.replace("·", "|")
+        y = 20 + 18 * i
+        cv2.putText(frame, line, (10, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 3, cv2.LINE_AA)
+        cv2.putText(frame, line, (10, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1, cv2.LINE_AA)
+
+
+def process_video(weights):
     # Ask for the video path
-    video_path = input("Enter the path to the video: ").strip()
-    cap = cv2.VideoCapture(video_path)
-    
-    if not cap.isOpened():
+    video_path = input("Enter the path to the video (or a camera index / stream URL): ").strip()
+
+    # Per-stage latency; press 's' to toggle the overlay
+    metrics = StageMetrics()
+    source = FrameSource(parse_source(video_path), metrics=metrics)
+    if not source.opened:
+        source.stop()
         print(f"Error: Could not load video at {video_path}")
-    else:
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
+        return
+
+    show_stats = False
+    model = None
+    while True:
+        item = source.read()
+        if item is None:
+            break
+        _, frame = item
 
+        # Raw video plays while the model is still loading in the background
+        if model is None and registry.is_loaded(weights):
+            # Fixed-size frames: reuse the letterbox and input buffers, get NumPy arrays back
+            model = LeanPredictor(wait_for_model(weights))
+        if model is None:
+            # A failed background load would otherwise look like an endless load
+            error = registry.load_error(weights)
+            draw_stats(frame, [f"Detector failed to load: {error}" if error else "Loading detector..."])
+        else:
             # Perform inference
-            results = model.predict(frame)
+            with metrics.time("inferência"):
+                boxes, confidences, _ = model.predict(frame)
 
             # Draw bounding boxes and label detections with confidence > 70%
-            for result in results[0].boxes:
-                x1, y1, x2, y2 = map(int, result.xyxy[0])
-                confidence = result.conf.item()
-                
-                if confidence >= CONFIDENCE_THRESHOLD:
-                    # Apply padding and ensure it stays within the frame bounds
-                    height, width, _ = frame.shape
-                    x1 = max(0, x1 - PADDING)
-                    y1 = max(0, y1 - PADDING)
-                    x2 = min(width - 1, x2 + PADDING)
-                    y2 = min(height - 1, y2 + PADDING)
-
-                    # Adjust label position dynamically
-                    label = f"marine debris ({confidence:.2f})"
-                    label_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)[0]
-                    label_x = x1
-                    label_y = y1 - 10 if y1 - 10 > label_size[1] else y1 + label_size[1] + 10
-
-                    # Draw the bounding box and label
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                    cv2.rectangle(frame, (label_x, label_y - label_size[1] - 5), 
-                                  (label_x + label_size[0] + 5, label_y + 5), (0, 255, 0), -1)
-                    cv2.putText(frame, label, (label_x, label_y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
-
-            # Display the frame in a window
+            with metrics.time("anotação"):
+                draw_boxes(frame, boxes, confidences)
+            startup.mark("primeira detecção")
+        if show_stats:
+            draw_stats(frame, metrics.lines() + startup.lines())
+
+        # Display the frame in a window
+        with metrics.time("exibição"):
             cv2.imshow("Video Detection", frame)
+            key = cv2.waitKey(1) & 0xFF
+        startup.mark("primeiro frame")
+
+        # Break the loop if 'q' is pressed
+        if key == ord('q'):
+            break
+        if key == ord('s'):
+            show_stats = not show_stats
+
+    source.stop()
+    cv2.destroyAllWindows()
+
+
+def run_interactive():
+    # Load and warm up the YOLO model in the background while the user answers the prompts
+    registry.preload(DEFAULT_WEIGHTS)
+
+    # Ask the user for the mode
+    mode = questionary.select(
+        "What would you like to process?",
+        choices=["Image", "Video"]
+    ).ask()
+
+    if mode == "Image":
+        process_image(DEFAULT_WEIGHTS)
+    elif mode == "Video":
+        process_video(DEFAULT_WEIGHTS)
+    else:
+        print("Invalid mode selected.")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Marine debris detection. Without --input, runs the interactive prompt."
+    )
+    parser.add_argument("--input", help="Video to process headless (no GUI).")
+    parser.add_argument("--image", help="Image to process headless (no GUI).")
+    parser.add_argument("--images", help="Directory tree of images to process in bulk (resumable).")
+    parser.add_argument("--decode-workers", type=int, help="Image decoding threads for --images.")
+    parser.add_argument("--output", help="Annotated MP4 (or image with --image, or directory with --images).")
+    parser.add_argument("--detections",
+                        help="Per-frame detections file (.jsonl or .parquet; with --images, .jsonl or COCO .json).")
+    parser.add_argument("--weights", default=DEFAULT_WEIGHTS, help="YOLO weights file.")
+    parser.add_argument("--backend", choices=BACKENDS + QUANTIZED_BACKENDS, default="pytorch",
+                        help="Inference backend (ONNX/OpenVINO exports are cached under weights/exports).")
+    parser.add_argument("--cascade", metavar="WEIGHTS",
+                        help="Larger weights for uncertain frames/crops; --weights runs on every frame.")
+    parser.add_argument("--cascade-band", type=float, nargs=2, metavar=("LOW", "HIGH"),
+                        default=(LOW_CONFIDENCE, HIGH_CONFIDENCE),
+                        help="Small-model confidences in [LOW, HIGH) are escalated to --cascade.")
+    parser.add_argument("--batch-size", type=int, default=8, help="Frames per model call.")
+    parser.add_argument("--stride", type=int, default=1,
+                        help="Process every Nth frame (the others are skipped without being decoded).")
+    parser.add_argument("--decode-scale", type=float,
+                        help="Downscale frames right after decoding (e.g. 0.5); outputs use the reduced size.")
+    parser.add_argument("--conf", type=float, default=CONFIDENCE_THRESHOLD, help="Confidence threshold.")
+    parser.add_argument("--tiled", action="store_true",
+                        help="With --image: sliced inference over overlapping tiles at the model size.")
+    parser.add_argument("--tile-size", type=int, default=TILE_SIZE, help="Tile side in pixels.")
+    parser.add_argument("--overlap", type=float, default=TILE_OVERLAP, help="Tile overlap fraction (0-1).")
+    parser.add_argument("--motion-gate", action="store_true",
+                        help="Skip inference when the scene has not changed and reuse the last detections.")
+    parser.add_argument("--gate-threshold", type=float, default=0.02, help="Change needed to re-run the detector.")
+    parser.add_argument("--gate-refresh", type=int, default=30, help="Force inference every N frames.")
+    parser.add_argument("--gate-method", choices=GATE_METHODS, default="diff",
+                        help="Frame difference or histogram comparison.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes for sharded processing (0 = one per physical core).")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always run the model instead of reusing cached per-frame results.")
+    parser.add_argument("--store", help="Detection store directory, queryable with detection_store.py.")
+    parser.add_argument("--clips", help="Directory for event clips: MP4 + JSON around frames with many detections.")
+    parser.add_argument("--clip-threshold", type=int, default=THRESHOLD, help="Detections in a frame that start a clip.")
+    parser.add_argument("--pre-roll", type=float, default=PRE_ROLL, help="Seconds kept before the trigger.")
+    parser.add_argument("--post-roll", type=float, default=POST_ROLL,
+                        help="Seconds recorded after the last frame above the threshold.")
+    parser.add_argument("--metrics-log", help="Append per-stage latency summaries (JSON lines) to this file.")
+    parser.add_argument("--metrics-interval", type=float, default=10.0, help="Seconds between --metrics-log lines.")
+    parser.add_argument("--metrics-port", type=int,
+                        help="Serve per-stage latency in Prometheus text format at :PORT/metrics.")
+    parser.add_argument("--profile", type=int, metavar="N", help="Profile the first N frames of the inference loop.")
+    parser.add_argument("--profiler", choices=PROFILERS, default="cprofile",
+                        help="cProfile stats (.prof) or a torch profiler Chrome trace (.json).")
+    parser.add_argument("--profile-output", help="Profile file (default perfil.prof / perfil.json).")
+    args = parser.parse_args()
+    if args.workers != 1 and (args.metrics_log or args.metrics_port or args.profile or args.store or args.clips
+                              or args.cascade):
+        parser.error("--store, --clips, --cascade, --metrics-log, --metrics-port and --profile need --workers 1")
+    if not 0 <= args.cascade_band[0] < args.cascade_band[1] <= 1:
+        parser.error("--cascade-band must satisfy 0 <= LOW < HIGH <= 1")
+    if args.clip_threshold < 1 or args.pre_roll < 0 or args.post_roll < 0:
+        parser.error("--clip-threshold must be >= 1 and --pre-roll/--post-roll >= 0")
+    if args.workers < 0:
+        parser.error("--workers must be >= 0")
+    if not 0 <= args.overlap < 1:
+        parser.error("--overlap must be in [0, 1)")
+    if args.decode_scale is not None and not 0 < args.decode_scale <= 1:
+        parser.error("--decode-scale must be in (0, 1]")
+    if args.images and args.detections and not args.detections.endswith((".jsonl", ".json")):
+        parser.error("with --images, --detections must be .jsonl or .json (COCO)")
+    if args.batch_size < 1 or args.stride < 1:
+        parser.error("--batch-size and --stride must be >= 1")
+    return args
+
+
+def main():
+    args = parse_args()
+    if args.image:
+        frame = cv2.imread(args.image)
+        if frame is None:
+            raise SystemExit(f"Error: Could not load image at {args.image}")
+        model = load_model(args, video=False)
+        start = time.perf_counter()
+        detect_image(model, frame, tiled=args.tiled, tile=args.tile_size, overlap=args.overlap, conf=args.conf)
+        print(f"Processed {args.image} in {time.perf_counter() - start:.2f}s.")
+        cv2.imwrite(args.output or "output.jpg", frame)
+        return
+
+    if args.images:
+        model = load_model(args, video=False)
+        process_image_directory(model, args.images, args.output, args.detections,
+                                batch_size=args.batch_size, conf=args.conf, decode_workers=args.decode_workers)
+        if args.cascade:
+            model.log()
+        return
+
+    if not args.input:
+        run_interactive()
+        return
+
+    gate_options = None
+    if args.motion_gate:
+        gate_options = {"threshold": args.gate_threshold, "refresh_every": args.gate_refresh,
+                        "method": args.gate_method}
+
+    if args.workers != 1:
+        process_video_sharded(args.weights, args.input, args.output, args.detections,
+                              batch_size=args.batch_size, stride=args.stride, conf=args.conf,
+                              workers=args.workers or None, backend=args.backend, gate_options=gate_options,
+                              scale=args.decode_scale)
+        return
+
+    metrics = StageMetrics()
+    exporters = []
+    if args.metrics_port:
+        exporters.append(MetricsServer(metrics, port=args.metrics_port))
+    if args.metrics_log:
+        exporters.append(MetricsLog(metrics, args.metrics_log, interval=args.metrics_interval))
+    for exporter in exporters:
+        exporter.start()
+    profiler = FrameProfiler(args.profile, args.profile_output, args.profiler) if args.profile else None
+
+    model = load_model(args)
+    try:
+        process_video_headless(model, args.input, args.output, args.detections,
+                               batch_size=args.batch_size, stride=args.stride, conf=args.conf,
+                               gate=MotionGate(**gate_options) if gate_options else None,
+                               metrics=metrics, profiler=profiler, store_path=args.store,
+                               # Cached results belong to --weights alone, not to the cascade
+                               weights=None if args.no_cache or args.cascade else args.weights,
+                               backend=args.backend,
+                               scale=args.decode_scale, clips_dir=args.clips, clip_threshold=args.clip_threshold,
+                               pre_roll=args.pre_roll, post_roll=args.post_roll)
+        if args.cascade:
+            model.log()
+    finally:
+        for exporter in exporters:
+            exporter.stop()
 
-            # Break the loop if 'q' is pressed
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
-        
-        cap.release()
-        cv2.destroyAllWindows()
 
-else:
-    print("Invalid mode selected.")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Renderizador de detecções compartilhado por todos os pontos de entrada.
+
+Todas as caixas e confianças de um frame vão para o NumPy numa única
+transferência; limiar de confiança, filtro de classes, margem (`PADDING`) e
+posição dos rótulos são calculados como operações de array. O tamanho de
+cada texto de rótulo fica em cache e o desenho é feito num pequeno anel de
+buffers reaproveitados, então o custo por frame continua estável mesmo com
+centenas de detecções.
+"""
+import cv2
+import numpy as np
+
+PADDING = 5  # Margem em pixels em volta de cada caixa
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+FONT_SCALE = 0.5
+FONT_THICKNESS = 2
+BOX_COLOR = (0, 255, 0)
+TEXT_COLOR = (0, 0, 0)
+RING_SIZE = 4  # Buffers em uso ao mesmo tempo ao longo do pipeline (desenho, filas e exibição)
+MAX_CACHED_LABELS = 4096
+
+_label_sizes = {}
+
+
+def label_size(label):
+    """(largura, altura) do texto do rótulo, com cache."""
+    size = _label_sizes.get(label)
+    if size is None:
+        if len(_label_sizes) >= MAX_CACHED_LABELS:
+            _label_sizes.clear()
+        size = _label_sizes[label] = cv2.getTextSize(label, FONT, FONT_SCALE, FONT_THICKNESS)[0]
+    return size
+
+
+def result_arrays(result):
+    """(caixas, confianças, classes) de um `Results` numa única transferência para o host."""
+    data = result.boxes.data.cpu().numpy()
+    return data[:, :4], data[:, -2], data[:, -1].astype(int)
+
+
+class Renderer:
+    """Desenha caixas e rótulos; não é thread-safe (use um por thread de anotação)."""
+
+    def __init__(self, label="{name} ({conf:.2f})", threshold=0.0, padding=PADDING, ring_size=RING_SIZE):
+        self.label = label
+        self.threshold = threshold
+        self.padding = padding
+        self._ring = [None] * ring_size
+        self._next = 0
+
+    def _buffer(self, image):
+        """Próximo buffer do anel com uma cópia de `image` (realocado só se o formato mudar)."""
+        buffer = self._ring[self._next]
+        if buffer is None or buffer.shape != image.shape or buffer.dtype != image.dtype:
+            buffer = self._ring[self._next] = np.empty_like(image)
+        self._next = (self._next + 1) % len(self._ring)
+        np.copyto(buffer, image)
+        return buffer
+
+    def render_result(self, image, result, keep_classes=None, in_place=False, threshold=None):
+        """Desenha as detecções de um `Results` de Ultralytics (com o ID no rótulo, se forem trilhas)."""
+        data = result.boxes.data.cpu().numpy()
+        ids = data[:, 4].astype(int) if data.shape[1] == 7 else None
+        return self.render(image, data[:, :4], data[:, -2], data[:, -1].astype(int), names=result.names,
+                           keep_classes=keep_classes, in_place=in_place, threshold=threshold, ids=ids)
+
+    def render(self, image, boxes, confidences, classes=None, names=None, keep_classes=None, in_place=False,
+               threshold=None, ids=None):
+        """Desenha caixas xyxy com rótulos; retorna o frame anotado.
+
+        Sem `in_place`, o desenho é feito numa cópia guardada no anel de buffers,
+        que será reutilizada `ring_size` chamadas depois.
+        """
+        frame = image if in_place else self._buffer(image)
+        if classes is None:
+            classes = np.zeros(len(confidences), dtype=int)
+
+        mask = confidences >= (self.threshold if threshold is None else threshold)
+        if keep_classes is not None:
+            mask &= np.isin(classes, list(keep_classes))
+        if not mask.any():
+            return frame
+
+        height, width = frame.shape[:2]
+        xyxy = boxes[mask].astype(int)
+        xyxy[:, :2] -= self.padding
+        xyxy[:, 2:] += self.padding
+        np.clip(xyxy[:, 0::2], 0, width - 1, out=xyxy[:, 0::2])
+        np.clip(xyxy[:, 1::2], 0, height - 1, out=xyxy[:, 1::2])
+
+        labels = [
+            self.label.format(name=names[c] if names else "", conf=conf)
+            for c, conf in zip(classes[mask].tolist(), confidences[mask].tolist())
+        ]
+        if ids is not None:
+            labels = [f"#{track_id} {label}" for track_id, label in zip(ids[mask].tolist(), labels)]
+        sizes = np.array([label_size(label) for label in labels]).reshape(-1, 2)
+        y1 = xyxy[:, 1]
+        label_y = np.where(y1 - 10 > sizes[:, 1], y1 - 10, y1 + sizes[:, 1] + 10)
+        backgrounds = np.stack([
+            xyxy[:, 0], label_y - sizes[:, 1] - 5, xyxy[:, 0] + sizes[:, 0] + 5, label_y + 5,
+        ], axis=1)
+
+        for (x1, y1, x2, y2), (bx1, by1, bx2, by2), ly, label in zip(
+                xyxy.tolist(), backgrounds.tolist(), label_y.tolist(), labels):
+            cv2.rectangle(frame, (x1, y1), (x2, y2), BOX_COLOR, 2)
+            cv2.rectangle(frame, (bx1, by1), (bx2, by2), BOX_COLOR, -1)
+            cv2.putText(frame, label, (x1, ly), FONT, FONT_SCALE, TEXT_COLOR, FONT_THICKNESS)
+        return frame
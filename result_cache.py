@@ -0,0 +1,155 @@
+"""Cache em disco das detecções por frame, endereçado pelo conteúdo.
+
+A chave combina o hash do vídeo, o hash dos pesos, a confiança, o imgsz e o
+backend: o mesmo vídeo com o mesmo modelo nunca passa duas vezes pelo
+detector, seja no loop do vídeo de exemplo, ao selecionar o mesmo arquivo de
+novo ou ao reenviá-lo no Streamlit. Cada entrada é uma gravação no formato de
+`detection_store`, então um vídeo processado pela metade continua de onde
+parou. O cache tem um limite de tamanho e descarta as entradas usadas há mais
+tempo.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from backends import file_hash
+from detection_store import DetectionStore, StoreWriter
+
+CACHE_DIR = os.path.join("cache", "results")
+MAX_CACHE_MB = 1024
+
+
+def cache_key(source, weights, conf, imgsz=None, backend="pytorch"):
+    """Chave da entrada, ou None para fontes que não são arquivos (webcam, stream)."""
+    if not (isinstance(source, str) and os.path.isfile(source)):
+        return None
+    parts = [file_hash(source), file_hash(weights), f"{float(conf):.4f}", str(imgsz or "auto"), backend]
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()[:32]
+
+
+def _entry_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+class CachedResults:
+    """Uma entrada aberta: consulta frames já processados e grava os novos."""
+
+    def __init__(self, path, names, fps, **meta):
+        self.path = path
+        self.names = dict(names)
+        self.writer = StoreWriter(path, names, fps, **meta)
+        self.reader = DetectionStore(path)
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, frame_index, image):
+        """Resultado do Ultralytics reconstruído do cache, ou None se o frame não foi processado."""
+        if frame_index > self.writer.last_frame:
+            self.misses += 1
+            return None
+        if not len(self.reader) or frame_index > self.reader.frames["frame"][-1]:
+            # Frame gravado nesta sessão e ainda não visível para o leitor
+            self.writer.flush()
+            self.reader.refresh()
+        if not self.reader.has_frame(frame_index):
+            # Frame pulado numa execução anterior (detecção desligada naquele trecho)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._result(self.reader.frame(frame_index), image)
+
+    def _result(self, rows, image):
+        from ultralytics.engine.results import Results
+
+        data = np.stack([rows["x1"], rows["y1"], rows["x2"], rows["y2"],
+                         rows["confidence"], rows["cls"]], axis=1).astype(np.float32)
+        return Results(orig_img=image, path="", names=self.names, boxes=data.reshape(-1, 6))
+
+    def store(self, frame_index, timestamp, result):
+        self.writer.append_result(frame_index, timestamp, result)
+
+    def summary(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+    def close(self):
+        self.writer.close()
+        ResultCache.release(self.path)
+
+
+class ResultCache:
+    """Entradas em `root`, limitadas a `max_mb` com descarte da menos usada (LRU)."""
+
+    _open = set()  # Entradas em uso neste processo, nunca descartadas
+    _lock = threading.Lock()
+
+    def __init__(self, root=CACHE_DIR, max_mb=MAX_CACHE_MB):
+        self.root = root
+        self.max_bytes = max_mb * 1024 * 1024
+
+    def open(self, source, weights, names, fps, conf, imgsz=None, backend="pytorch"):
+        """Abre (ou cria) a entrada do vídeo `source`; None se a fonte não puder ser cacheada."""
+        key = cache_key(source, weights, conf, imgsz, backend)
+        if key is None:
+            return None
+        path = os.path.join(self.root, key)
+        with self._lock:
+            if path in self._open:
+                return None  # Já aberta por outro laço deste processo: só um escritor por entrada
+            self._open.add(path)
+        self.evict()
+        # Só a configuração entra no meta: o mesmo conteúdo com outro nome de arquivo reaproveita a entrada
+        entry = CachedResults(path, names, fps, conf=float(conf), imgsz=imgsz, backend=backend)
+        self._touch(path)
+        frames = len(entry.reader)
+        if frames:
+            print(f"Cache de detecções: {frames} frames de {os.path.basename(source)} já processados")
+        return entry
+
+    @staticmethod
+    def release(path):
+        with ResultCache._lock:
+            ResultCache._open.discard(path)
+
+    @staticmethod
+    def _touch(path):
+        # O horário do último uso fica num arquivo próprio: o meta.json só muda quando a entrada é recriada
+        with open(os.path.join(path, "last_used.json"), "w", encoding="utf-8") as f:
+            json.dump({"time": time.time()}, f)
+
+    def entries(self):
+        """[(último uso, tamanho em bytes, caminho)] das entradas existentes."""
+        if not os.path.isdir(self.root):
+            return []
+        entries = []
+        for entry in os.scandir(self.root):
+            if not entry.is_dir():
+                continue
+            marker = os.path.join(entry.path, "last_used.json")
+            last_used = os.path.getmtime(marker) if os.path.exists(marker) else 0.0
+            entries.append((last_used, _entry_size(entry.path), entry.path))
+        return entries
+
+    def evict(self):
+        """Descarta as entradas menos usadas até o cache caber no limite."""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            with self._lock:
+                if path in self._open:
+                    continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+result_cache = ResultCache()
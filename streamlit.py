@@ -2,9 +2,15 @@
 import cv2
 import os
 from PIL import Image
-import numpy as np
-from ultralytics import YOLO
-import time
+
+from streamlit_webrtc import webrtc_streamer
+import av
+
+from backends import model_choices, parse_label
+from detection_store import DetectionStore, list_stores
+from inference_worker import get_worker
+from model_registry import registry
+from renderer import Renderer
 
 # Configuração da página
 st.set_page_config(page_title="Água Viva", page_icon="🌊", layout="wide")
@@ -26,15 +32,18 @@
 weights_dir = 'weights'
 model_files = [f for f in os.listdir(weights_dir) if f.endswith('.pt')]
 if model_files:
-    selected_model = st.sidebar.selectbox("Selecione o modelo", model_files)
-
-    # Carregar o modelo selecionado
-    @st.cache_resource
-    def load_model(model_path):
-        return YOLO(model_path)
-
-    model_path = os.path.join(weights_dir, selected_model)
-    model = load_model(model_path)
+    selected_model = st.sidebar.selectbox("Selecione o modelo", model_choices(model_files, weights_dir))
+
+    # Carregar o modelo selecionado (registro compartilhado, aquecido uma única vez)
+    # Variantes ONNX/OpenVINO são exportadas na primeira seleção e reaproveitadas do cache
+    weights_file, backend = parse_label(selected_model)
+    model_path = os.path.join(weights_dir, weights_file)
+    with st.spinner(f"Carregando {selected_model}..."):
+        try:
+            model = registry.get(model_path, backend)
+        except Exception as e:
+            st.error(f"Erro ao carregar {selected_model}: {e}")
+            st.stop()
 
     # Filtragem de classes
     all_classes = list(model.names.values())
@@ -44,20 +53,77 @@ def load_model(model_path):
     st.sidebar.subheader("Ajustes Adicionais")
     confidence_threshold = st.sidebar.slider("Limite de Confiança", 0.0, 1.0, 0.25)
     display_fps = st.sidebar.checkbox("Exibir FPS", value=True)
+    display_stages = st.sidebar.checkbox("Exibir latência por estágio", value=False)
+    adaptive = st.sidebar.checkbox("Qualidade adaptativa", value=False,
+                                   help="Escolhe pesos e resolução automaticamente para atingir o FPS alvo.")
+    target_fps = st.sidebar.number_input("FPS alvo", 1, 60, 15) if adaptive else None
+    motion_gate = st.sidebar.checkbox("Pular frames sem mudança", value=False)
+    gate_threshold = None
+    if motion_gate:
+        gate_threshold = st.sidebar.slider("Limiar de mudança da cena", 0.0, 0.2, 0.02, step=0.005)
+    tracking = st.sidebar.checkbox("Rastrear objetos", value=False,
+                                   help="Roda o detector só a cada N frames e conta cada item uma única vez.")
+    keyframe_interval = st.sidebar.slider("Detector a cada N frames", 1, 30, 5) if tracking else None
 
     # Seleção da fonte de vídeo
-    video_source = st.sidebar.radio("Fonte de vídeo", ('Vídeo de exemplo', 'Webcam', 'Outro vídeo'))
+    video_source = st.sidebar.radio("Fonte de vídeo", ('Vídeo de exemplo', 'Webcam', 'Outro vídeo', 'Stream (RTSP/HTTP)'))
+
+    # Índices das classes escolhidas, aplicados pelo renderizador como máscara
+    keep_classes = {c for c, name in model.names.items() if name in selected_classes} if selected_classes else None
+
+    # Espaço para exibir o vídeo
+    FRAME_WINDOW = st.empty()
+
+    # Detecções gravadas pelas execuções anteriores: gráficos sem decodificar o vídeo de novo
+    stores = list_stores()
+    if stores:
+        with st.expander("📈 Histórico de detecções"):
+            store = DetectionStore(st.selectbox("Gravação", stores, format_func=os.path.basename))
+            interval = st.select_slider("Intervalo", options=[10, 30, 60, 300], value=60,
+                                        format_func=lambda s: f"{s}s")
+            starts, values = store.counts_per_interval(interval)
+            st.line_chart({"segundos": starts, "objetos por frame": values}, x="segundos", y="objetos por frame")
+            threshold = st.number_input("Frames com mais de N objetos", 0, 100, 5)
+            above = store.frames_above(threshold)
+            st.caption(f"{len(store)} frames gravados ({store.duration:.0f}s), {len(above)} com mais de {threshold} objetos")
+            if len(above):
+                st.dataframe({"frame": above["frame"], "tempo (s)": above["timestamp"], "objetos": above["count"]})
+
+    if video_source == 'Webcam':
+        # A webcam vem do navegador via WebRTC; o callback roda fora do script,
+        # então a inferência não recomeça a cada interação com a página.
+        webcam_renderer = Renderer()
+
+        def video_frame_callback(frame):
+            image = frame.to_ndarray(format="bgr24")
+            results = model.predict(image, conf=confidence_threshold, verbose=False)
+            annotated_frame = webcam_renderer.render_result(image, results[0], keep_classes=keep_classes, in_place=True)
+            return av.VideoFrame.from_ndarray(annotated_frame, format="bgr24")
+
+        webrtc_streamer(
+            key="webcam",
+            video_frame_callback=video_frame_callback,
+            media_stream_constraints={"video": True, "audio": False},
+            async_processing=True,
+        )
+        st.stop()
 
     if video_source == 'Vídeo de exemplo':
         video_file = 'videos/exemplo.mp4'
-    elif video_source == 'Webcam':
-        video_file = 0  # Webcam
+    elif video_source == 'Stream (RTSP/HTTP)':
+        # Lido pela FrameSource do worker, que reconecta sozinha se o stream cair
+        video_file = st.sidebar.text_input("URL do stream", placeholder="rtsp://camera/stream")
+        if not video_file:
+            st.warning("Informe a URL do stream.")
+            st.stop()
     else:
         uploaded_file = st.sidebar.file_uploader("Carregar um vídeo", type=['mp4', 'avi', 'mov'])
         if uploaded_file is not None:
             video_file = os.path.join('videos', uploaded_file.name)
-            with open(video_file, 'wb') as f:
-                f.write(uploaded_file.read())
+            # Gravar só uma vez: o script é reexecutado a cada interação
+            if not os.path.exists(video_file) or os.path.getsize(video_file) != uploaded_file.size:
+                with open(video_file, 'wb') as f:
+                    f.write(uploaded_file.getbuffer())
         else:
             st.warning("Por favor, carregue um arquivo de vídeo.")
             st.stop()
@@ -66,9 +132,6 @@ def load_model(model_path):
     start_inference = st.sidebar.button("Iniciar Inferência", key="start")
     stop_inference = st.sidebar.button("Parar Inferência", key="stop")
 
-    # Espaço para exibir o vídeo
-    FRAME_WINDOW = st.empty()
-
     # Variável para controlar a inferência
     if 'inference_started' not in st.session_state:
         st.session_state['inference_started'] = False
@@ -80,57 +143,66 @@ def load_model(model_path):
         st.session_state['inference_started'] = False
 
     if st.session_state['inference_started']:
-        cap = cv2.VideoCapture(video_file)
-        prev_time = time.time()
-        while st.session_state['inference_started']:
-            ret, frame = cap.read()
-            if not ret:
-                st.session_state['inference_started'] = False
-                cap.release()
-                break
-
-            # Inferência
-            results = model.predict(frame, conf=confidence_threshold, verbose=False)
-
-            # Filtrar classes
-            detections = results[0]
-            if len(detections) > 0 and selected_classes:
-                classes = detections.boxes.cls.cpu().numpy().astype(int)
-                class_names = [model.names[c] for c in classes]
-                mask = np.isin(class_names, selected_classes)
-                detections.boxes = detections.boxes[mask]
-
-            # Anotar o frame
-            annotated_frame = detections.plot()
+        # A inferência roda num worker compartilhado entre sessões; a página só
+        # consulta periodicamente o último frame anotado.
+        try:
+            worker = get_worker(video_file, model_path, backend, confidence_threshold, gate_threshold, target_fps,
+                                keyframe_interval)
+        except ValueError as e:
+            st.error(str(e))
+            st.stop()
+        stats_window = st.empty()
+        stages_window = st.empty()
+        session_renderer = Renderer()
+
+        @st.fragment(run_every=1 / 30)
+        def show_latest_frame():
+            frame, stats = worker.latest()
+            if worker.error:
+                st.error(worker.error)
+                return
+            if frame is None:
+                FRAME_WINDOW.info("Carregando o modelo e iniciando o vídeo...")
+                return
+
+            with worker.metrics.time("exibição"):
+                if len(selected_classes) == len(all_classes):
+                    annotated_frame = frame.annotated
+                else:
+                    # Filtro específico desta sessão: anotar de novo só as classes escolhidas
+                    annotated_frame = cv2.cvtColor(
+                        session_renderer.render_result(frame.image, frame.results[0], keep_classes=keep_classes),
+                        cv2.COLOR_BGR2RGB)
+                FRAME_WINDOW.image(annotated_frame)
+
+            if 'load_error' in stats:
+                st.warning(f"{stats['load_error']} (o controle adaptativo seguiu sem esses pesos)")
 
             # Exibir FPS se selecionado
             if display_fps:
-                curr_time = time.time()
-                fps = 1 / (curr_time - prev_time + 1e-6)
-                prev_time = curr_time
-                cv2.putText(annotated_frame, f"FPS: {int(fps)}", (10, 30),
-                            cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2)
-
-            # Converter para RGB e exibir
-            frame_rgb = cv2.cvtColor(annotated_frame, cv2.COLOR_BGR2RGB)
-            FRAME_WINDOW.image(frame_rgb)
-
-            # Permitir que o Streamlit atualize a interface
-            # e responda a interações do usuário
-            if not st.session_state['inference_started']:
-                cap.release()
-                break
-
-        cap.release()
+                caption = f"FPS: {stats['fps']:.1f} | Objetos: {stats['count']} | Frames: {stats['frames']}"
+                if 'operating_point' in stats:
+                    caption += f" | Ponto de operação: {stats['operating_point']}"
+                if 'skipped_fraction' in stats:
+                    caption += f" | Frames pulados: {stats['skipped_fraction']:.0%}"
+                if 'cache_hit_rate' in stats:
+                    caption += f" | Do cache: {stats['cache_hit_rate']:.0%}"
+                if 'unique' in stats:
+                    caption += (f" | Itens únicos: {stats['unique']}"
+                                f" | Quadros-chave: {stats['keyframe_fraction']:.0%}")
+                stats_window.caption(caption)
+            if display_stages:
+                stages_window.code("\n".join(worker.metrics.lines()), language=None)
+
+        show_latest_frame()
 
     else:
         # Exibir o vídeo inicial
-        if video_source in ['Vídeo de exemplo', 'Outro vídeo']:
-            if os.path.exists(video_file):
-                st.video(video_file, start_time=0, format='video/mp4')
-            else:
-                st.warning(f"Vídeo não encontrado no caminho: {video_file}")
-        elif video_source == 'Webcam':
-            st.warning("Clique em 'Iniciar Inferência' para usar a Webcam.")
+        if video_source == 'Stream (RTSP/HTTP)':
+            st.info("Clique em Iniciar Inferência para abrir o stream.")
+        elif os.path.exists(video_file):
+            st.video(video_file, start_time=0, format='video/mp4')
+        else:
+            st.warning(f"Vídeo não encontrado no caminho: {video_file}")
 else:
     st.error(f"Nenhum modelo encontrado na pasta {weights_dir}. Por favor, coloque seus modelos lá.")
@@ -0,0 +1,66 @@
+"""Inferência fatiada (tiled) para imagens de alta resolução.
+
+Redimensionar uma foto grande para o `imgsz` do modelo faz os detritos
+pequenos sumirem. Aqui a imagem é cortada em blocos sobrepostos do tamanho
+nativo do modelo, todos os blocos vão ao modelo numa única chamada em lote,
+as caixas voltam para as coordenadas da imagem e as duplicatas nas emendas
+são fundidas com NMS.
+"""
+import numpy as np
+
+TILE_SIZE = 512  # imgsz usado no treino (antigo/runs/train/*/args.yaml)
+TILE_OVERLAP = 0.2
+
+
+def tile_starts(length, tile, overlap):
+    """Posições iniciais dos blocos ao longo de um eixo, cobrindo até a borda."""
+    if length <= tile:
+        return [0]
+    step = max(1, int(tile * (1 - overlap)))
+    starts = list(range(0, length - tile + 1, step))
+    if starts[-1] + tile < length:
+        starts.append(length - tile)
+    return starts
+
+
+def tile_grid(height, width, tile=TILE_SIZE, overlap=TILE_OVERLAP):
+    """Cantos superiores esquerdos (x, y) de todos os blocos da imagem."""
+    return [(x, y) for y in tile_starts(height, tile, overlap) for x in tile_starts(width, tile, overlap)]
+
+
+def sliced_predict(model, image, tile=TILE_SIZE, overlap=TILE_OVERLAP, conf=0.25, iou=0.5,
+                   include_full=True, batch_size=None):
+    """Detecta objetos bloco a bloco e retorna (caixas xyxy, confianças, classes) em NumPy.
+
+    Com `include_full`, a imagem inteira também passa pelo modelo para que
+    objetos maiores que um bloco continuem sendo detectados. Por padrão todos
+    os blocos vão numa única chamada; `batch_size` limita o lote se faltar memória.
+    """
+    height, width = image.shape[:2]
+    origins = tile_grid(height, width, tile, overlap)
+    crops = [image[y:y + tile, x:x + tile] for x, y in origins]
+    if include_full and len(origins) > 1:
+        crops.append(image)
+        origins.append((0, 0))
+
+    detections = []
+    step = batch_size or len(crops)
+    for i in range(0, len(crops), step):
+        results = model.predict(crops[i:i + step], imgsz=tile, conf=conf, verbose=False)
+        for (x, y), result in zip(origins[i:i + step], results):
+            data = result.boxes.data.cpu().numpy()
+            if len(data):
+                data[:, [0, 2]] += x
+                data[:, [1, 3]] += y
+                detections.append(data)
+
+    if not detections:
+        return np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, int)
+
+    import torch  # Só aqui: importar o módulo não deve carregar o torch
+    from torchvision.ops import batched_nms
+
+    data = np.concatenate(detections)
+    boxes, scores, classes = data[:, :4], data[:, -2], data[:, -1]
+    keep = batched_nms(torch.from_numpy(boxes), torch.from_numpy(scores), torch.from_numpy(classes), iou).numpy()
+    return boxes[keep], scores[keep], classes[keep].astype(int)
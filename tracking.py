@@ -0,0 +1,168 @@
+"""Rastreamento com detecção só em quadros-chave e contagem de itens únicos.
+
+O detector roda a cada `interval` frames (ou antes, quando a confiança de
+alguma trilha cai abaixo de `min_confidence`). Entre os quadros-chave as
+caixas seguem um modelo de velocidade constante, e a confiança de cada
+trilha decai a cada frame propagado: quanto mais tempo sem o detector,
+menos se confia na posição estimada. No quadro-chave as detecções são
+associadas às trilhas por atribuição linear (`lap.lapjv`, do `lapx`) sobre
+o custo 1 - IoU, e cada trilha confirmada em `min_hits` quadros-chave conta
+uma única vez no total de itens únicos, não importa por quantos frames fique
+na tela.
+"""
+import numpy as np
+
+KEYFRAME_INTERVAL = 5  # Frames entre execuções do detector
+MIN_TRACK_CONFIDENCE = 0.2  # Abaixo disso alguma trilha pede um quadro-chave antecipado
+CONFIDENCE_DECAY = 0.95  # Fator aplicado à confiança a cada frame propagado
+IOU_MATCH = 0.3  # IoU mínima para associar uma detecção a uma trilha
+MAX_MISSES = 2  # Quadros-chave sem associação antes de descartar a trilha
+MIN_HITS = 2  # Quadros-chave com associação para a trilha contar como item único
+
+
+def iou_matrix(a, b):
+    """IoU entre todos os pares de caixas xyxy de `a` (N, 4) e `b` (M, 4)."""
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(br - tl, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+class Track:
+    """Uma trilha: caixa atual, velocidade por frame e contadores de associação."""
+
+    __slots__ = ("id", "box", "anchor", "since_anchor", "velocity", "confidence", "cls", "hits", "misses", "counted")
+
+    def __init__(self, track_id, box, confidence, cls):
+        self.id = track_id
+        self.box = np.asarray(box, dtype=np.float32)
+        self.anchor = self.box.copy()  # Caixa no último quadro-chave com associação
+        self.since_anchor = 0  # Frames desde então
+        self.velocity = np.zeros(4, dtype=np.float32)  # Deslocamento de cada coordenada por frame
+        self.confidence = float(confidence)
+        self.cls = int(cls)
+        self.hits = 1
+        self.misses = 0
+        self.counted = False
+
+    def predict(self):
+        self.box = self.box + self.velocity
+        self.confidence *= CONFIDENCE_DECAY
+        self.since_anchor += 1
+
+
+class KeyframeTracker:
+    """Decide os quadros-chave, propaga as caixas entre eles e conta os itens únicos.
+
+    Não é thread-safe: use um por laço de inferência.
+    """
+
+    def __init__(self, interval=KEYFRAME_INTERVAL, min_confidence=MIN_TRACK_CONFIDENCE, iou_threshold=IOU_MATCH,
+                 max_misses=MAX_MISSES, min_hits=MIN_HITS):
+        self.interval = interval
+        self.min_confidence = min_confidence
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.min_hits = min_hits
+        self.tracks = []
+        self.unique_count = 0
+        self.frames = 0
+        self.keyframes = 0
+        self._next_id = 1
+        self._since_keyframe = None  # Frames desde o último quadro-chave (None antes do primeiro)
+
+    def needs_keyframe(self):
+        """True se o frame atual deve passar pelo detector."""
+        if self._since_keyframe is None or self._since_keyframe + 1 >= self.interval:
+            return True
+        return any(track.confidence < self.min_confidence for track in self.tracks if not track.misses)
+
+    def update(self, detections, shape):
+        """Quadro-chave: associa as detecções (N, 6: xyxy, confiança, classe) às trilhas."""
+        for track in self.tracks:
+            track.predict()
+        detections = np.asarray(detections, dtype=np.float32).reshape(-1, 6)
+
+        matched_tracks, matched_detections = set(), set()
+        if self.tracks and len(detections):
+            import lap
+
+            boxes = np.stack([track.box for track in self.tracks])
+            cost = 1 - iou_matrix(boxes, detections[:, :4])
+            classes = np.array([track.cls for track in self.tracks])
+            cost[classes[:, None] != detections[:, 5].astype(int)[None, :]] = 1.0
+            _, assigned, _ = lap.lapjv(cost, extend_cost=True, cost_limit=1 - self.iou_threshold)
+            for i, j in enumerate(assigned):
+                if j < 0:
+                    continue
+                self._associate(self.tracks[i], detections[j])
+                matched_tracks.add(i)
+                matched_detections.add(j)
+
+        for i, track in enumerate(self.tracks):
+            if i not in matched_tracks:
+                track.misses += 1
+        self.tracks = [track for track in self.tracks if track.misses <= self.max_misses]
+
+        for j, detection in enumerate(detections):
+            if j not in matched_detections:
+                track = Track(self._next_id, detection[:4], detection[4], detection[5])
+                self._next_id += 1
+                self._confirm(track)
+                self.tracks.append(track)
+
+        self._since_keyframe = 0
+        self.frames += 1
+        self.keyframes += 1
+        self._prune(shape)
+
+    def _associate(self, track, detection):
+        box = detection[:4]
+        # Velocidade suavizada a partir do deslocamento desde o último quadro-chave associado
+        track.velocity = 0.5 * track.velocity + 0.5 * (box - track.anchor) / max(track.since_anchor, 1)
+        track.box = box.copy()
+        track.anchor = box.copy()
+        track.since_anchor = 0
+        track.confidence = float(detection[4])
+        track.hits += 1
+        track.misses = 0
+        self._confirm(track)
+
+    def _confirm(self, track):
+        if not track.counted and track.hits >= self.min_hits:
+            track.counted = True
+            self.unique_count += 1
+
+    def propagate(self, shape):
+        """Frame sem detector: avança as caixas pelo modelo de movimento."""
+        for track in self.tracks:
+            track.predict()
+        self._since_keyframe = (self._since_keyframe or 0) + 1
+        self.frames += 1
+        self._prune(shape)
+
+    def _prune(self, shape):
+        # Trilhas que saíram do quadro não voltam a ser associadas
+        height, width = shape[:2]
+        self.tracks = [track for track in self.tracks
+                       if track.box[2] > 0 and track.box[3] > 0 and track.box[0] < width and track.box[1] < height]
+
+    def data(self):
+        """Trilhas visíveis (sem falha no último quadro-chave) como (N, 7): xyxy, id, confiança, classe."""
+        rows = [(*track.box, track.id, track.confidence, track.cls) for track in self.tracks if not track.misses]
+        return np.array(rows, dtype=np.float32).reshape(-1, 7)
+
+    def result(self, image, names):
+        """`Results` do Ultralytics com as trilhas atuais (`boxes.id` preenchido)."""
+        from ultralytics.engine.results import Results
+
+        return Results(orig_img=image, path="", names=names, boxes=self.data())
+
+    def summary(self):
+        return {
+            "tracks": sum(not track.misses for track in self.tracks),
+            "unique": self.unique_count,
+            "keyframe_fraction": self.keyframes / self.frames if self.frames else 0.0,
+        }